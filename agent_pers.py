@@ -8,7 +8,9 @@ from __future__ import annotations
   python agent_pers.py <путь_к_json_файлу>
   python agent_pers.py < snapshot.json
   echo '{"schema_version": "1.0", ...}' | python agent_pers.py
+  python agent_pers.py --ndjson [--concurrency N] [<путь_к_ndjson_файлу>] < snapshots.ndjson
 """
+import argparse
 import json
 import sys
 from agents import analyze, analyze_async, analyze_from_file
@@ -16,10 +18,27 @@ from agents import analyze, analyze_async, analyze_from_file
 
 def main():
     """Обрабатывает данные из файла или stdin"""
+    ap = argparse.ArgumentParser(add_help=True)
+    ap.add_argument("path", nargs="?", help="путь к JSON (или NDJSON с --ndjson) файлу")
+    ap.add_argument("--ndjson", action="store_true",
+                    help="потоковый режим: один снапшот на строку, один Output на строку по мере готовности")
+    ap.add_argument("--concurrency", type=int, default=None, help="сколько снапшотов анализировать одновременно")
+    args = ap.parse_args()
+
+    # Вариант 0: потоковый NDJSON из файла или stdin
+    if args.ndjson:
+        from agents.streaming import analyze_ndjson
+        if args.path:
+            with open(args.path, "r", encoding="utf-8") as fin:
+                analyze_ndjson(fin, sys.stdout, concurrency=args.concurrency)
+        else:
+            analyze_ndjson(sys.stdin, sys.stdout, concurrency=args.concurrency)
+        return
+
     # Вариант 1: Файл передан как аргумент
-    if len(sys.argv) >= 2:
-        file_path = sys.argv[1]
-        res = analyze_from_file(file_path)
+    if args.path:
+        file_path = args.path
+        res = analyze_from_file(file_path, concurrency=args.concurrency)
         print(json.dumps(res, ensure_ascii=False, indent=2))
         return
     
@@ -30,11 +49,11 @@ def main():
             if isinstance(data, list):
                 # Массив снапшотов
                 from agents import analyze_batch
-                res = analyze_batch(data)
+                res = analyze_batch(data, concurrency=args.concurrency)
             elif isinstance(data, dict) and "snapshots" in data:
                 # Объект с ключом snapshots
                 from agents import analyze_batch
-                res = analyze_batch(data["snapshots"])
+                res = analyze_batch(data["snapshots"], concurrency=args.concurrency)
             else:
                 # Один снапшот
                 res = analyze(data)
@@ -52,6 +71,7 @@ def main():
     print("  python agent_pers.py <путь_к_json_файлу>", file=sys.stderr)
     print("  python agent_pers.py < snapshot.json", file=sys.stderr)
     print("  echo '{\"schema_version\": \"1.0\", ...}' | python agent_pers.py", file=sys.stderr)
+    print("  python agent_pers.py --ndjson < snapshots.ndjson", file=sys.stderr)
     sys.exit(1)
 
 
@@ -16,6 +16,7 @@ from .models import (
     WellbeingAdvice,
     EfficiencyRecommendations,
     RAGAdvice,
+    TrendResult,
     Output,
 )
 from .features import compute_features
@@ -25,6 +26,6 @@ from .planner import propose_plan, to_ics
 from .analytics import meeting_hygiene, comm_triage, wellbeing, efficiency_analysis
 from .hf_client import HFClient
 from .coach import LLMClient
-from .orchestrator import analyze_async, analyze, analyze_batch, analyze_from_file, analyze_text, analyze_text_async
+from .orchestrator import analyze_async, analyze, analyze_batch, analyze_batch_async, analyze_from_file, analyze_text, analyze_text_async
 
 
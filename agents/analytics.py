@@ -1,15 +1,23 @@
 from __future__ import annotations
-from typing import List, Dict, Any
-from .models import Snapshot, Features, MeetingHygiene, CommTriageAdvice, WellbeingAdvice, EfficiencyRecommendations, FatigueLoadAssessment
-from .utils import to_dt, minutes
+from typing import List, Dict, Any, Tuple
+import json
+from .models import Snapshot, Features, RiskResult, MeetingHygiene, CommTriageAdvice, WellbeingAdvice, EfficiencyRecommendations, FatigueLoadAssessment, RAGAdvice
+from .timeline import day_timeline, MEETING
 import numpy as np
 
 
+EFFICIENCY_UNAVAILABLE = (
+    "Рекомендации недоступны (модель не ответила). "
+    "Проверьте настройки API или попробуйте позже."
+)
+
+
 def meeting_hygiene(s: Snapshot, f: Features) -> MeetingHygiene:
     issues, sugg = [], []
     if f.meet_ratio >= 0.5: issues.append("Высокая доля встреч")
     if f.back_to_back_count >= 2: issues.append("Back-to-back без буферов")
-    long_meet = any(minutes(to_dt(x.end)-to_dt(x.start)) > 60 for x in s.schedule if x.type=="meeting")
+    tl = day_timeline(s)
+    long_meet = bool(((tl.end - tl.start)[tl.kind == MEETING] // 60 > 60).any())
     if long_meet: issues.append("Встречи >60 мин")
     if f.meet_ratio >= 0.5: sugg.append("Свести статусы; часть — в async апдейты")
     if f.back_to_back_count >= 2: sugg.append("Добавить 5–10 мин буфера между слотами")
@@ -22,9 +30,12 @@ class HFClientProtocol:
     async def summarize(self, text: str, max_new_tokens: int = 120) -> str: ...
     async def generate_efficiency_recommendations(self, day_summary: str, features_summary: str, max_tokens: int = 300) -> str: ...
     async def assess_fatigue_load(self, day_summary: str, features_summary: str, max_tokens: int = 220) -> str: ...
+    async def fused_analysis(self, day_summary: str, features_summary: str, risk_summary: str,
+                             inbox_text: str, rag_context: str, max_tokens: int = 900) -> str: ...
 
 
-async def comm_triage(s: Snapshot, f: Features, hf: HFClientProtocol) -> CommTriageAdvice:
+def comm_triage_rules(s: Snapshot, f: Features) -> CommTriageAdvice:
+    """Правиловая часть триажа коммуникаций (без саммари входящих)."""
     actions = []
     if s.comms:
         if s.comms.chat_msgs_count >= 120: actions.append("Читать чаты пакетно 2–3 раза/день по 15–20 мин")
@@ -34,14 +45,16 @@ async def comm_triage(s: Snapshot, f: Features, hf: HFClientProtocol) -> CommTri
         summary_counts = f"Чаты:{s.comms.chat_msgs_count}, email threads:{s.comms.email_threads}, звонки:{s.comms.calls_minutes} мин"
     else:
         summary_counts = "Нет данных по коммуникациям"
+    return CommTriageAdvice(summary=summary_counts, actions=actions)
 
+
+async def comm_triage(s: Snapshot, f: Features, hf: HFClientProtocol) -> CommTriageAdvice:
+    advice = comm_triage_rules(s, f)
     inbox_text = "\n".join(s.inbox_samples or [])[:4000]
-    inbox_summary, inbox_priority = None, None
     if inbox_text:
-        inbox_summary = await hf.summarize(inbox_text)
-        inbox_priority = None  # классификация отключена; можно реализовать правила/фильтры вручную
-
-    return CommTriageAdvice(summary=summary_counts, actions=actions, inbox_summary=inbox_summary, inbox_priority=inbox_priority)
+        advice.inbox_summary = await hf.summarize(inbox_text)
+        advice.inbox_priority = None  # классификация отключена; можно реализовать правила/фильтры вручную
+    return advice
 
 
 def wellbeing(s: Snapshot, f: Features, risk) -> WellbeingAdvice:
@@ -53,11 +66,8 @@ def wellbeing(s: Snapshot, f: Features, risk) -> WellbeingAdvice:
     return WellbeingAdvice(actions=acts)
 
 
-async def efficiency_analysis(s: Snapshot, f: Features, hf: HFClientProtocol) -> EfficiencyRecommendations:
-    """
-    Анализирует эффективность дня и генерирует рекомендации через модель.
-    Сначала создает саммари дня, затем отправляет его в модель для генерации рекомендаций.
-    """
+def efficiency_summaries(s: Snapshot, f: Features) -> Tuple[str, str]:
+    """Саммари дня и метрик производительности для промптов модели."""
     # Формируем саммари дня
     day_parts = []
     
@@ -131,14 +141,19 @@ async def efficiency_analysis(s: Snapshot, f: Features, hf: HFClientProtocol) ->
         features_parts.append(f"Время отвлечений: {f.distractions_minutes}мин")
     
     features_summary = ". ".join(features_parts)
+    return day_summary, features_summary
+
 
+async def efficiency_analysis(s: Snapshot, f: Features, hf: HFClientProtocol) -> EfficiencyRecommendations:
+    """
+    Анализирует эффективность дня и генерирует рекомендации через модель.
+    Сначала создает саммари дня, затем отправляет его в модель для генерации рекомендаций.
+    """
+    day_summary, features_summary = efficiency_summaries(s, f)
     recommendations = await hf.generate_efficiency_recommendations(day_summary, features_summary)
     
     if not recommendations:
-        recommendations = (
-            "Рекомендации недоступны (модель не ответила). "
-            "Проверьте настройки API или попробуйте позже."
-        )
+        recommendations = EFFICIENCY_UNAVAILABLE
     
     return EfficiencyRecommendations(
         recommendations=recommendations,
@@ -146,6 +161,10 @@ async def efficiency_analysis(s: Snapshot, f: Features, hf: HFClientProtocol) ->
     )
 
 
+def efficiency_fallback() -> EfficiencyRecommendations:
+    return EfficiencyRecommendations(recommendations=EFFICIENCY_UNAVAILABLE)
+
+
 async def assess_fatigue_load_llm(s: Snapshot, f: Features, hf: HFClientProtocol) -> FatigueLoadAssessment:
     day_parts: List[str] = []
     if s.schedule:
@@ -183,34 +202,95 @@ async def assess_fatigue_load_llm(s: Snapshot, f: Features, hf: HFClientProtocol
 
     raw = await hf.assess_fatigue_load(day_summary, features_summary)
     if not raw:
-        return FatigueLoadAssessment(
-            fatigue_score=0.0,
-            load_score=0.0,
-            level="low",
-            explanation="Модель не ответила, оценка усталости недоступна."
-        )
+        return fatigue_fallback()
 
-    import json
     try:
-        data = json.loads(raw)
-        fatigue = float(data.get("fatigue_score", 0.0))
-        load = float(data.get("load_score", 0.0))
-        level = data.get("level", "low")
-        if level not in ("low", "medium", "high"):
-            level = "low"
-        explanation = str(data.get("explanation", "")).strip() or "Оценка от модели без подробного объяснения."
-        return FatigueLoadAssessment(
-            fatigue_score=fatigue,
-            load_score=load,
-            level=level,
-            explanation=explanation
-        )
+        return fatigue_from_dict(json.loads(raw))
     except Exception:
-        return FatigueLoadAssessment(
-            fatigue_score=0.0,
-            load_score=0.0,
-            level="low",
-            explanation="Не удалось разобрать ответ модели, оценка усталости недоступна."
-        )
+        return fatigue_fallback("Не удалось разобрать ответ модели, оценка усталости недоступна.")
+
+
+def fatigue_from_dict(data: Dict[str, Any]) -> FatigueLoadAssessment:
+    """Оценка усталости из JSON-ответа модели; ValueError/TypeError/AttributeError при неверном формате."""
+    fatigue = float(data.get("fatigue_score", 0.0))
+    load = float(data.get("load_score", 0.0))
+    level = data.get("level", "low")
+    if level not in ("low", "medium", "high"):
+        level = "low"
+    explanation = str(data.get("explanation", "")).strip() or "Оценка от модели без подробного объяснения."
+    return FatigueLoadAssessment(
+        fatigue_score=fatigue,
+        load_score=load,
+        level=level,
+        explanation=explanation
+    )
+
+
+def fatigue_fallback(explanation: str = "Модель не ответила, оценка усталости недоступна.") -> FatigueLoadAssessment:
+    return FatigueLoadAssessment(
+        fatigue_score=0.0,
+        load_score=0.0,
+        level="low",
+        explanation=explanation
+    )
 
 
+def _json_object(raw: str) -> Dict[str, Any]:
+    """JSON-объект из ответа модели (модели часто оборачивают его в ```json ... ```)."""
+    start, end = raw.find("{"), raw.rfind("}")
+    if start < 0 or end <= start:
+        raise ValueError("в ответе нет JSON-объекта")
+    data = json.loads(raw[start:end + 1])
+    if not isinstance(data, dict):
+        raise ValueError("ожидался JSON-объект")
+    return data
+
+
+async def fused_llm_analysis(s: Snapshot, f: Features, risk: RiskResult, hf: HFClientProtocol,
+                             rag_base: RAGAdvice) -> Dict[str, Any]:
+    """
+    Объединённый режим: один запрос к модели вместо отдельных стадий саммари входящих,
+    эффективности, усталости, коучинга и RAG. Возвращает результаты только тех стадий,
+    которые удалось разобрать из ответа; остальные оркестратор досчитывает по отдельности.
+    """
+    day_summary, features_summary = efficiency_summaries(s, f)
+    factors = ", ".join(f"{k}={v:.2f}" for k, v in sorted(risk.factors.items(), key=lambda kv: -kv[1]) if v > 0)
+    risk_summary = f"Оценка {risk.risk_score}/100. Факторы: {factors or 'нет'}. {' '.join(risk.notes)}".strip()
+    inbox_text = "\n".join(s.inbox_samples or [])[:4000]
+    rag_context = "\n\n".join(rag_base.suggestions)
+
+    raw = await hf.fused_analysis(day_summary, features_summary, risk_summary, inbox_text, rag_context)
+    if not raw:
+        return {}
+    try:
+        data = _json_object(raw)
+    except ValueError as e:
+        print(f"Fused LLM response not parsed: {e}")
+        return {}
+
+    out: Dict[str, Any] = {}
+    summary = data.get("inbox_summary")
+    if not inbox_text or (isinstance(summary, str) and summary.strip()):
+        triage = comm_triage_rules(s, f)
+        if inbox_text:
+            triage.inbox_summary = summary.strip()
+        out["comm_triage"] = triage
+    recs = data.get("efficiency_recommendations")
+    if isinstance(recs, list):
+        recs = "\n".join(str(r) for r in recs)
+    if isinstance(recs, str) and recs.strip():
+        out["efficiency"] = EfficiencyRecommendations(recommendations=recs.strip(), day_summary=day_summary)
+    if isinstance(data.get("fatigue_load"), dict):
+        try:
+            out["fatigue_load"] = fatigue_from_dict(data["fatigue_load"])
+        except (ValueError, TypeError):
+            pass
+    coach = data.get("coach_message")
+    if isinstance(coach, str) and coach.strip():
+        out["coach"] = coach.strip()
+    sugg = data.get("rag_suggestions")
+    if isinstance(sugg, list):
+        lines = [str(x).strip("-• ").strip() for x in sugg if str(x).strip()]
+        if lines:
+            out["rag_advice"] = RAGAdvice(suggestions=lines, sources=rag_base.sources)
+    return out
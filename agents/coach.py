@@ -1,7 +1,20 @@
 from __future__ import annotations
+from typing import Callable, Optional
 import os
 import httpx
 from .models import RiskResult, Features
+from .hf_client import base_url_from_env, post_chat, post_chat_stream
+from .http_pool import get_http_client
+
+
+def rule_based_coach(risk: RiskResult, f: Features, label: str = "План (fallback)") -> str:
+    parts = []
+    if risk.risk_score >= 70: parts.append("дыхание 4-7-8 (5 мин) + 20 мин DND")
+    if (f.steps or 0) < 3000: parts.append("прогулка 10–15 мин")
+    if f.longest_stretch_no_break_min >= 120: parts.append("перерыв 5–10 мин каждые 55–70 мин")
+    if f.meet_ratio > 0.5: parts.append("сгруппируй встречи; поставь фокус-блок 60–90 мин")
+    if not parts: parts = ["перерывы по расписанию, вода, 15-мин winddown"]
+    return f"{label}: " + "; ".join(parts) + "."
 
 
 class LLMClient:
@@ -10,14 +23,20 @@ class LLMClient:
     Переменные окружения:
       OPENROUTER_API_KEY      — обязательна для вызовов (по умолчанию используется встроенный ключ)
       OPENROUTER_MODEL        — по умолчанию 'google/gemma-2-27b-it'
+      OPENROUTER_BASE_URL     — по умолчанию 'https://openrouter.ai/api/v1'
     """
-    def __init__(self):
-        
+    def __init__(self, http: Optional[httpx.AsyncClient] = None):
+        self._http = http
         self.token = os.getenv("OPENROUTER_API_KEY", "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")
         self.model = os.getenv("OPENROUTER_MODEL", "google/gemma-2-27b-it")
-        self.base_url = "https://openrouter.ai/api/v1"
+        self.base_url = base_url_from_env()
 
-    async def coach(self, risk: RiskResult, f: Features) -> str:
+    @property
+    def http(self) -> httpx.AsyncClient:
+        return self._http or get_http_client()
+
+    async def coach(self, risk: RiskResult, f: Features, on_delta: Optional[Callable[[str], None]] = None) -> str:
+        """Бриф коуча; с on_delta ответ модели запрашивается потоком и передаётся по фрагментам."""
         prompt = (
             "Сформируй краткий бриф (до 80 слов) по снижению риска выгорания. "
             "Дай 3–5 конкретных шагов с причинами. "
@@ -28,19 +47,7 @@ class LLMClient:
         
         
         if not self.token:
-            parts = []
-            if risk.risk_score >= 70: parts.append("дыхание 4-7-8 (5 мин) + 20 мин DND")
-            if (f.steps or 0) < 3000: parts.append("прогулка 10–15 мин")
-            if f.longest_stretch_no_break_min >= 120: parts.append("перерыв 5–10 мин каждые 55–70 мин")
-            if f.meet_ratio > 0.5: parts.append("сгруппируй встречи; поставь фокус-блок 60–90 мин")
-            if not parts: parts = ["перерывы по расписанию, вода, 15-мин winddown"]
-            return "План: " + "; ".join(parts) + "."
-        
-        headers = {
-            "Authorization": f"Bearer {self.token}",
-            "Content-Type": "application/json",
-            "HTTP-Referer": "https://github.com/your-repo",
-        }
+            return rule_based_coach(risk, f, label="План")
         
         payload = {
             "model": self.model,
@@ -50,32 +57,13 @@ class LLMClient:
             "temperature": 0.2,
             "max_tokens": 200,
         }
-        
-        try:
-            async with httpx.AsyncClient(timeout=60) as c:
-                r = await c.post(
-                    f"{self.base_url}/chat/completions",
-                    headers=headers,
-                    json=payload
-                )
-                r.raise_for_status()
-                data = r.json()
-                
-                if isinstance(data, dict) and "choices" in data:
-                    if data["choices"] and "message" in data["choices"][0]:
-                        content = data["choices"][0]["message"].get("content", "")
-                        return content.strip()
-        except httpx.HTTPStatusError as e:
-            print(f"OpenRouter API error: {e.response.status_code} - {e.response.text}")
-        except Exception as e:
-            print(f"OpenRouter API exception: {e}")
-        
-        parts = []
-        if risk.risk_score >= 70: parts.append("дыхание 4-7-8 (5 мин) + 20 мин DND")
-        if (f.steps or 0) < 3000: parts.append("прогулка 10–15 мин")
-        if f.longest_stretch_no_break_min >= 120: parts.append("перерыв 5–10 мин каждые 55–70 мин")
-        if f.meet_ratio > 0.5: parts.append("сгруппируй встречи; поставь фокус-блок 60–90 мин")
-        if not parts: parts = ["перерывы по расписанию, вода, 15-мин winddown"]
-        return f"План (fallback): " + "; ".join(parts) + "."
+
+        if on_delta is not None:
+            content = await post_chat_stream(self.http, self.base_url, self.token, payload, 60, on_delta)
+        else:
+            content = await post_chat(self.http, self.base_url, self.token, payload, timeout=60)
+        if content:
+            return content
+        return rule_based_coach(risk, f)
 
 
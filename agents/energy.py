@@ -1,33 +1,72 @@
 from __future__ import annotations
 from typing import List, Dict, Any
-from datetime import timedelta
+from dataclasses import dataclass
 import numpy as np
 from .models import Snapshot, Features
-from .utils import to_dt, clamp, minutes
-from datetime import datetime
+from .utils import clamp, env_int, to_dt
+from .timeline import DayTimeline, day_timeline, epoch
 
 
-def energy_curve(s: Snapshot, f: Features, step_min: int = 30) -> List[Dict[str, Any]]:
-    ws, we = to_dt(s.day.work_start), to_dt(s.day.work_end)
-    total = minutes(we - ws)
-    n = max(1, total // step_min)
+# Шаг кривой энергии в минутах (от 1)
+ENERGY_STEP_MIN = env_int("AGENT_ENERGY_STEP_MIN", 30)
 
-    def chrono_base(hour: float, typ: str) -> float:
-        if typ == "lark":   val = -0.04*(hour-10)**2 + 1.0
-        elif typ == "owl":  val = -0.04*(hour-17)**2 + 1.0
-        else:               val = -0.04*(hour-14)**2 + 1.0
-        return clamp(0.4 + 0.6*val, 0.4, 1.0)
+_CHRONO_PEAK = {"lark": 10.0, "owl": 17.0}
+
+
+@dataclass(frozen=True)
+class EnergyCurve:
+    """
+    Кривая энергии в колоночном виде: t — int64 секунды от эпохи (по возрастанию),
+    energy — значения, уже округлённые до 3 знаков, как в ответе.
+    ISO-строки строятся только в points().
+    """
+    tl: DayTimeline
+    t: np.ndarray
+    energy: np.ndarray
+
+    def points(self) -> List[Dict[str, Any]]:
+        return [{"ts": self.tl.iso(t), "energy": e} for t, e in zip(self.t.tolist(), self.energy.tolist())]
+
+    def mean(self, a: int, b: int) -> float:
+        """Средняя энергия точек с a <= t <= b (поиск границ — searchsorted)."""
+        lo = int(np.searchsorted(self.t, a, side="left"))
+        hi = int(np.searchsorted(self.t, b, side="right"))
+        return float(np.mean(self.energy[lo:hi])) if hi > lo else 0.0
+
+    @classmethod
+    def from_points(cls, tl: DayTimeline, points: List[Dict[str, Any]]) -> "EnergyCurve":
+        t = np.fromiter((epoch(to_dt(p["ts"])) for p in points), dtype=np.int64, count=len(points))
+        energy = np.fromiter((p["energy"] for p in points), dtype=np.float64, count=len(points))
+        order = np.argsort(t, kind="stable")
+        return cls(tl, t[order], energy[order])
+
+
+def compute_energy(s: Snapshot, f: Features, step_min: int | None = None) -> EnergyCurve:
+    """
+    Кривая энергии по рабочему дню с шагом step_min: парабола хронотипа, провал после обеда
+    (13:30–15:30 по местному времени) и штраф за недосып — операциями над массивами.
+    """
+    tl = day_timeline(s)
+    step = max(1, step_min or ENERGY_STEP_MIN)
+    n = max(1, (tl.we - tl.ws) // 60 // step)
+    offsets = np.arange(n + 1, dtype=np.int64) * (step * 60)
+
+    # Часы по местному времени начала дня (секунды отбрасываются, как t.hour + t.minute/60)
+    ws = tl.work_start
+    local_min = (ws.hour * 3600 + ws.minute * 60 + ws.second + offsets) // 60 % 1440
+    hour = local_min // 60 + (local_min % 60) / 60
 
     chrono = s.persona.chronotype if s.persona else "neutral"
     sleep_penalty = 0.0 if f.sleep_h is None else clamp((7.5 - f.sleep_h)/3.0, 0, 0.35)
 
-    points = []
-    for i in range(n+1):
-        t = ws + timedelta(minutes=i*step_min)
-        base = chrono_base(t.hour + t.minute/60, chrono)
-        if 13.5 <= (t.hour + t.minute/60) <= 15.5: base -= 0.12
-        base -= sleep_penalty
-        points.append({"ts": t.isoformat(), "energy": round(clamp(base, 0.2, 1.0), 3)})
-    return points
+    val = -0.04 * (hour - _CHRONO_PEAK.get(chrono, 14.0)) ** 2 + 1.0
+    base = np.clip(0.4 + 0.6 * val, 0.4, 1.0)
+    base = np.where((hour >= 13.5) & (hour <= 15.5), base - 0.12, base)
+    base = np.clip(base - sleep_penalty, 0.2, 1.0)
+    # округление как у round() в ответе (np.round округляет половины иначе)
+    energy = np.array([round(v, 3) for v in base.tolist()], dtype=np.float64)
+    return EnergyCurve(tl, tl.ws + offsets, energy)
 
 
+def energy_curve(s: Snapshot, f: Features, step_min: int | None = None) -> List[Dict[str, Any]]:
+    return compute_energy(s, f, step_min).points()
@@ -1,30 +1,48 @@
 from __future__ import annotations
-from typing import List, Tuple, Any
+from typing import Dict, List, Tuple, Any
 from .models import Snapshot, Features
-from .utils import to_dt, minutes, clamp
+from .timeline import day_timeline, MEETING, FOCUS, BREAK
 import numpy as np
 
 
-def compute_features(s: Snapshot) -> Features:
-    ws, we = to_dt(s.day.work_start), to_dt(s.day.work_end)
-    work_minutes = minutes(we - ws)
+def _schedule_stats(ws: int, we: int, start: np.ndarray, end: np.ndarray, kind: np.ndarray) -> Dict[str, int]:
+    """
+    Признаки расписания по колонкам таймлайна (секунды от эпохи), без циклов по событиям.
+    Минуты считаются floor-делением разностей на 60 — как utils.minutes для timedelta.
+    """
+    dur = (end - start) // 60
+    is_meet = kind == MEETING
+    is_break = kind == BREAK
+
+    # встречи в порядке (start, end); back-to-back — зазор до конца предыдущей < 5 мин
+    m_start, m_end = start[is_meet], end[is_meet]
+    order = np.lexsort((m_end, m_start))
+    m_start, m_end = m_start[order], m_end[order]
+    back_to_back = int(np.count_nonzero((m_start[1:] - m_end[:-1]) // 60 < 5))
 
-    meetings = [(to_dt(it.start), to_dt(it.end)) for it in s.schedule if it.type == "meeting"]
-    meetings.sort()
-    back_to_back = sum(1 for i in range(1, len(meetings)) if minutes(meetings[i][0] - meetings[i-1][1]) < 5)
+    # перерывы по началу (стабильно); отрезок без перерыва считается от конца предыдущего перерыва
+    b_start, b_end = start[is_break], end[is_break]
+    order = np.argsort(b_start, kind="stable")
+    b_start, b_end = b_start[order], b_end[order]
+    prev_end = np.concatenate(([ws], b_end[:-1]))
+    last_end = b_end[-1] if b_end.size else ws
+    longest = max(0, int(((b_start - prev_end) // 60).max(initial=0)), (we - int(last_end)) // 60)
 
-    meeting_minutes = sum(minutes(e - st) for st, e in meetings)
-    meetings_count = len(meetings)
-    deepwork_minutes = sum(minutes(to_dt(it.end) - to_dt(it.start)) for it in s.schedule if it.type == "focus")
-    break_minutes = sum(minutes(to_dt(it.end) - to_dt(it.start)) for it in s.schedule if it.type == "break")
+    return {
+        "meeting_minutes": int(dur[is_meet].sum()),
+        "meetings_count": int(m_start.size),
+        "deepwork_minutes": int(dur[kind == FOCUS].sum()),
+        "break_minutes": int(dur[is_break].sum()),
+        "back_to_back_count": back_to_back,
+        "longest_stretch_no_break_min": longest,
+    }
 
-    longest_stretch = 0
-    last_break_end = ws
-    for it in sorted([it for it in s.schedule if it.type == "break"], key=lambda x: to_dt(x.start)):
-        st, en = to_dt(it.start), to_dt(it.end)
-        longest_stretch = max(longest_stretch, minutes(st - last_break_end))
-        last_break_end = en
-    longest_stretch = max(longest_stretch, minutes(we - last_break_end))
+
+def compute_features(s: Snapshot) -> Features:
+    tl = day_timeline(s)
+    work_minutes = (tl.we - tl.ws) // 60
+    sched = _schedule_stats(tl.ws, tl.we, tl.start, tl.end, tl.kind)
+    meeting_minutes = sched["meeting_minutes"]
 
     context_switches = sum(t.context_switches or 0 for t in s.tasks)
     distractions_minutes = sum(t.distractions_minutes or 0 for t in s.tasks)
@@ -52,9 +70,7 @@ def compute_features(s: Snapshot) -> Features:
     meet_ratio = meeting_minutes / max(1, work_minutes)
 
     return Features(
-        work_minutes=work_minutes, meeting_minutes=meeting_minutes, meetings_count=meetings_count,
-        deepwork_minutes=deepwork_minutes, break_minutes=break_minutes, back_to_back_count=back_to_back,
-        longest_stretch_no_break_min=longest_stretch, context_switches=context_switches,
+        work_minutes=work_minutes, **sched, context_switches=context_switches,
         distractions_minutes=distractions_minutes, steps=steps_total, sleep_h=sleep_h,
         sleep_quality_score=sleep_quality_score, avg_hr=avg_hr, hrv_ms=hrv_ms,
         stress_self=stress_self, fatigue_self=fatigue_self, satisfaction_self=satisfaction_self, burnout_self=burnout_self,
@@ -1,7 +1,224 @@
 from __future__ import annotations
-from typing import List, Dict
+from typing import List, Dict, Any, Callable, Optional
+import json
 import os
+import time
 import httpx
+from .http_pool import get_http_client, request_timeout
+from .llm_cache import get_llm_cache
+from .llm_gateway import CircuitOpen, get_llm_gateway
+from .llm_router import route, route_sync
+from .llm_replay import get_recorder, get_replayer
+from .stages import mark_degraded
+
+
+def openrouter_headers(token: str) -> Dict[str, str]:
+    return {
+        "Authorization": f"Bearer {token}",
+        "Content-Type": "application/json",
+        "HTTP-Referer": "https://github.com/your-repo",
+    }
+
+
+def _extract_content(data: Any) -> str:
+    if isinstance(data, dict) and "choices" in data:
+        if data["choices"] and "message" in data["choices"][0]:
+            content = data["choices"][0]["message"].get("content", "")
+            return content.strip()
+    return ""
+
+
+# Адрес OpenAI-совместимого API; для офлайн-прогонов — заглушка: python -m agents.llm_stub
+DEFAULT_BASE_URL = "https://openrouter.ai/api/v1"
+
+
+def base_url_from_env() -> str:
+    return os.getenv("OPENROUTER_BASE_URL", DEFAULT_BASE_URL).rstrip("/")
+
+
+def _replayed(payload: Dict[str, Any], label: str) -> Optional[str]:
+    """Ответ из записи (LLM_REPLAY) или None, если режим воспроизведения выключен."""
+    replayer = get_replayer()
+    if replayer is None:
+        return None
+    content = replayer.get(payload)
+    if not content:
+        mark_degraded(label or "llm")
+    return content
+
+
+def _record(payload: Dict[str, Any], content: str, started: float) -> None:
+    recorder = get_recorder()
+    if recorder is not None and content:
+        recorder.record(payload, content, time.perf_counter() - started)
+
+
+async def post_chat(http: httpx.AsyncClient, base_url: str, token: str, payload: Dict[str, Any],
+                    timeout: float, label: str = "") -> str:
+    """
+    Единая точка вызова chat/completions через общий пул соединений и кэш ответов.
+    Ошибки логируются, при неудаче возвращается пустая строка.
+    """
+    replayed = _replayed(payload, label)
+    if replayed is not None:
+        return replayed
+    cache = get_llm_cache()
+    if cache is not None:
+        hit = await cache.aget(payload)
+        if hit is not None:
+            return hit
+    # цепочка моделей с хеджированием; в кэш ответ кладётся под исходным payload
+    started = time.perf_counter()
+    content = await route(payload.get("model", ""),
+                          lambda m: _post_chat(http, base_url, token, {**payload, "model": m}, timeout, label))
+    _record(payload, content, started)
+    if not content:
+        mark_degraded(label or "llm")
+    if cache is not None:
+        await cache.aset(payload, content)
+    return content
+
+
+async def _post_chat(http: httpx.AsyncClient, base_url: str, token: str, payload: Dict[str, Any],
+                     timeout: float, label: str = "") -> str:
+    suffix = f" ({label})" if label else ""
+    try:
+        r = await get_llm_gateway().post(
+            http,
+            payload.get("model", ""),
+            f"{base_url}/chat/completions",
+            headers=openrouter_headers(token),
+            json=payload,
+            timeout=request_timeout(timeout),
+        )
+        r.raise_for_status()
+        return _extract_content(r.json())
+    except httpx.HTTPStatusError as e:
+        # Логируем ошибку для отладки
+        print(f"OpenRouter API error{suffix}: {e.response.status_code} - {e.response.text}")
+    except CircuitOpen:
+        # модель недоступна (размыкатель открыт) — сразу fallback, без лога на каждый вызов
+        pass
+    except Exception as e:
+        print(f"OpenRouter API exception{suffix}: {e}")
+    return ""
+
+
+async def post_chat_stream(http: httpx.AsyncClient, base_url: str, token: str, payload: Dict[str, Any],
+                           timeout: float, on_delta: Callable[[str], None], label: str = "") -> str:
+    """
+    Как post_chat, но ответ запрашивается потоком (stream=True): фрагменты текста передаются
+    в on_delta по мере генерации. Возвращает полный ответ; при попадании в кэш on_delta
+    получает его целиком. При ошибке посреди потока возвращается пустая строка.
+    """
+    replayed = _replayed(payload, label)
+    if replayed is not None:
+        if replayed:
+            on_delta(replayed)
+        return replayed
+    cache = get_llm_cache()
+    if cache is not None:
+        hit = await cache.aget(payload)
+        if hit is not None:
+            if hit:
+                on_delta(hit)
+            return hit
+    # потоковый ответ не хеджируется (фрагменты двух ответов смешались бы), но идёт по цепочке моделей
+    started = time.perf_counter()
+    content = await route(payload.get("model", ""),
+                          lambda m: _post_chat_stream(http, base_url, token, {**payload, "model": m}, timeout,
+                                                      on_delta, label),
+                          hedge=False)
+    _record(payload, content, started)
+    if not content:
+        mark_degraded(label or "llm")
+    if cache is not None:
+        await cache.aset(payload, content)
+    return content
+
+
+async def _post_chat_stream(http: httpx.AsyncClient, base_url: str, token: str, payload: Dict[str, Any],
+                            timeout: float, on_delta: Callable[[str], None], label: str = "") -> str:
+    suffix = f" ({label})" if label else ""
+    parts: List[str] = []
+    try:
+        async with get_llm_gateway().stream(
+            http,
+            payload.get("model", ""),
+            f"{base_url}/chat/completions",
+            headers=openrouter_headers(token),
+            json={**payload, "stream": True},
+            timeout=request_timeout(timeout),
+        ) as r:
+            if r.status_code >= 400:
+                await r.aread()
+                print(f"OpenRouter API error{suffix}: {r.status_code} - {r.text}")
+                return ""
+            # SSE: строки "data: {...}", комментарии-пинги провайдера пропускаются
+            async for line in r.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+                try:
+                    choices = json.loads(data).get("choices") or []
+                except ValueError:
+                    continue
+                delta = (choices[0].get("delta") or {}).get("content") if choices else None
+                if delta:
+                    parts.append(delta)
+                    on_delta(delta)
+    except CircuitOpen:
+        return ""
+    except Exception as e:
+        print(f"OpenRouter API exception{suffix}: {e}")
+        return ""
+    return "".join(parts).strip()
+
+
+def post_chat_sync(http: httpx.Client, base_url: str, token: str, payload: Dict[str, Any],
+                   timeout: float, label: str = "") -> str:
+    replayed = _replayed(payload, label)
+    if replayed is not None:
+        return replayed
+    cache = get_llm_cache()
+    if cache is not None:
+        hit = cache.get(payload)
+        if hit is not None:
+            return hit
+    started = time.perf_counter()
+    content = route_sync(payload.get("model", ""),
+                         lambda m: _post_chat_sync(http, base_url, token, {**payload, "model": m}, timeout, label))
+    _record(payload, content, started)
+    if not content:
+        mark_degraded(label or "llm")
+    if cache is not None:
+        cache.set(payload, content)
+    return content
+
+
+def _post_chat_sync(http: httpx.Client, base_url: str, token: str, payload: Dict[str, Any],
+                    timeout: float, label: str = "") -> str:
+    suffix = f" ({label})" if label else ""
+    try:
+        r = get_llm_gateway().post_sync(
+            http,
+            payload.get("model", ""),
+            f"{base_url}/chat/completions",
+            headers=openrouter_headers(token),
+            json=payload,
+            timeout=request_timeout(timeout),
+        )
+        r.raise_for_status()
+        return _extract_content(r.json())
+    except httpx.HTTPStatusError as e:
+        print(f"OpenRouter API error{suffix}: {e.response.status_code} - {e.response.text}")
+    except CircuitOpen:
+        pass
+    except Exception as e:
+        print(f"OpenRouter API exception{suffix}: {e}")
+    return ""
 
 
 class HFClient:
@@ -10,12 +227,28 @@ class HFClient:
     Переменные окружения:
       OPENROUTER_API_KEY      — обязательна для вызовов (по умолчанию используется встроенный ключ)
       OPENROUTER_MODEL        — по умолчанию 'google/gemma-2-27b-it'
+      OPENROUTER_BASE_URL     — по умолчанию 'https://openrouter.ai/api/v1'
     """
-    def __init__(self):
-    
+    def __init__(self, http: Optional[httpx.AsyncClient] = None):
+        self._http = http
         self.token = os.getenv("OPENROUTER_API_KEY", "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")
         self.model = os.getenv("OPENROUTER_MODEL", "google/gemma-2-27b-it")
-        self.base_url = "https://openrouter.ai/api/v1"
+        self.base_url = base_url_from_env()
+
+    @property
+    def http(self) -> httpx.AsyncClient:
+        return self._http or get_http_client()
+
+    async def chat(self, prompt: str, temperature: float, max_tokens: int, timeout: float, label: str = "") -> str:
+        payload = {
+            "model": self.model,
+            "messages": [
+                {"role": "user", "content": prompt}
+            ],
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+        }
+        return await post_chat(self.http, self.base_url, self.token, payload, timeout, label)
 
     async def summarize(self, text: str, max_new_tokens: int = 120) -> str:
         if not (self.token and text.strip()):
@@ -30,43 +263,7 @@ class HFClient:
             "Резюме:"
         )
         
-        headers = {
-            "Authorization": f"Bearer {self.token}",
-            "Content-Type": "application/json",
-            "HTTP-Referer": "https://github.com/your-repo",  
-        }
-        
-        payload = {
-            "model": self.model,
-            "messages": [
-                {"role": "user", "content": prompt}
-            ],
-            "temperature": 0.3,
-            "max_tokens": max_new_tokens + 50,  
-        }
-        
-        try:
-            async with httpx.AsyncClient(timeout=60) as c:
-                r = await c.post(
-                    f"{self.base_url}/chat/completions",
-                    headers=headers,
-                    json=payload
-                )
-                r.raise_for_status()
-                data = r.json()
-                
-                
-                if isinstance(data, dict) and "choices" in data:
-                    if data["choices"] and "message" in data["choices"][0]:
-                        content = data["choices"][0]["message"].get("content", "")
-                        return content.strip()
-        except httpx.HTTPStatusError as e:
-            # Логируем ошибку для отладки
-            print(f"OpenRouter API error: {e.response.status_code} - {e.response.text}")
-        except Exception as e:
-            print(f"OpenRouter API exception: {e}")
-        
-        return ""
+        return await self.chat(prompt, temperature=0.3, max_tokens=max_new_tokens + 50, timeout=60)
 
     async def generate_efficiency_recommendations(self, day_summary: str, features_summary: str, max_tokens: int = 300) -> str:
         if not self.token:
@@ -89,41 +286,7 @@ class HFClient:
             "Отвечай на русском языке."
         )
         
-        headers = {
-            "Authorization": f"Bearer {self.token}",
-            "Content-Type": "application/json",
-            "HTTP-Referer": "https://github.com/your-repo",
-        }
-        
-        payload = {
-            "model": self.model,
-            "messages": [
-                {"role": "user", "content": prompt}
-            ],
-            "temperature": 0.4,  
-            "max_tokens": max_tokens,
-        }
-        
-        try:
-            async with httpx.AsyncClient(timeout=90) as c:  
-                r = await c.post(
-                    f"{self.base_url}/chat/completions",
-                    headers=headers,
-                    json=payload
-                )
-                r.raise_for_status()
-                data = r.json()
-                
-                if isinstance(data, dict) and "choices" in data:
-                    if data["choices"] and "message" in data["choices"][0]:
-                        content = data["choices"][0]["message"].get("content", "")
-                        return content.strip()
-        except httpx.HTTPStatusError as e:
-            print(f"OpenRouter API error (efficiency): {e.response.status_code} - {e.response.text}")
-        except Exception as e:
-            print(f"OpenRouter API exception (efficiency): {e}")
-        
-        return ""
+        return await self.chat(prompt, temperature=0.4, max_tokens=max_tokens, timeout=90, label="efficiency")
 
     async def assess_fatigue_load(self, day_summary: str, features_summary: str, max_tokens: int = 220) -> str:
         if not self.token:
@@ -146,41 +309,34 @@ class HFClient:
             "}"
         )
 
-        headers = {
-            "Authorization": f"Bearer {self.token}",
-            "Content-Type": "application/json",
-            "HTTP-Referer": "https://github.com/your-repo",
-        }
-
-        payload = {
-            "model": self.model,
-            "messages": [
-                {"role": "user", "content": prompt}
-            ],
-            "temperature": 0.2,
-            "max_tokens": max_tokens,
-        }
-
-        try:
-            async with httpx.AsyncClient(timeout=90) as c:
-                r = await c.post(
-                    f"{self.base_url}/chat/completions",
-                    headers=headers,
-                    json=payload
-                )
-                r.raise_for_status()
-                data = r.json()
-                if isinstance(data, dict) and "choices" in data:
-                    if data["choices"] and "message" in data["choices"][0]:
-                        content = data["choices"][0]["message"].get("content", "")
-                        return content.strip()
-        except httpx.HTTPStatusError as e:
-            print(f"OpenRouter API error (fatigue): {e.response.status_code} - {e.response.text}")
-        except Exception as e:
-            print(f"OpenRouter API exception (fatigue): {e}")
-
-        return ""
-
+        return await self.chat(prompt, temperature=0.2, max_tokens=max_tokens, timeout=90, label="fatigue")
 
+    async def fused_analysis(self, day_summary: str, features_summary: str, risk_summary: str,
+                             inbox_text: str, rag_context: str, max_tokens: int = 900) -> str:
+        """Один запрос вместо пяти: все LLM-секции анализа одним JSON-объектом."""
+        if not self.token:
+            return ""
 
+        inbox_part = f"Входящие сообщения:\n{inbox_text[:4000]}\n\n" if inbox_text else ""
+        rag_part = f"Идеи из базы знаний:\n{rag_context}\n\n" if rag_context else ""
+        prompt = (
+            "Ты эксперт по продуктивности, здоровью и профилактике выгорания. "
+            "Проанализируй рабочий день пользователя.\n\n"
+            f"Резюме дня:\n{day_summary}\n\n"
+            f"Метрики:\n{features_summary}\n\n"
+            f"Риск выгорания:\n{risk_summary}\n\n"
+            f"{inbox_part}"
+            f"{rag_part}"
+            "Ответ верни строго в JSON-формате без лишнего текста, вида:\n"
+            "{"
+            "\"inbox_summary\": краткая выжимка входящих (до 120 слов) или null, если их нет, "
+            "\"efficiency_recommendations\": \"5-7 конкретных рекомендаций по эффективности, каждая начинается с глагола\", "
+            "\"fatigue_load\": {\"fatigue_score\": 0-100, \"load_score\": 0-100, "
+            "\"level\": \"low\" | \"medium\" | \"high\", \"explanation\": \"краткий текст\"}, "
+            "\"coach_message\": \"бриф до 80 слов: 3–5 шагов по снижению риска выгорания с причинами\", "
+            "\"rag_suggestions\": [\"5–7 советов, опирающихся на идеи из базы знаний\"]"
+            "}\n"
+            "Отвечай на русском языке."
+        )
 
+        return await self.chat(prompt, temperature=0.3, max_tokens=max_tokens, timeout=90, label="fused")
@@ -0,0 +1,139 @@
+from __future__ import annotations
+from typing import Dict, Optional
+from collections import defaultdict
+import asyncio
+import os
+import httpx
+from .utils import env_float, env_int
+
+
+# Параметры пула соединений к LLM-провайдеру.
+CONNECT_TIMEOUT = env_float("LLM_CONNECT_TIMEOUT", 10.0)
+POOL_TIMEOUT = env_float("LLM_POOL_TIMEOUT", 10.0)
+MAX_CONNECTIONS = env_int("LLM_MAX_CONNECTIONS", 100)
+MAX_KEEPALIVE = env_int("LLM_MAX_KEEPALIVE", 20)
+KEEPALIVE_EXPIRY = env_float("LLM_KEEPALIVE_EXPIRY", 30.0)
+HTTP2 = os.getenv("LLM_HTTP2", "1") not in ("0", "false", "no")
+
+_client: Optional[httpx.AsyncClient] = None
+_client_loop: Optional[asyncio.AbstractEventLoop] = None
+_sync_client: Optional[httpx.Client] = None
+
+# Счётчики по хостам: отправленные запросы и открытые TCP-соединения.
+_requests: Dict[str, int] = defaultdict(int)
+_connects: Dict[str, int] = defaultdict(int)
+
+
+def _http2_available() -> bool:
+    if not HTTP2:
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def request_timeout(read: float) -> httpx.Timeout:
+    """Таймаут конкретного вызова: общий connect/pool и свой read для каждой стадии."""
+    return httpx.Timeout(read, connect=CONNECT_TIMEOUT, pool=POOL_TIMEOUT)
+
+
+def _trace_for(host: str):
+    async def trace(event: str, info: dict) -> None:
+        if event == "connection.connect_tcp.complete":
+            _connects[host] += 1
+    return trace
+
+
+def _sync_trace_for(host: str):
+    def trace(event: str, info: dict) -> None:
+        if event == "connection.connect_tcp.complete":
+            _connects[host] += 1
+    return trace
+
+
+async def _on_request(request: httpx.Request) -> None:
+    host = request.url.host
+    _requests[host] += 1
+    request.extensions["trace"] = _trace_for(host)
+
+
+def _on_sync_request(request: httpx.Request) -> None:
+    host = request.url.host
+    _requests[host] += 1
+    request.extensions["trace"] = _sync_trace_for(host)
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_KEEPALIVE,
+                        keepalive_expiry=KEEPALIVE_EXPIRY)
+
+
+def _new_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(http2=_http2_available(), limits=_limits(), timeout=request_timeout(60),
+                             event_hooks={"request": [_on_request]})
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Общий для процесса пул соединений (keep-alive, HTTP/2 при наличии h2).
+    Клиент привязан к event loop: при запуске в новом цикле (asyncio.run в CLI) создаётся новый.
+    """
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client.is_closed or _client_loop is not loop:
+        _client, _client_loop = _new_client(), loop
+    return _client
+
+
+async def open_http_client() -> httpx.AsyncClient:
+    return get_http_client()
+
+
+async def close_http_client() -> None:
+    global _client, _client_loop, _sync_client
+    if _client is not None and _client_loop is asyncio.get_running_loop():
+        await _client.aclose()
+    _client, _client_loop = None, None
+    if _sync_client is not None:
+        _sync_client.close()
+        _sync_client = None
+
+
+def get_sync_http_client() -> httpx.Client:
+    """Синхронный пул для CLI/синхронных путей (HTTP/1.1 keep-alive)."""
+    global _sync_client
+    if _sync_client is None or _sync_client.is_closed:
+        _sync_client = httpx.Client(http2=_http2_available(), limits=_limits(), timeout=request_timeout(60),
+                                    event_hooks={"request": [_on_sync_request]})
+    return _sync_client
+
+
+def _pool_connections(client) -> Dict[str, int]:
+    counts: Dict[str, int] = defaultdict(int)
+    pool = getattr(getattr(client, "_transport", None), "_pool", None)
+    for conn in getattr(pool, "connections", []) or []:
+        origin = getattr(conn, "_origin", None)
+        if origin is None or conn.is_closed():
+            continue
+        counts[origin.host.decode("ascii", "replace")] += 1
+    return counts
+
+
+def pool_stats() -> Dict[str, Dict[str, int]]:
+    """
+    Метрики переиспользования соединений по хостам:
+      open      — открытые сейчас соединения в пулах;
+      connects  — сколько TCP-соединений было установлено;
+      requests  — сколько запросов отправлено.
+    При работающем keep-alive requests заметно больше connects.
+    """
+    open_now: Dict[str, int] = defaultdict(int)
+    for c in (_client, _sync_client):
+        if c is not None and not c.is_closed:
+            for host, n in _pool_connections(c).items():
+                open_now[host] += n
+    hosts = set(open_now) | set(_requests) | set(_connects)
+    return {h: {"open": open_now.get(h, 0), "connects": _connects.get(h, 0), "requests": _requests.get(h, 0)}
+            for h in sorted(hosts)}
@@ -0,0 +1,149 @@
+from __future__ import annotations
+from typing import Iterator, List, Optional, Tuple
+import numpy as np
+
+
+def _as_i64(x) -> np.ndarray:
+    return np.asarray(x, dtype=np.int64).reshape(-1)
+
+
+class IntervalSet:
+    """
+    Множество полуинтервалов [start, end) на оси времени (int, например секунды от эпохи),
+    хранимое как два отсортированных массива непересекающихся, не соприкасающихся интервалов.
+    Поиск пересечений и первого/последнего свободного окна длиной >= N — за O(log n):
+    бинарный поиск по границам плюс sparse table максимумов по промежуткам между интервалами.
+    """
+    def __init__(self, starts: np.ndarray, ends: np.ndarray) -> None:
+        # ожидаются уже нормализованные массивы; для произвольных — from_intervals
+        self.starts = starts
+        self.ends = ends
+        self._table: Optional[List[np.ndarray]] = None
+
+    @classmethod
+    def from_intervals(cls, starts, ends) -> "IntervalSet":
+        """Слияние произвольных (неотсортированных, перекрывающихся) интервалов; пустые отбрасываются."""
+        s, e = _as_i64(starts), _as_i64(ends)
+        keep = e > s
+        s, e = s[keep], e[keep]
+        if s.size == 0:
+            return cls(s, e)
+        order = np.argsort(s, kind="stable")
+        s, e = s[order], e[order]
+        reach = np.maximum.accumulate(e)
+        # новый интервал начинается, если он не касается уже покрытого
+        first = np.empty(s.size, dtype=bool)
+        first[0] = True
+        first[1:] = s[1:] > reach[:-1]
+        last = np.empty(s.size, dtype=bool)
+        last[-1] = True
+        last[:-1] = first[1:]
+        return cls(s[first], reach[last])
+
+    def __len__(self) -> int:
+        return int(self.starts.size)
+
+    def __iter__(self) -> Iterator[Tuple[int, int]]:
+        return zip(self.starts.tolist(), self.ends.tolist())
+
+    def add(self, start: int, end: int) -> None:
+        """Вставка одного интервала: бинарный поиск соседей и слияние только с ними, без пересортировки.
+        Sparse table сбрасывается, только если множество действительно изменилось."""
+        if end <= start:
+            return
+        # сливаются интервалы i..j-1: пересекающиеся с [start, end) или касающиеся его
+        i = int(np.searchsorted(self.ends, start, side="left"))
+        j = int(np.searchsorted(self.starts, end, side="right"))
+        if i < j:
+            if j == i + 1 and self.starts[i] <= start and end <= self.ends[i]:
+                return
+            start, end = min(start, int(self.starts[i])), max(end, int(self.ends[j - 1]))
+        self.starts = np.concatenate([self.starts[:i], _as_i64(start), self.starts[j:]])
+        self.ends = np.concatenate([self.ends[:i], _as_i64(end), self.ends[j:]])
+        self._table = None
+
+    def union(self, other: "IntervalSet") -> "IntervalSet":
+        return IntervalSet.from_intervals(np.concatenate([self.starts, other.starts]),
+                                          np.concatenate([self.ends, other.ends]))
+
+    def _covers(self, points: np.ndarray) -> np.ndarray:
+        i = np.searchsorted(self.ends, points, side="right")
+        inside = i < self.starts.size
+        inside[inside] = self.starts[i[inside]] <= points[inside]
+        return inside
+
+    def subtract(self, other: "IntervalSet") -> "IntervalSet":
+        """Часть self, не покрытая other."""
+        if len(self) == 0 or len(other) == 0:
+            return IntervalSet(self.starts.copy(), self.ends.copy())
+        # элементарные отрезки между всеми границами: принадлежность проверяется по левому концу
+        bounds = np.unique(np.concatenate([self.starts, self.ends, other.starts, other.ends]))
+        lo, hi = bounds[:-1], bounds[1:]
+        keep = self._covers(lo) & ~other._covers(lo)
+        return IntervalSet.from_intervals(lo[keep], hi[keep])
+
+    def complement(self, lo: int, hi: int) -> "IntervalSet":
+        """Свободные окна внутри [lo, hi)."""
+        starts = np.maximum(np.concatenate([[lo], self.ends]), lo)
+        ends = np.minimum(np.concatenate([self.starts, [hi]]), hi)
+        keep = ends > starts
+        return IntervalSet(starts[keep], ends[keep])
+
+    def overlaps(self, start: int, end: int) -> bool:
+        """Пересекается ли [start, end) с каким-либо интервалом множества."""
+        i = int(np.searchsorted(self.ends, start, side="right"))
+        return i < self.starts.size and int(self.starts[i]) < end
+
+    def _gap_table(self) -> List[np.ndarray]:
+        # table[k][j] = max(gaps[j : j + 2**k]), gaps[j] — промежуток между интервалами j и j+1
+        if self._table is None:
+            gaps = self.starts[1:] - self.ends[:-1]
+            table = [gaps]
+            k = 1
+            while 2 ** k <= gaps.size:
+                prev, half = table[-1], 2 ** (k - 1)
+                table.append(np.maximum(prev[:-half], prev[half:]))
+                k += 1
+            self._table = table
+        return self._table
+
+    def _first_gap_index(self, j: int, length: int) -> int:
+        """Первый j' >= j с gaps[j'] >= length (или len(gaps), если такого нет)."""
+        table = self._gap_table()
+        m = table[0].size
+        for k in range(len(table) - 1, -1, -1):
+            if j + 2 ** k <= m and table[k][j] < length:
+                j += 2 ** k
+        return j
+
+    def _last_gap_index(self, r: int, length: int) -> int:
+        """Последний j' <= r с gaps[j'] >= length (или -1)."""
+        table = self._gap_table()
+        for k in range(len(table) - 1, -1, -1):
+            if r - 2 ** k + 1 >= 0 and table[k][r - 2 ** k + 1] < length:
+                r -= 2 ** k
+        return r
+
+    def first_gap(self, length: int, lo: int, hi: int) -> Optional[int]:
+        """Самое раннее t >= lo, при котором [t, t + length) свободно и лежит в [lo, hi); иначе None."""
+        n = self.starts.size
+        i = int(np.searchsorted(self.ends, lo, side="right"))
+        t = lo
+        if i < n and self.starts[i] <= lo:
+            t, i = int(self.ends[i]), i + 1
+        if i < n and self.starts[i] - t < length:
+            j = self._first_gap_index(i, length)
+            t = int(self.ends[j]) if j < n - 1 else int(self.ends[-1])
+        return t if t + length <= hi else None
+
+    def last_gap(self, length: int, lo: int, hi: int) -> Optional[int]:
+        """Самое позднее t, при котором [t, t + length) свободно и лежит в [lo, hi); иначе None."""
+        i = int(np.searchsorted(self.starts, hi, side="left")) - 1
+        e = hi
+        if i >= 0 and self.ends[i] >= hi:
+            e, i = int(self.starts[i]), i - 1
+        if i >= 0 and e - self.ends[i] < length:
+            j = self._last_gap_index(i - 1, length)
+            e = int(self.starts[j + 1]) if j >= 0 else int(self.starts[0])
+        t = e - length
+        return t if t >= lo else None
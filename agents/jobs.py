@@ -0,0 +1,410 @@
+from __future__ import annotations
+from typing import Any, Dict, List, Optional
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from urllib.parse import urlparse
+import asyncio
+import ipaddress
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+import httpx
+import numpy as np
+
+from .orchestrator import analyze_async, analyze_text_async
+from .utils import env_float, env_int
+
+
+# Воркеры фоновых анализов, предел очереди, хранение готовых задач и «аренда» задачи в SQLite:
+# задача в статусе running дольше JOBS_LEASE секунд (процесс упал) снова выдаётся воркерам.
+JOB_WORKERS = env_int("AGENT_JOB_WORKERS", 4)
+JOBS_MAX_QUEUED = env_int("AGENT_JOBS_MAX_QUEUED", 10000)
+JOBS_KEEP = env_int("AGENT_JOBS_KEEP", 10000)
+JOBS_TTL = env_float("AGENT_JOBS_TTL", 86400.0)
+JOBS_LEASE = env_float("AGENT_JOBS_LEASE", 600.0)
+JOBS_POLL = env_float("AGENT_JOBS_POLL", 1.0)
+WEBHOOK_TIMEOUT = env_float("AGENT_WEBHOOK_TIMEOUT", 10.0)
+WEBHOOK_ATTEMPTS = env_int("AGENT_WEBHOOK_ATTEMPTS", 3)
+# Разрешённые хосты вебхуков через запятую; пусто — любые публичные (адреса loopback, частных сетей,
+# link-local и прочие зарезервированные отклоняются, разрешённым явно хостам они доступны)
+WEBHOOK_HOSTS = {h.strip().lower() for h in os.getenv("AGENT_WEBHOOK_HOSTS", "").split(",") if h.strip()}
+
+
+class QueueFull(Exception):
+    pass
+
+
+@dataclass
+class Job:
+    """Фоновый анализ: kind — snapshot (payload — Snapshot) или text (payload — user_id/text/tz)."""
+    kind: str
+    payload: Dict[str, Any]
+    webhook_url: Optional[str] = None
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    status: str = "queued"  # queued | running | done | failed
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    attempts: int = 0
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    webhook_status: Optional[str] = None
+
+    def public(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {"id": self.id, "status": self.status, "kind": self.kind,
+                               "created_at": self.created_at, "started_at": self.started_at,
+                               "finished_at": self.finished_at}
+        if self.status == "done":
+            out["result"] = self.result
+        if self.error:
+            out["error"] = self.error
+        if self.webhook_url:
+            out["webhook_status"] = self.webhook_status
+        return out
+
+
+# Shared address space (CGNAT, RFC 6598): ipaddress не считает её частной, но снаружи она не маршрутизируется
+_SHARED_NET = ipaddress.ip_network("100.64.0.0/10")
+
+
+def _internal_ip(addr: str) -> bool:
+    ip = ipaddress.ip_address(addr.split("%", 1)[0])
+    if isinstance(ip, ipaddress.IPv6Address) and ip.ipv4_mapped is not None:
+        ip = ip.ipv4_mapped
+    return (ip.is_private or ip.is_loopback or ip.is_link_local or ip.is_reserved
+            or ip.is_multicast or ip.is_unspecified or ip in _SHARED_NET)
+
+
+def check_webhook_url(url: str) -> None:
+    """
+    ValueError, если адрес вебхука не http(s), хост не из AGENT_WEBHOOK_HOSTS или (без списка)
+    указывает на внутренний адрес. Имена здесь не резолвятся — это делает resolve_webhook перед отправкой.
+    """
+    parsed = urlparse(url)
+    if parsed.scheme not in ("http", "https") or not parsed.hostname:
+        raise ValueError("webhook_url должен быть http(s)-адресом")
+    host = parsed.hostname.lower()
+    if WEBHOOK_HOSTS:
+        if host not in WEBHOOK_HOSTS:
+            raise ValueError(f"Хост вебхука не разрешён: {parsed.hostname}")
+        return
+    if host == "localhost" or host.endswith(".localhost"):
+        raise ValueError(f"Внутренний адрес вебхука: {parsed.hostname}")
+    try:
+        internal = _internal_ip(host)
+    except ValueError:
+        return
+    if internal:
+        raise ValueError(f"Внутренний адрес вебхука: {parsed.hostname}")
+
+
+async def resolve_webhook(url: str) -> Optional[str]:
+    """
+    Проверенный IP-адрес хоста вебхука; ValueError, если имя резолвится во внутренний адрес.
+    Для хостов из AGENT_WEBHOOK_HOSTS — None (не проверяются, соединение по имени).
+    """
+    check_webhook_url(url)
+    parsed = urlparse(url)
+    if WEBHOOK_HOSTS:
+        return None
+    port = parsed.port or (443 if parsed.scheme == "https" else 80)
+    try:
+        infos = await asyncio.get_running_loop().getaddrinfo(parsed.hostname, port, type=socket.SOCK_STREAM)
+    except socket.gaierror as e:
+        raise ValueError(f"Хост вебхука не найден: {parsed.hostname}") from e
+    if not infos or any(_internal_ip(info[4][0]) for info in infos):
+        raise ValueError(f"Внутренний адрес вебхука: {parsed.hostname}")
+    return infos[0][4][0]
+
+
+def _pinned(url: str, ip: Optional[str]) -> Dict[str, Any]:
+    """
+    Аргументы запроса к вебхуку с соединением на проверенный адрес ip: httpx не резолвит имя повторно
+    (иначе между проверкой и connect имя может начать указывать во внутреннюю сеть — DNS rebinding),
+    а Host и SNI (по нему же проверяется сертификат) остаются исходным именем.
+    """
+    target = httpx.URL(url)
+    if ip is None:
+        return {"url": target}
+    headers = {"Host": target.netloc.decode("ascii")}
+    extensions = {}
+    if target.scheme == "https":
+        extensions["sni_hostname"] = target.host
+        # пул различает соединения только по адресу: TLS-сессию, проверенную для другого имени, не переиспользуем
+        headers["Connection"] = "close"
+    return {"url": target.copy_with(host=ip), "headers": headers, "extensions": extensions}
+
+
+class MemoryJobQueue:
+    """Очередь в памяти процесса: задачи теряются при рестарте."""
+    name = "memory"
+    blocking = False
+
+    def __init__(self, keep: int) -> None:
+        self.keep = keep
+        self._jobs: Dict[str, Job] = {}
+        self._queued: "deque[str]" = deque()
+        self._finished: "OrderedDict[str, None]" = OrderedDict()
+
+    def submit(self, job: Job) -> None:
+        if len(self._queued) >= JOBS_MAX_QUEUED:
+            raise QueueFull()
+        self._jobs[job.id] = job
+        self._queued.append(job.id)
+
+    def claim(self) -> Optional[Job]:
+        if not self._queued:
+            return None
+        job = self._jobs[self._queued.popleft()]
+        job.status, job.started_at, job.attempts = "running", time.time(), job.attempts + 1
+        return job
+
+    def save(self, job: Job) -> None:
+        if job.status in ("done", "failed"):
+            self._finished[job.id] = None
+            while len(self._finished) > self.keep:
+                self._jobs.pop(self._finished.popitem(last=False)[0], None)
+
+    def requeue(self, job: Job) -> None:
+        job.status, job.started_at = "queued", None
+        self._queued.appendleft(job.id)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def counts(self) -> Dict[str, Any]:
+        running = sum(1 for j in self._jobs.values() if j.status == "running")
+        oldest = self._jobs[self._queued[0]].created_at if self._queued else None
+        return {"queued": len(self._queued), "running": running,
+                "oldest_queued_s": round(time.time() - oldest, 3) if oldest else 0.0}
+
+
+_COLUMNS = ("id", "kind", "payload", "webhook_url", "status", "created_at", "started_at", "finished_at",
+            "attempts", "result", "error", "webhook_status")
+
+
+class SQLiteJobQueue:
+    """
+    Очередь в SQLite (WAL): задачи переживают рестарт и видны всем воркерам uvicorn.
+    Выдача задачи — атомарный перевод queued -> running в транзакции BEGIN IMMEDIATE.
+    Вызовы блокирующие (ожидание блокировки до 5 с): JobRunner выполняет их в потоке.
+    """
+    name = "sqlite"
+    blocking = True
+
+    def __init__(self, path: str) -> None:
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5.0, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, kind TEXT NOT NULL, payload TEXT NOT NULL, webhook_url TEXT,"
+            " status TEXT NOT NULL, created_at REAL NOT NULL, started_at REAL, finished_at REAL,"
+            " attempts INTEGER NOT NULL, result TEXT, error TEXT, webhook_status TEXT)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status, created_at)")
+        self._purged = 0.0
+
+    @staticmethod
+    def _row(job: Job) -> tuple:
+        return (job.id, job.kind, json.dumps(job.payload, ensure_ascii=False), job.webhook_url, job.status,
+                job.created_at, job.started_at, job.finished_at, job.attempts,
+                None if job.result is None else json.dumps(job.result, ensure_ascii=False),
+                job.error, job.webhook_status)
+
+    @staticmethod
+    def _job(row: tuple) -> Job:
+        d = dict(zip(_COLUMNS, row))
+        d["payload"] = json.loads(d["payload"])
+        d["result"] = None if d["result"] is None else json.loads(d["result"])
+        return Job(**d)
+
+    def save(self, job: Job) -> None:
+        with self._lock:
+            self._conn.execute(f"INSERT OR REPLACE INTO jobs({', '.join(_COLUMNS)}) VALUES ({', '.join('?' * len(_COLUMNS))})",
+                               self._row(job))
+
+    def submit(self, job: Job) -> None:
+        if self.counts()["queued"] >= JOBS_MAX_QUEUED:
+            raise QueueFull()
+        self.save(job)
+        self._purge()
+
+    def _purge(self) -> None:
+        # готовые задачи старше AGENT_JOBS_TTL удаляются не чаще раза в минуту
+        now = time.time()
+        if now - self._purged < 60:
+            return
+        self._purged = now
+        with self._lock:
+            self._conn.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?",
+                               (now - JOBS_TTL,))
+
+    def claim(self) -> Optional[Job]:
+        now = time.time()
+        cols = ", ".join(_COLUMNS)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    f"SELECT {cols} FROM jobs WHERE status='queued' ORDER BY created_at LIMIT 1").fetchone()
+                if row is None:
+                    # running с истёкшей арендой — процесс, взявший задачу, не завершил её
+                    row = self._conn.execute(
+                        f"SELECT {cols} FROM jobs WHERE status='running' AND started_at < ?"
+                        " ORDER BY created_at LIMIT 1", (now - JOBS_LEASE,)).fetchone()
+                if row is not None:
+                    self._conn.execute("UPDATE jobs SET status='running', started_at=?, attempts=attempts+1"
+                                       " WHERE id=?", (now, row[0]))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        job = self._job(row)
+        job.status, job.started_at, job.attempts = "running", now, job.attempts + 1
+        return job
+
+    def requeue(self, job: Job) -> None:
+        job.status, job.started_at = "queued", None
+        self.save(job)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            row = self._conn.execute(f"SELECT {', '.join(_COLUMNS)} FROM jobs WHERE id=?", (job_id,)).fetchone()
+        return self._job(row) if row else None
+
+    def counts(self) -> Dict[str, Any]:
+        with self._lock:
+            rows = dict(self._conn.execute("SELECT status, COUNT(*) FROM jobs WHERE status IN ('queued', 'running')"
+                                           " GROUP BY status").fetchall())
+            oldest = self._conn.execute("SELECT MIN(created_at) FROM jobs WHERE status='queued'").fetchone()[0]
+        return {"queued": rows.get("queued", 0), "running": rows.get("running", 0),
+                "oldest_queued_s": round(time.time() - oldest, 3) if oldest else 0.0}
+
+
+class JobRunner:
+    """
+    Пул воркеров фоновых анализов. Воркер берёт задачу из очереди, выполняет анализ
+    (с тем же пулом соединений, что и сервер), сохраняет результат и вызывает вебхук —
+    через отдельный клиент, чтобы медленные получатели не занимали соединения к LLM.
+    """
+    def __init__(self, queue: Any, workers: int, http: httpx.AsyncClient | None = None) -> None:
+        self.queue = queue
+        self.workers = max(1, workers)
+        self.http = http
+        self._webhooks: Optional[httpx.AsyncClient] = None
+        self._wake = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+        self._waits: "deque[float]" = deque(maxlen=1000)
+        self._counts = {"submitted": 0, "done": 0, "failed": 0}
+
+    def start(self) -> None:
+        self._webhooks = httpx.AsyncClient(timeout=WEBHOOK_TIMEOUT)
+        self._tasks = [asyncio.ensure_future(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._webhooks is not None:
+            await self._webhooks.aclose()
+            self._webhooks = None
+
+    async def _io(self, fn, *args):
+        # блокирующие вызовы очереди (SQLite) — в потоке, чтобы не останавливать event loop
+        return await asyncio.to_thread(fn, *args) if self.queue.blocking else fn(*args)
+
+    async def submit(self, kind: str, payload: Dict[str, Any], webhook_url: Optional[str] = None) -> Job:
+        job = Job(kind=kind, payload=payload, webhook_url=webhook_url)
+        await self._io(self.queue.submit, job)
+        self._counts["submitted"] += 1
+        self._wake.set()
+        return job
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        return await self._io(self.queue.get, job_id)
+
+    async def _worker(self) -> None:
+        while True:
+            # сброс до claim: задача, добавленная между ними, будет либо взята, либо разбудит
+            self._wake.clear()
+            job = await self._io(self.queue.claim)
+            if job is None:
+                # опрос нужен для задач, добавленных другими процессами (SQLite)
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=JOBS_POLL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._execute(job)
+
+    async def _execute(self, job: Job) -> None:
+        self._waits.append(job.started_at - job.created_at)
+        try:
+            if job.kind == "text":
+                out = await analyze_text_async(http=self.http, **job.payload)
+            else:
+                out = await analyze_async(job.payload, http=self.http)
+            job.status, job.result = "done", out.model_dump()
+        except asyncio.CancelledError:
+            # остановка сервера: задача вернётся в очередь (в SQLite — переживёт рестарт)
+            await self._io(self.queue.requeue, job)
+            raise
+        except Exception as e:
+            job.status, job.error = "failed", f"{type(e).__name__}: {e}"
+        job.finished_at = time.time()
+        self._counts[job.status] += 1
+        await self._io(self.queue.save, job)
+        if job.webhook_url:
+            job.webhook_status = await self._notify(job)
+            await self._io(self.queue.save, job)
+
+    async def _notify(self, job: Job) -> str:
+        """
+        POST с состоянием задачи на webhook_url; до WEBHOOK_ATTEMPTS попыток с паузой 1, 2, 4... с.
+        Адрес проверяется заново перед каждой попыткой (имя могло начать указывать на внутреннюю сеть),
+        соединение идёт на проверенный IP.
+        """
+        status = ""
+        for attempt in range(max(1, WEBHOOK_ATTEMPTS)):
+            if attempt:
+                await asyncio.sleep(2 ** (attempt - 1))
+            try:
+                ip = await resolve_webhook(job.webhook_url)
+            except ValueError:
+                return "blocked"
+            try:
+                r = await self._webhooks.post(**_pinned(job.webhook_url, ip), json=job.public())
+                status = str(r.status_code)
+                if r.status_code < 500:
+                    return status
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+        return status
+
+    async def stats(self) -> Dict[str, Any]:
+        waits = np.array(self._waits) * 1000 if self._waits else np.zeros(1)
+        counts = await self._io(self.queue.counts)
+        return {"backend": self.queue.name, "workers": self.workers, **counts, **self._counts,
+                "wait_ms": {"p50": round(float(np.percentile(waits, 50)), 1),
+                            "p95": round(float(np.percentile(waits, 95)), 1),
+                            "max": round(float(waits.max()), 1)}}
+
+
+def make_job_queue() -> Any:
+    """
+    Очередь фоновых анализов, по переменным окружения:
+      AGENT_JOBS       — memory (по умолчанию) | sqlite
+      AGENT_JOBS_PATH  — файл SQLite (по умолчанию jobs.sqlite3)
+    """
+    if os.getenv("AGENT_JOBS", "memory").lower() == "sqlite":
+        return SQLiteJobQueue(os.getenv("AGENT_JOBS_PATH", "jobs.sqlite3"))
+    return MemoryJobQueue(JOBS_KEEP)
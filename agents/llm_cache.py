@@ -0,0 +1,201 @@
+from __future__ import annotations
+from typing import Any, Dict, Optional
+from collections import OrderedDict
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from .utils import env_float, env_int
+
+
+_EVICT_EVERY = 32
+
+
+def cache_key(payload: Dict[str, Any]) -> str:
+    """Хэш (model, prompt, temperature, max_tokens) запроса chat/completions."""
+    material = {
+        "model": payload.get("model"),
+        "messages": payload.get("messages"),
+        "temperature": payload.get("temperature"),
+        "max_tokens": payload.get("max_tokens"),
+    }
+    raw = json.dumps(material, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class MemoryBackend:
+    """LRU в памяти процесса с TTL на запись."""
+    name = "memory"
+    blocking = False
+
+    def __init__(self, max_entries: int) -> None:
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str, ttl: float) -> None:
+        with self._lock:
+            self._data[key] = (time.time() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def size(self) -> int:
+        return len(self._data)
+
+
+class SQLiteBackend:
+    """
+    Кэш в SQLite (WAL), общий для всех воркеров на одной машине.
+    LRU по времени последнего обращения, просроченные записи удаляются при вытеснении.
+    Чтение не пишет в базу: время обращения запоминается в памяти и сохраняется пачкой
+    при следующей записи (вытеснение идёт только там же). Вызовы блокирующие — из event loop
+    через LLMCache.aget/aset.
+    """
+    name = "sqlite"
+    blocking = True
+
+    def __init__(self, path: str, max_entries: int) -> None:
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._touched: Dict[str, float] = {}
+        self._conn = sqlite3.connect(path, timeout=5.0, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache(accessed_at)")
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, expires_at FROM llm_cache WHERE key=?", (key,)).fetchone()
+            # просроченная запись удалится при вытеснении
+            if row is None or row[1] < now:
+                return None
+            self._touched[key] = now
+            return row[0]
+
+    def set(self, key: str, value: str, ttl: float) -> None:
+        now = time.time()
+        with self._lock:
+            touched, self._touched = self._touched, {}
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO llm_cache(key, value, expires_at, accessed_at) VALUES (?,?,?,?)",
+                    (key, value, now + ttl, now),
+                )
+                if touched:
+                    self._conn.executemany("UPDATE llm_cache SET accessed_at=max(accessed_at, ?) WHERE key=?",
+                                           [(ts, k) for k, ts in touched.items()])
+                # Вытеснение проверяем не на каждой записи: COUNT(*) по таблице не бесплатен
+                self._writes += 1
+                if self._writes % _EVICT_EVERY == 0:
+                    self._conn.execute("DELETE FROM llm_cache WHERE expires_at < ?", (now,))
+                    self._conn.execute(
+                        "DELETE FROM llm_cache WHERE key IN ("
+                        " SELECT key FROM llm_cache ORDER BY accessed_at ASC"
+                        " LIMIT max(0, (SELECT COUNT(*) FROM llm_cache) - ?))",
+                        (self.max_entries,),
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def size(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+
+
+class LLMCache:
+    """Кэш ответов LLM по содержимому запроса со счётчиками попаданий/промахов."""
+    def __init__(self, backend: Any, ttl: float) -> None:
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, payload: Dict[str, Any]) -> Optional[str]:
+        value = self.backend.get(cache_key(payload))
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, payload: Dict[str, Any], value: str) -> None:
+        # Пустой ответ означает ошибку провайдера — такие не кэшируем
+        if value:
+            self.backend.set(cache_key(payload), value, self.ttl)
+
+    async def aget(self, payload: Dict[str, Any]) -> Optional[str]:
+        """get из event loop: блокирующий бэкенд (SQLite) — в потоке."""
+        if self.backend.blocking:
+            return await asyncio.to_thread(self.get, payload)
+        return self.get(payload)
+
+    async def aset(self, payload: Dict[str, Any], value: str) -> None:
+        if self.backend.blocking:
+            await asyncio.to_thread(self.set, payload, value)
+        else:
+            self.set(payload, value)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {"backend": self.backend.name, "hits": self.hits, "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0, "size": self.backend.size()}
+
+
+_cache: Optional[LLMCache] = None
+_cache_ready = False
+
+
+def get_llm_cache() -> Optional[LLMCache]:
+    """
+    Кэш, настроенный переменными окружения:
+      LLM_CACHE       — memory (по умолчанию) | sqlite | off
+      LLM_CACHE_TTL   — время жизни записи в секундах (по умолчанию 3600)
+      LLM_CACHE_MAX   — максимум записей (по умолчанию 2048)
+      LLM_CACHE_PATH  — файл SQLite (по умолчанию llm_cache.sqlite3)
+    """
+    global _cache, _cache_ready
+    if _cache_ready:
+        return _cache
+    kind = os.getenv("LLM_CACHE", "memory").lower()
+    ttl = env_float("LLM_CACHE_TTL", 3600.0)
+    max_entries = env_int("LLM_CACHE_MAX", 2048)
+    if kind == "sqlite":
+        backend: Any = SQLiteBackend(os.getenv("LLM_CACHE_PATH", "llm_cache.sqlite3"), max_entries)
+        _cache = LLMCache(backend, ttl)
+    elif kind in ("off", "0", "none", "false"):
+        _cache = None
+    else:
+        _cache = LLMCache(MemoryBackend(max_entries), ttl)
+    _cache_ready = True
+    return _cache
+
+
+def cache_stats() -> Dict[str, Any]:
+    cache = get_llm_cache()
+    return cache.stats() if cache is not None else {"backend": "off"}
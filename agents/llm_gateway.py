@@ -0,0 +1,380 @@
+from __future__ import annotations
+from typing import Any, AsyncIterator, Callable, Dict, Optional, Tuple
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from email.utils import parsedate_to_datetime
+import asyncio
+import random
+import threading
+import time
+import httpx
+from .utils import env_float, env_int
+
+
+# Лимиты и устойчивость вызовов LLM (общие для процесса):
+#   одновременных запросов всего и на модель; скорость (токен-бакет, запросов/с; 0 — без ограничения);
+#   повторы 429/5xx/ошибок соединения с экспоненциальной паузой и джиттером (Retry-After важнее);
+#   размыкатель: после BREAKER_FAILURES неудач подряд модель на BREAKER_COOLDOWN с не вызывается.
+MAX_CONCURRENCY = env_int("LLM_MAX_CONCURRENCY", 32)
+MODEL_CONCURRENCY = env_int("LLM_MODEL_CONCURRENCY", 16)
+RATE = env_float("LLM_RATE", 0.0)
+BURST = env_float("LLM_BURST", 10.0)
+RETRIES = env_int("LLM_RETRIES", 2)
+BACKOFF_BASE = env_float("LLM_BACKOFF_BASE", 0.5)
+BACKOFF_MAX = env_float("LLM_BACKOFF_MAX", 8.0)
+RETRY_AFTER_MAX = env_float("LLM_RETRY_AFTER_MAX", 20.0)
+BREAKER_FAILURES = env_int("LLM_BREAKER_FAILURES", 5)
+BREAKER_COOLDOWN = env_float("LLM_BREAKER_COOLDOWN", 30.0)
+
+# Ошибки, после которых запрос не дошёл до модели и его безопасно повторить
+_RETRY_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout, httpx.RemoteProtocolError)
+
+
+class CircuitOpen(Exception):
+    """Размыкатель модели открыт: вызов не выполняется, стадия сразу берёт fallback."""
+
+
+class CallMark:
+    """
+    Состояние одного вызова для хеджирования (llm_router): on_wire установлен, пока запрос отправлен
+    и ждёт ответа (sent_at — момент отправки текущей попытки); очередь к слоту и паузы между повторами
+    сюда не входят. superseded — вызов отменён, потому что ответил дубль: это не неудача модели.
+    """
+    def __init__(self) -> None:
+        self.on_wire = asyncio.Event()
+        self.sent_at = 0.0
+        self.superseded = False
+
+
+# Отметка вызова задаётся роутером в задаче попытки; шлюз видит её через контекст
+call_mark: ContextVar[Optional[CallMark]] = ContextVar("llm_call_mark", default=None)
+
+
+def _retryable(status: int) -> bool:
+    return status == 429 or status >= 500
+
+
+def _retry_after(r: Optional[httpx.Response]) -> Optional[float]:
+    """Retry-After в секундах или HTTP-датой."""
+    raw = r.headers.get("retry-after") if r is not None else None
+    if not raw:
+        return None
+    try:
+        return max(0.0, float(raw))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(raw).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, r: Optional[httpx.Response] = None) -> float:
+    """Пауза перед повтором attempt (с 0): Retry-After провайдера или full jitter до BACKOFF_BASE * 2**attempt."""
+    after = _retry_after(r)
+    if after is not None:
+        return min(after, RETRY_AFTER_MAX)
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """closed -> open после failures неудач подряд -> half_open через cooldown (один пробный вызов)."""
+    def __init__(self, failures: int, cooldown: float) -> None:
+        self.failures = failures
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.errors = 0
+        self.opened_at = 0.0
+        self._probe = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state, self._probe = "half_open", False
+            if self.state == "half_open" and not self._probe:
+                self._probe = True
+                return True
+            return False
+
+    def record(self, ok: bool) -> None:
+        with self._lock:
+            if ok:
+                self.state, self.errors, self._probe = "closed", 0, False
+                return
+            self.errors += 1
+            if self.state == "half_open" or self.errors >= self.failures:
+                self.state, self.opened_at, self._probe = "open", time.monotonic(), False
+
+    def release(self) -> None:
+        """Вызов отменён без результата: не засчитывается, но и не держит пробный вызов half_open."""
+        with self._lock:
+            self._probe = False
+
+
+class TokenBucket:
+    """Токен-бакет со скоростью rate/с и ёмкостью burst; reserve() возвращает, сколько ждать."""
+    def __init__(self, rate: float, burst: float) -> None:
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # токен берётся сразу (баланс может уйти в минус): очередь ожидающих честная
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def empty(self) -> bool:
+        """Следующему запросу пришлось бы ждать токен."""
+        if self.rate <= 0:
+            return False
+        with self._lock:
+            return self.tokens + (time.monotonic() - self.updated) * self.rate < 1
+
+
+class LLMGateway:
+    """
+    Единая точка вызовов LLM: ограничение одновременных запросов (всего и на модель),
+    токен-бакет, повторы с backoff и размыкатель по модели. Разомкнутая модель сразу
+    отвечает CircuitOpen, и стадии подставляют детерминированный fallback без ожидания таймаутов.
+    """
+    def __init__(self) -> None:
+        self.bucket = TokenBucket(RATE, BURST)
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._global: Optional[asyncio.Semaphore] = None
+        self._models: Dict[str, asyncio.Semaphore] = {}
+        self._sync_global = threading.BoundedSemaphore(max(1, MAX_CONCURRENCY))
+        self.in_flight: Dict[str, int] = defaultdict(int)
+        self.counts: Dict[str, int] = defaultdict(int)
+        self._backoff_until: Dict[str, float] = {}
+
+    def breaker(self, model: str) -> CircuitBreaker:
+        b = self._breakers.get(model)
+        if b is None:
+            b = self._breakers.setdefault(model, CircuitBreaker(BREAKER_FAILURES, BREAKER_COOLDOWN))
+        return b
+
+    def _semaphores(self, model: str):
+        # семафоры asyncio привязаны к циклу: синхронные обёртки (asyncio.run) получают свои
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop, self._global, self._models = loop, asyncio.Semaphore(max(1, MAX_CONCURRENCY)), {}
+        if model not in self._models:
+            self._models[model] = asyncio.Semaphore(max(1, MODEL_CONCURRENCY))
+        return self._global, self._models[model]
+
+    def _check(self, model: str) -> Tuple[CircuitBreaker, bool]:
+        """Размыкатель модели и признак «этот вызов — пробный» (half_open); CircuitOpen, если вызов не пропущен."""
+        b = self.breaker(model)
+        if not b.allow():
+            self.counts["short_circuited"] += 1
+            raise CircuitOpen(model)
+        return b, b.state == "half_open"
+
+    def _unsent(self, breaker: CircuitBreaker, probe: bool) -> None:
+        # вызов снят до отправки (ожидание слота или бакета): провайдер тут ни при чём —
+        # не засчитывается ни запросом, ни неудачей, только освобождает пробный вызов
+        self.counts["cancelled_unsent"] += 1
+        if probe:
+            breaker.release()
+
+    def busy(self, model: str) -> bool:
+        """
+        Новый запрос к model сейчас не ушёл бы сразу: модель в паузе перед повтором, размыкатель
+        не закрыт, семафоры заняты или бакет пуст. Роутер в этом случае не отправляет дубль.
+        """
+        if time.monotonic() < self._backoff_until.get(model, 0.0) or self.breaker(model).state != "closed":
+            return True
+        if self._loop is asyncio.get_running_loop():
+            per_model = self._models.get(model)
+            if self._global.locked() or (per_model is not None and per_model.locked()):
+                return True
+        return self.bucket.empty()
+
+    async def _backoff(self, model: str, attempt: int, r: Optional[httpx.Response]) -> None:
+        self.counts["retries"] += 1
+        delay = backoff_delay(attempt, r)
+        self._backoff_until[model] = max(self._backoff_until.get(model, 0.0), time.monotonic() + delay)
+        await asyncio.sleep(delay)
+
+    @asynccontextmanager
+    async def _slot(self, model: str) -> AsyncIterator[None]:
+        wait = self.bucket.reserve()
+        if wait > 0:
+            self.counts["throttled"] += 1
+            await asyncio.sleep(wait)
+        glob, per_model = self._semaphores(model)
+        async with glob, per_model:
+            self.in_flight[model] += 1
+            try:
+                yield
+            finally:
+                self.in_flight[model] -= 1
+
+    def _outcome(self, breaker: CircuitBreaker, r: Optional[httpx.Response]) -> None:
+        self.counts["requests"] += 1
+        if r is not None and r.status_code == 429:
+            self.counts["rate_limited"] += 1
+        ok = r is not None and not _retryable(r.status_code)
+        if not ok:
+            self.counts["failures"] += 1
+        breaker.record(ok)
+
+    async def post(self, http: httpx.AsyncClient, model: str, url: str, **kwargs: Any) -> httpx.Response:
+        """POST с повторами; последний ответ (в том числе 429/5xx) возвращается вызывающему."""
+        return await self._call(model, lambda: http.post(url, **kwargs))
+
+    async def _call(self, model: str, send: Callable[[], Any]) -> httpx.Response:
+        mark = call_mark.get()
+        for attempt in range(RETRIES + 1):
+            breaker, probe = self._check(model)
+            r: Optional[httpx.Response] = None
+            sent = False
+            try:
+                async with self._slot(model):
+                    sent = True
+                    if mark is not None:
+                        mark.sent_at = time.monotonic()
+                        mark.on_wire.set()
+                    try:
+                        r = await send()
+                    finally:
+                        if mark is not None:
+                            mark.on_wire.clear()
+            except BaseException as e:
+                if not sent:
+                    self._unsent(breaker, probe)
+                    raise
+                if not isinstance(e, _RETRY_ERRORS):
+                    self._failed(e, breaker, probe, mark)
+                    raise
+                self._outcome(breaker, None)
+                if attempt >= RETRIES:
+                    raise
+            else:
+                self._outcome(breaker, r)
+                if not _retryable(r.status_code) or attempt >= RETRIES:
+                    return r
+            await self._backoff(model, attempt, r)
+        raise AssertionError("unreachable")
+
+    def _failed(self, e: BaseException, breaker: CircuitBreaker, probe: bool, mark: Optional[CallMark]) -> None:
+        """Исход отправленного запроса, прерванного ошибкой или отменой (кроме повторяемых ошибок соединения)."""
+        if isinstance(e, asyncio.CancelledError):
+            if mark is not None and mark.superseded:
+                # проигравший дубль хеджирования: ответ уже получен другим запросом
+                self.counts["hedge_cancelled"] += 1
+                if probe:
+                    breaker.release()
+            else:
+                # отмена по таймауту стадии после отправки — неудача (и не оставляет пробный вызов висящим)
+                self._outcome(breaker, None)
+        elif isinstance(e, (httpx.HTTPError, OSError)):
+            self._outcome(breaker, None)
+        elif probe:
+            breaker.release()
+
+    @asynccontextmanager
+    async def stream(self, http: httpx.AsyncClient, model: str, url: str, **kwargs: Any
+                     ) -> AsyncIterator[httpx.Response]:
+        """
+        Потоковый POST: повторяется, пока не получен заголовок ответа (429/5xx, ошибка соединения);
+        после начала передачи фрагментов повторов нет.
+        """
+        for attempt in range(RETRIES + 1):
+            breaker, probe = self._check(model)
+            delay_r: Optional[httpx.Response] = None
+            yielded = sent = False
+            try:
+                async with self._slot(model):
+                    sent = True
+                    async with http.stream("POST", url, **kwargs) as r:
+                        if _retryable(r.status_code) and attempt < RETRIES:
+                            self._outcome(breaker, r)
+                            delay_r = r
+                        else:
+                            yielded = True
+                            try:
+                                yield r
+                            except BaseException:
+                                self._outcome(breaker, None)
+                                raise
+                            self._outcome(breaker, r)
+                            return
+            except BaseException as e:
+                if not sent:
+                    self._unsent(breaker, probe)
+                    raise
+                if yielded:
+                    # исход уже записан при выдаче ответа
+                    raise
+                if not isinstance(e, _RETRY_ERRORS):
+                    self._failed(e, breaker, probe, None)
+                    raise
+                self._outcome(breaker, None)
+                if attempt >= RETRIES:
+                    raise
+            await self._backoff(model, attempt, delay_r)
+
+    def post_sync(self, http: httpx.Client, model: str, url: str, **kwargs: Any) -> httpx.Response:
+        """Синхронный вариант post для CLI: общий предел одновременных запросов, бакет, повторы, размыкатель."""
+        for attempt in range(RETRIES + 1):
+            breaker, _ = self._check(model)
+            r: Optional[httpx.Response] = None
+            wait = self.bucket.reserve()
+            if wait > 0:
+                self.counts["throttled"] += 1
+                time.sleep(wait)
+            try:
+                with self._sync_global:
+                    r = http.post(url, **kwargs)
+            except _RETRY_ERRORS:
+                self._outcome(breaker, None)
+                if attempt >= RETRIES:
+                    raise
+            except (httpx.HTTPError, OSError):
+                self._outcome(breaker, None)
+                raise
+            else:
+                self._outcome(breaker, r)
+                if not _retryable(r.status_code) or attempt >= RETRIES:
+                    return r
+            self.counts["retries"] += 1
+            time.sleep(backoff_delay(attempt, r))
+        raise AssertionError("unreachable")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrency": MAX_CONCURRENCY, "model_concurrency": MODEL_CONCURRENCY, "rate": RATE,
+            **{k: self.counts.get(k, 0) for k in ("requests", "failures", "retries", "rate_limited",
+                                                   "throttled", "short_circuited", "hedge_cancelled",
+                                                   "cancelled_unsent")},
+            "models": {m: {"in_flight": self.in_flight.get(m, 0), "breaker": b.state, "errors": b.errors}
+                       for m, b in self._breakers.items()},
+        }
+
+
+_gateway: Optional[LLMGateway] = None
+
+
+def get_llm_gateway() -> LLMGateway:
+    global _gateway
+    if _gateway is None:
+        _gateway = LLMGateway()
+    return _gateway
+
+
+def gateway_stats() -> Dict[str, Any]:
+    return get_llm_gateway().stats()
@@ -0,0 +1,99 @@
+from __future__ import annotations
+from typing import Any, Dict, Optional, Tuple
+import json
+import os
+import threading
+import time
+from .llm_cache import cache_key
+
+
+def load_recording(path: str) -> Dict[str, Tuple[str, float]]:
+    """Записи JSONL (см. Recorder) -> {ключ запроса: (ответ, задержка в секундах)}; повтор ключа — последняя запись."""
+    out: Dict[str, Tuple[str, float]] = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            rec = json.loads(line)
+            out[rec["key"]] = (rec["content"], float(rec.get("latency_s") or 0.0))
+    return out
+
+
+class Recorder:
+    """
+    Запись реальных ответов модели в JSONL: ключ запроса (как у кэша LLM), модель, сообщения,
+    параметры, ответ и задержка. Файл дописывается, его читают LLM_REPLAY и заглушка (agents.llm_stub).
+    """
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.records = 0
+        self._lock = threading.Lock()
+
+    def record(self, payload: Dict[str, Any], content: str, latency_s: float) -> None:
+        rec = {"key": cache_key(payload), "model": payload.get("model"), "messages": payload.get("messages"),
+               "temperature": payload.get("temperature"), "max_tokens": payload.get("max_tokens"),
+               "content": content, "latency_s": round(latency_s, 4), "recorded_at": time.time()}
+        line = json.dumps(rec, ensure_ascii=False) + "\n"
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+            self.records += 1
+
+
+class Replayer:
+    """Ответы из записи без обращения к сети; запрос, которого нет в записи, — пустой ответ (fallback стадии)."""
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._data = load_recording(path)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, payload: Dict[str, Any]) -> str:
+        hit = self._data.get(cache_key(payload))
+        if hit is None:
+            self.misses += 1
+            print(f"LLM replay miss ({payload.get('model')}): запроса нет в {self.path}")
+            return ""
+        self.hits += 1
+        return hit[0]
+
+
+_recorder: Optional[Recorder] = None
+_replayer: Optional[Replayer] = None
+_ready = False
+
+
+def _init() -> None:
+    """
+    Режимы по переменным окружения:
+      LLM_RECORD  — файл JSONL, куда дописываются реальные ответы модели
+      LLM_REPLAY  — файл JSONL, из которого ответы отдаются вместо вызовов модели
+    """
+    global _recorder, _replayer, _ready
+    if _ready:
+        return
+    if os.getenv("LLM_REPLAY"):
+        _replayer = Replayer(os.environ["LLM_REPLAY"])
+    if os.getenv("LLM_RECORD"):
+        _recorder = Recorder(os.environ["LLM_RECORD"])
+    _ready = True
+
+
+def get_replayer() -> Optional[Replayer]:
+    _init()
+    return _replayer
+
+
+def get_recorder() -> Optional[Recorder]:
+    _init()
+    return _recorder
+
+
+def replay_stats() -> Dict[str, Any]:
+    _init()
+    out: Dict[str, Any] = {}
+    if _replayer is not None:
+        out["replay"] = {"path": _replayer.path, "hits": _replayer.hits, "misses": _replayer.misses}
+    if _recorder is not None:
+        out["record"] = {"path": _recorder.path, "records": _recorder.records}
+    return out
@@ -0,0 +1,195 @@
+from __future__ import annotations
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from collections import defaultdict
+import asyncio
+import math
+import os
+import threading
+import time
+from .llm_gateway import CallMark, call_mark, get_llm_gateway
+from .utils import env_float, env_int
+
+
+# Цепочка моделей: основная (из payload) и запасные по порядку — следующая вызывается,
+# если предыдущая не дала ответа (ошибка, пустой ответ, открытый размыкатель).
+FALLBACK_MODELS = [m.strip() for m in os.getenv("OPENROUTER_FALLBACK_MODELS", "").split(",") if m.strip()]
+# Хеджирование: если отправленный запрос ждёт ответа дольше квантиля HEDGE_QUANTILE задержек модели,
+# отправляется дубль, берётся первый успешный ответ. Пока замеров меньше HEDGE_MIN_SAMPLES — порог HEDGE_AFTER.
+HEDGE = os.getenv("LLM_HEDGE", "1").lower() in ("1", "true", "yes")
+HEDGE_QUANTILE = env_float("LLM_HEDGE_QUANTILE", 0.95)
+HEDGE_MIN_SAMPLES = env_int("LLM_HEDGE_MIN_SAMPLES", 20)
+HEDGE_AFTER = env_float("LLM_HEDGE_AFTER", 10.0)
+HEDGE_MIN_DELAY = env_float("LLM_HEDGE_MIN_DELAY", 0.05)
+
+
+class LatencyHistogram:
+    """
+    Гистограмма задержек с логарифмическими корзинами (10 мс ... ~5 мин, шаг ×1.25).
+    Каждые window замеров счётчики делятся пополам — квантили следуют за текущим поведением модели.
+    """
+    LO = 0.01
+    FACTOR = 1.25
+    BUCKETS = 48
+
+    def __init__(self, window: int = 1000) -> None:
+        self.counts = [0.0] * self.BUCKETS
+        self.window = window
+        self.total = 0
+        self._since_decay = 0
+        self._lock = threading.Lock()
+
+    def _bucket(self, seconds: float) -> int:
+        if seconds <= self.LO:
+            return 0
+        return min(self.BUCKETS - 1, int(math.log(seconds / self.LO, self.FACTOR)) + 1)
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self.counts[self._bucket(seconds)] += 1
+            self.total += 1
+            self._since_decay += 1
+            if self._since_decay >= self.window:
+                self.counts = [c / 2 for c in self.counts]
+                self._since_decay = 0
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Верхняя граница корзины, в которую попадает квантиль q; None — замеров нет."""
+        with self._lock:
+            n = sum(self.counts)
+            if n <= 0:
+                return None
+            acc = 0.0
+            for i, c in enumerate(self.counts):
+                acc += c
+                if acc >= q * n:
+                    return self.LO * self.FACTOR ** i
+            return self.LO * self.FACTOR ** (self.BUCKETS - 1)
+
+
+_hist: Dict[str, LatencyHistogram] = defaultdict(LatencyHistogram)
+_counts: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+
+def model_chain(model: str) -> List[str]:
+    return [model] + [m for m in FALLBACK_MODELS if m != model]
+
+
+def hedge_after(model: str) -> float:
+    """Через сколько секунд без ответа отправлять дубль запроса к model."""
+    h = _hist[model]
+    if h.total < HEDGE_MIN_SAMPLES:
+        return HEDGE_AFTER
+    return max(HEDGE_MIN_DELAY, h.quantile(HEDGE_QUANTILE) or HEDGE_AFTER)
+
+
+async def _timed(model: str, call: Callable[[str], Awaitable[str]], mark: Optional[CallMark] = None) -> str:
+    # с отметкой шлюза задержка считается от отправки последней попытки, без очереди и пауз повторов
+    t0 = time.monotonic()
+    if mark is not None:
+        call_mark.set(mark)
+    content = await call(model)
+    if content:
+        _hist[model].record(time.monotonic() - (mark.sent_at if mark is not None and mark.sent_at else t0))
+    return content
+
+
+def _start(model: str, call: Callable[[str], Awaitable[str]]) -> Tuple[asyncio.Task, CallMark]:
+    mark = CallMark()
+    return asyncio.ensure_future(_timed(model, call, mark)), mark
+
+
+async def _hedge_due(model: str, task: asyncio.Task, mark: CallMark) -> bool:
+    """
+    Ждёт, пока запрос task пробудет отправленным hedge_after(model) секунд. Таймер идёт только
+    с момента отправки и перезапускается на каждом повторе; False — ответ пришёл раньше или
+    дубль бесполезен (модель в паузе перед повтором, слоты шлюза заняты).
+    """
+    while not task.done():
+        wire = asyncio.ensure_future(mark.on_wire.wait())
+        try:
+            await asyncio.wait({task, wire}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            wire.cancel()
+        if task.done():
+            return False
+        sent = mark.sent_at
+        left = sent + hedge_after(model) - time.monotonic()
+        if left > 0:
+            await asyncio.wait({task}, timeout=left)
+        if task.done():
+            return False
+        if mark.sent_at != sent or not mark.on_wire.is_set():
+            continue
+        if get_llm_gateway().busy(model):
+            _counts[model]["hedges_skipped"] += 1
+            return False
+        return True
+    return False
+
+
+async def _hedged(model: str, call: Callable[[str], Awaitable[str]]) -> str:
+    """Запрос к model с дублем после hedge_after(model) на линии; первый непустой ответ, остальные отменяются."""
+    primary, mark = _start(model, call)
+    marks = {primary: mark}
+    tasks = {primary}
+    hedge: Optional[asyncio.Task] = None
+    won = False
+    try:
+        if HEDGE and await _hedge_due(model, primary, mark):
+            hedge, marks[hedge] = _start(model, call)
+            tasks.add(hedge)
+            _counts[model]["hedges"] += 1
+        while tasks:
+            done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for t in done:
+                content = t.result() if not t.cancelled() and t.exception() is None else ""
+                if content:
+                    if t is hedge:
+                        _counts[model]["hedge_wins"] += 1
+                    won = True
+                    return content
+        return ""
+    finally:
+        # проигравший запрос отменяется без учёта в размыкателе; при отмене всего вызова
+        # (таймаут стадии) — как обычная неудача
+        for t in tasks:
+            marks[t].superseded = won
+            t.cancel()
+
+
+async def route(model: str, call: Callable[[str], Awaitable[str]], hedge: bool = True) -> str:
+    """
+    Вызов по цепочке моделей: call(имя модели) -> текст ответа ("" — неудача).
+    Основная модель и запасные по порядку; hedge=False — без дублей (потоковые ответы).
+    """
+    for i, m in enumerate(model_chain(model)):
+        if i:
+            _counts[m]["fallbacks"] += 1
+        content = await (_hedged(m, call) if hedge else _timed(m, call))
+        if content:
+            return content
+    return ""
+
+
+def route_sync(model: str, call: Callable[[str], str]) -> str:
+    """Синхронный вариант route: только цепочка моделей, без хеджирования."""
+    for i, m in enumerate(model_chain(model)):
+        if i:
+            _counts[m]["fallbacks"] += 1
+        t0 = time.perf_counter()
+        content = call(m)
+        if content:
+            _hist[m].record(time.perf_counter() - t0)
+            return content
+    return ""
+
+
+def router_stats() -> Dict[str, Any]:
+    models: Dict[str, Any] = {}
+    for m in set(_hist) | set(_counts):
+        h = _hist[m]
+        q = {f"p{int(p * 100)}_ms": None if h.quantile(p) is None else round(h.quantile(p) * 1000, 1)
+             for p in (0.5, 0.95, 0.99)}
+        models[m] = {"samples": h.total, **q, "hedge_after_ms": round(hedge_after(m) * 1000, 1),
+                     **{k: _counts[m].get(k, 0) for k in ("hedges", "hedge_wins", "hedges_skipped", "fallbacks")}}
+    return {"hedge": HEDGE, "hedge_quantile": HEDGE_QUANTILE, "chain_fallbacks": FALLBACK_MODELS, "models": models}
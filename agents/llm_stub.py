@@ -0,0 +1,176 @@
+"""
+Локальная OpenAI-совместимая заглушка chat/completions для нагрузочных тестов и CI без сети.
+Задержки — из заданного распределения, ошибки — с заданной долей, ответы — встроенные шаблоны
+(разбираемый JSON для усталости и объединённого режима), свои правила или запись LLM_RECORD.
+
+  python -m agents.llm_stub --port 8765 --latency lognormal:0.8,0.6 --error-rate 0.02
+  python -m agents.llm_stub --replay llm_record.jsonl --replay-latency
+
+Клиенты направляются на неё через OPENROUTER_BASE_URL=http://127.0.0.1:8765/v1.
+"""
+from __future__ import annotations
+from typing import Any, Dict, List, Optional, Tuple
+from dataclasses import dataclass, field
+import argparse
+import asyncio
+import json
+import math
+import random
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from .llm_cache import cache_key
+from .llm_replay import load_recording
+
+
+_FATIGUE = {"fatigue_score": 62, "load_score": 70, "level": "medium",
+            "explanation": "Много встреч и мало восстановления."}
+_FUSED = {
+    "inbox_summary": "Несколько запросов по срокам и приглашения на встречи; срочного немного.",
+    "efficiency_recommendations": ["Сгруппируй встречи во второй половине дня",
+                                   "Поставь фокус-блок 90 минут утром",
+                                   "Разбирай почту пакетно 2 раза в день"],
+    "fatigue_load": _FATIGUE,
+    "coach_message": "Сделай 5-минутную паузу каждый час, выйди на короткую прогулку и закончи день вовремя.",
+    "rag_suggestions": ["Микропаузы 3–5 минут каждые 50–60 минут", "Прогулка 15 минут после обеда"],
+}
+_TEXT = "Сделай короткую паузу, сгруппируй встречи и выдели фокус-блок на самую важную задачу."
+
+
+def builtin_content(prompt: str) -> str:
+    """Шаблонный ответ, который разбирают стадии анализа."""
+    if "rag_suggestions" in prompt:
+        return json.dumps(_FUSED, ensure_ascii=False)
+    if "fatigue_score" in prompt:
+        return json.dumps(_FATIGUE, ensure_ascii=False)
+    return _TEXT
+
+
+def parse_latency(spec: str):
+    """
+    Распределение задержки (секунды):
+      fixed:0.5 | uniform:0.2,1.5 | exp:0.5 (среднее) | lognormal:0.8,0.6 (медиана, sigma)
+    """
+    kind, _, raw = spec.partition(":")
+    args = [float(x) for x in raw.split(",") if x]
+    if kind == "fixed":
+        return lambda rng: args[0]
+    if kind == "uniform":
+        return lambda rng: rng.uniform(args[0], args[1])
+    if kind == "exp":
+        return lambda rng: rng.expovariate(1.0 / args[0])
+    if kind == "lognormal":
+        return lambda rng: rng.lognormvariate(math.log(args[0]), args[1])
+    raise ValueError(f"Неизвестное распределение задержки: {spec}")
+
+
+@dataclass
+class StubConfig:
+    latency: str = "fixed:0.3"
+    slow_p: float = 0.0
+    slow_s: float = 5.0
+    error_rate: float = 0.0
+    error_status: List[int] = field(default_factory=lambda: [500, 503, 429])
+    retry_after: Optional[float] = 1.0
+    responses: List[Dict[str, str]] = field(default_factory=list)
+    replay: Dict[str, Tuple[str, float]] = field(default_factory=dict)
+    replay_latency: bool = False
+    stream_chunk_s: float = 0.02
+    seed: Optional[int] = None
+
+
+def make_app(cfg: StubConfig) -> FastAPI:
+    app = FastAPI(title="LLM stub")
+    rng = random.Random(cfg.seed)
+    latency = parse_latency(cfg.latency)
+    stats: Dict[str, Any] = {"requests": 0, "errors": 0, "replayed": 0, "in_flight": 0, "max_in_flight": 0,
+                             "models": {}}
+
+    def content_for(body: Dict[str, Any]) -> Tuple[str, Optional[float]]:
+        rec = cfg.replay.get(cache_key(body))
+        if rec is not None:
+            stats["replayed"] += 1
+            return rec[0], rec[1] if cfg.replay_latency else None
+        prompt = "\n".join(str(m.get("content", "")) for m in body.get("messages") or [])
+        for rule in cfg.responses:
+            if rule.get("match", "") in prompt:
+                return rule["content"], None
+        return builtin_content(prompt), None
+
+    async def completions(request: Request):
+        body = await request.json()
+        model = body.get("model", "")
+        stats["requests"] += 1
+        stats["models"][model] = stats["models"].get(model, 0) + 1
+        stats["in_flight"] += 1
+        stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+        try:
+            content, recorded = content_for(body)
+            delay = recorded if recorded is not None else (
+                cfg.slow_s if rng.random() < cfg.slow_p else latency(rng))
+            await asyncio.sleep(max(0.0, delay))
+            if rng.random() < cfg.error_rate:
+                stats["errors"] += 1
+                status = rng.choice(cfg.error_status)
+                headers = {"Retry-After": str(cfg.retry_after)} if status == 429 and cfg.retry_after else None
+                return JSONResponse({"error": {"message": "stub error", "code": status}}, status_code=status,
+                                    headers=headers)
+        finally:
+            stats["in_flight"] -= 1
+
+        if body.get("stream"):
+            async def chunks():
+                for i, word in enumerate(content.split(" ")):
+                    piece = {"choices": [{"delta": {"content": (" " if i else "") + word}}], "model": model}
+                    yield f"data: {json.dumps(piece, ensure_ascii=False)}\n\n"
+                    await asyncio.sleep(cfg.stream_chunk_s)
+                yield "data: [DONE]\n\n"
+            return StreamingResponse(chunks(), media_type="text/event-stream")
+        return {"id": "stub", "object": "chat.completion", "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                             "finish_reason": "stop"}]}
+
+    # базовый адрес может быть как http://host:port, так и http://host:port/v1 или .../api/v1
+    for prefix in ("", "/v1", "/api/v1"):
+        app.add_api_route(f"{prefix}/chat/completions", completions, methods=["POST"])
+
+    @app.get("/stats")
+    async def stats_endpoint() -> Dict[str, Any]:
+        return stats
+
+    return app
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="OpenAI-совместимая заглушка chat/completions")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--latency", default="fixed:0.3", help="fixed:S | uniform:A,B | exp:MEAN | lognormal:MEDIAN,SIGMA")
+    ap.add_argument("--slow-p", type=float, default=0.0, help="доля очень медленных ответов")
+    ap.add_argument("--slow", type=float, default=5.0, help="задержка медленного ответа, с")
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--error-status", default="500,503,429")
+    ap.add_argument("--retry-after", type=float, default=1.0, help="Retry-After для 429 (0 — без заголовка)")
+    ap.add_argument("--responses", help='JSON: [{"match": "подстрока промпта", "content": "ответ"}, ...]')
+    ap.add_argument("--replay", help="запись LLM_RECORD (JSONL): ответы по ключу запроса")
+    ap.add_argument("--replay-latency", action="store_true", help="отвечать с записанной задержкой")
+    ap.add_argument("--seed", type=int, default=None)
+    args = ap.parse_args()
+
+    cfg = StubConfig(latency=args.latency, slow_p=args.slow_p, slow_s=args.slow, error_rate=args.error_rate,
+                     error_status=[int(x) for x in args.error_status.split(",") if x],
+                     retry_after=args.retry_after or None, replay_latency=args.replay_latency, seed=args.seed)
+    parse_latency(cfg.latency)
+    if args.responses:
+        with open(args.responses, "r", encoding="utf-8") as f:
+            cfg.responses = json.load(f)
+    if args.replay:
+        cfg.replay = load_recording(args.replay)
+
+    import uvicorn
+    uvicorn.run(make_app(cfg), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,6 @@
 from __future__ import annotations
 from typing import List, Optional, Literal, Dict, Tuple, Any
-from pydantic import BaseModel, field_validator
+from pydantic import BaseModel, PrivateAttr, field_validator
 from .utils import to_dt
 
 
@@ -92,6 +92,8 @@ class Snapshot(BaseModel):
     rec_history: Optional[RecHistory] = None
     persona: Optional[Persona] = None
     inbox_samples: Optional[List[str]] = None
+    # Разобранный день (timeline.day_timeline), строится один раз на снапшот
+    _timeline: Any = PrivateAttr(default=None)
 
 
 class Features(BaseModel):
@@ -124,6 +126,16 @@ class RiskResult(BaseModel):
     notes: List[str]
 
 
+class TrendResult(BaseModel):
+    days: int
+    risk_score: float
+    risk_ewma: float
+    sleep_debt_ewma_h: Optional[float] = None
+    overtime_week_h: float
+    meeting_load_trend: float
+    notes: List[str]
+
+
 class PlanItem(BaseModel):
     start: str
     end: str
@@ -177,5 +189,6 @@ class Output(BaseModel):
     efficiency_recommendations: EfficiencyRecommendations
     rag_advice: Optional[RAGAdvice] = None
     fatigue_load: Optional[FatigueLoadAssessment] = None
+    trend: Optional[TrendResult] = None
 
 
@@ -1,43 +1,226 @@
 from __future__ import annotations
-from typing import Dict, Any, List
-from .models import Snapshot, Output
+from typing import Dict, Any, List, Awaitable, Callable, Sequence, Set, Tuple, TypeVar
+import asyncio
+import os
+import httpx
+from .models import Snapshot, Output, Features, RiskResult
 from .features import compute_features
 from .risk import compute_risk
-from .energy import energy_curve
+from .energy import compute_energy
 from .planner import propose_plan, to_ics
-from .analytics import meeting_hygiene, comm_triage, wellbeing, efficiency_analysis, assess_fatigue_load_llm
+from .analytics import (meeting_hygiene, comm_triage, comm_triage_rules, wellbeing, efficiency_analysis,
+                        efficiency_fallback, assess_fatigue_load_llm, fatigue_fallback, fused_llm_analysis)
 from .hf_client import HFClient
-from .coach import LLMClient
+from .coach import LLMClient, rule_based_coach
 from .rag import RAGAssistant
+from .stages import TOTAL_DEADLINE, Stage, run_stages
+from .trends import update_trend_async
+from .store import (StoredAnalysis, get_analysis_store, record_store_hit, snapshot_hashes, store_call,
+                    store_put)
+from .singleflight import SingleFlight
+from .http_pool import close_http_client
+from .utils import env_int
 
+T = TypeVar("T")
+OnEvent = Callable[[str, Any], None]
 
-async def analyze_async(snapshot_dict: Dict[str, Any]) -> Output:
+
+# Объединённый режим LLM: один запрос вместо пяти (см. analytics.fused_llm_analysis).
+FUSED_LLM = os.getenv("AGENT_FUSED_LLM", "0").lower() in ("1", "true", "yes")
+
+
+# Зависимости частей анализа от разделов снапшота. Часть пересчитывается, только если изменился
+# хотя бы один её раздел по сравнению с сохранённым анализом того же дня; остальное берётся из хранилища.
+# "biometrics.sleep" — виртуальный раздел: только сон из biometrics (см. store.snapshot_hashes).
+FEATURE_SECTIONS = ("day", "schedule", "tasks", "biometrics", "surveys", "comms")
+RISK_SECTIONS = FEATURE_SECTIONS + ("rec_history",)
+PART_SECTIONS: Dict[str, tuple] = {
+    "features": FEATURE_SECTIONS,
+    "risk": RISK_SECTIONS,
+    "energy_curve": ("day", "persona", "biometrics.sleep"),
+    "plan": RISK_SECTIONS + ("persona",),
+    "meeting_hygiene": FEATURE_SECTIONS,
+    "wellbeing": RISK_SECTIONS,
+}
+# LLM-стадии: comm_triage здесь — только саммари входящих, правиловая часть (comms) считается всегда
+STAGE_SECTIONS: Dict[str, tuple] = {
+    "comm_triage": ("inbox_samples",),
+    "efficiency": FEATURE_SECTIONS,
+    "fatigue_load": FEATURE_SECTIONS,
+    "rag_advice": RISK_SECTIONS,
+    "coach": RISK_SECTIONS,
+}
+STAGE_OUTPUT = {"comm_triage": "comm_triage", "efficiency": "efficiency_recommendations",
+                "fatigue_load": "fatigue_load", "rag_advice": "rag_advice", "coach": "coach_message"}
+
+
+def _changed(prev: StoredAnalysis | None, sections: Dict[str, str]) -> Set[str] | None:
+    """Разделы, изменившиеся с прошлого анализа того же дня; None — прошлого анализа нет, считать всё."""
+    if prev is None:
+        return None
+    return {name for name, h in sections.items() if prev.sections.get(name) != h}
+
+
+def _stale(changed: Set[str] | None, deps: tuple) -> bool:
+    return changed is None or not changed.isdisjoint(deps)
+
+
+def _reusable(prev: StoredAnalysis | None, changed: Set[str] | None) -> Dict[str, Any]:
+    """Результаты LLM-стадий прошлого анализа того же дня, входы которых не изменились."""
+    if prev is None:
+        return {}
+    return {name: prev.output[STAGE_OUTPUT[name]] for name in prev.stages_ok
+            if name in STAGE_SECTIONS and not _stale(changed, STAGE_SECTIONS[name])}
+
+
+# Одинаковые одновременные анализы (тот же снапшот по хэшу содержимого) выполняются один раз.
+COALESCE = os.getenv("AGENT_COALESCE", "1").lower() in ("1", "true", "yes")
+_flight = SingleFlight()
+
+
+def coalesce_stats() -> Dict[str, Any]:
+    """leaders — запущенные анализы, coalesced — запросы, получившие результат чужого анализа."""
+    return {"enabled": COALESCE, **_flight.stats()}
+
+
+async def analyze_async(snapshot_dict: Dict[str, Any], http: httpx.AsyncClient | None = None,
+                        fused: bool | None = None, on_event: OnEvent | None = None,
+                        track_trend: bool = True) -> Output:
+    """
+    Полный анализ снапшота. on_event(поле Output, значение) вызывается для каждой части ответа,
+    как только она готова (детерминированные — сразу, LLM-стадии — по мере завершения);
+    фрагменты ответа коуча приходят как ("coach_message.delta", текст).
+    track_trend=False — день не учитывается в скользящем состоянии пользователя (trend не считается).
+    """
     snap = Snapshot(**snapshot_dict)
-    f = compute_features(snap)
-    risk = compute_risk(f, snap.rec_history)
-    energy = energy_curve(snap, f)
-    plan = propose_plan(snap, f, risk, energy)
-    hygiene = meeting_hygiene(snap, f)
-    hf = HFClient()
-    triage = await comm_triage(snap, f, hf)
-    wb = wellbeing(snap, f, risk)
-    efficiency = await efficiency_analysis(snap, f, hf)
-    fatigue_load = await assess_fatigue_load_llm(snap, f, hf)
-    rag = RAGAssistant()
-    rag_advice = rag.build_advice(snap, f, risk)
-    ics = to_ics(plan)
-    coach = await LLMClient().coach(risk, f)
-    return Output(risk=risk, energy_curve=energy, plan=plan, meeting_hygiene=hygiene,
-                  comm_triage=triage, wellbeing=wb, efficiency_recommendations=efficiency,
-                  ics_calendar=ics, coach_message=coach, rag_advice=rag_advice, fatigue_load=fatigue_load)
+    fused = FUSED_LLM if fused is None else fused
+    store = get_analysis_store()
+    if not COALESCE and store is None:
+        return await _analyze(snap, None, http, fused, on_event, track_trend)
+    hashes = snapshot_hashes(snap)
+    # события частей получает только свой вызывающий, поэтому потоковый анализ не объединяется
+    if not COALESCE or on_event is not None:
+        return await _analyze(snap, hashes, http, fused, on_event, track_trend)
+    # Ожидающие получают тот же объект Output, что и запустивший анализ
+    return await _flight.do((hashes[0], fused, track_trend),
+                            lambda: _analyze(snap, hashes, http, fused, track_trend=track_trend))
+
+
+async def _analyze(snap: Snapshot, hashes: Tuple[str, Dict[str, str]] | None, http: httpx.AsyncClient | None,
+                   fused: bool, on_event: OnEvent | None = None, track_trend: bool = True) -> Output:
+    def emit(name: str, value: Any) -> None:
+        if on_event is not None:
+            on_event(name, value)
+
+    store = get_analysis_store()
+    prev = None
+    changed: Set[str] | None = None
+    if store is not None:
+        digest, sections = hashes
+        prev = await store_call(store, store.get, snap.user_id, snap.date)
+        # Тот же снапшот и все LLM-стадии тогда ответили — отдаём сохранённый результат
+        if prev is not None and prev.snapshot_hash == digest and set(STAGE_OUTPUT) <= set(prev.stages_ok):
+            record_store_hit("hit")
+            out = Output.model_validate(prev.output)
+            for name in Output.model_fields:
+                emit(name, getattr(out, name))
+            return out
+        changed = _changed(prev, sections)
+    # Без прошлого анализа prev is None и changed is None: всё считается заново
+    done = prev.output if prev is not None else {}
+
+    def stale(part: str) -> bool:
+        return _stale(changed, PART_SECTIONS[part])
+
+    f = compute_features(snap) if stale("features") else Features.model_validate(prev.features)
+    risk = compute_risk(f, snap.rec_history) if stale("risk") else RiskResult.model_validate(prev.risk)
+    trend = await update_trend_async(snap.user_id, snap.date, f, risk) if track_trend else None
+    if stale("energy_curve"):
+        curve = compute_energy(snap, f)
+        energy = curve.points()
+    else:
+        curve = energy = done["energy_curve"]
+    if stale("plan"):
+        plan = propose_plan(snap, f, risk, curve)
+        ics = to_ics(plan)
+    else:
+        plan, ics = done["plan"], done["ics_calendar"]
+    hygiene = meeting_hygiene(snap, f) if stale("meeting_hygiene") else done["meeting_hygiene"]
+    wb = wellbeing(snap, f, risk) if stale("wellbeing") else done["wellbeing"]
+    for name, value in (("risk", risk), ("trend", trend), ("energy_curve", energy), ("plan", plan),
+                        ("ics_calendar", ics), ("meeting_hygiene", hygiene), ("wellbeing", wb)):
+        emit(name, value)
+
+    hf = HFClient(http=http)
+    rag = RAGAssistant(hf=hf)
+    res: Dict[str, Any] = _reusable(prev, changed)
+    if "comm_triage" in res:
+        # саммари входящих — из прошлого анализа, счётчики и действия — по текущим comms
+        triage = comm_triage_rules(snap, f)
+        triage.inbox_summary = res["comm_triage"].get("inbox_summary")
+        triage.inbox_priority = res["comm_triage"].get("inbox_priority")
+        res["comm_triage"] = triage
+    for name, value in res.items():
+        emit(STAGE_OUTPUT[name], value)
+    if store is not None:
+        record_store_hit("miss" if prev is None else "partial")
+    failed: Set[str] = set()
+    # общий дедлайн на все LLM-стадии: объединённый вызов и досчёт отдельных стадий делят один бюджет
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + TOTAL_DEADLINE
+    if fused and hf.token and len(res) < len(STAGE_OUTPUT):
+        fused_res = await run_stages([
+            Stage("fused", lambda: fused_llm_analysis(snap, f, risk, hf, rag.local_advice(snap, f, risk)), dict),
+        ], total_timeout=TOTAL_DEADLINE, failed=failed)
+        for name, value in fused_res["fused"].items():
+            if name not in res:
+                res[name] = value
+                emit(STAGE_OUTPUT[name], value)
+
+    # LLM-стадии не зависят друг от друга — запускаем их конкурентно
+    # (в объединённом режиме — только те, что не удалось разобрать из общего ответа)
+    stages = [
+        Stage("comm_triage", lambda: comm_triage(snap, f, hf), lambda: comm_triage_rules(snap, f)),
+        Stage("efficiency", lambda: efficiency_analysis(snap, f, hf), efficiency_fallback),
+        Stage("fatigue_load", lambda: assess_fatigue_load_llm(snap, f, hf), fatigue_fallback),
+        Stage("rag_advice", lambda: rag.build_advice_async(snap, f, risk),
+              lambda: rag.local_advice(snap, f, risk)),
+        Stage("coach", lambda: LLMClient(http=http).coach(
+                  risk, f, on_delta=None if on_event is None else lambda d: emit("coach_message.delta", d)),
+              lambda: rule_based_coach(risk, f)),
+    ]
+    pending = [st for st in stages if st.name not in res]
+    if pending:
+        res.update(await run_stages(pending, total_timeout=max(0.0, deadline - loop.time()), failed=failed,
+                                    on_done=lambda name, value: emit(STAGE_OUTPUT[name], value)))
+    out = Output(risk=risk, energy_curve=energy, plan=plan, meeting_hygiene=hygiene,
+                 comm_triage=res["comm_triage"], wellbeing=wb, efficiency_recommendations=res["efficiency"],
+                 ics_calendar=ics, coach_message=res["coach"], rag_advice=res["rag_advice"],
+                 fatigue_load=res["fatigue_load"], trend=trend)
+    if store is not None:
+        await store_put(store, StoredAnalysis(
+            user_id=snap.user_id, date=snap.date, snapshot_hash=digest, sections=sections,
+            stages_ok=[name for name in STAGE_OUTPUT if name not in failed],
+            features=f.model_dump(), risk=risk.model_dump(), output=out.model_dump()))
+    return out
+
+
+def _run(coro: Awaitable[T]) -> T:
+    """asyncio.run для синхронных обёрток: пул соединений закрывается вместе с циклом."""
+    async def _main() -> T:
+        try:
+            return await coro
+        finally:
+            await close_http_client()
+    return asyncio.run(_main())
 
 
 def analyze(snapshot_dict: Dict[str, Any]) -> Dict[str, Any]:
-    import asyncio
-    return asyncio.run(analyze_async(snapshot_dict)).model_dump()
+    return _run(analyze_async(snapshot_dict)).model_dump()
 
 
-async def analyze_text_async(text: str, user_id: str = "user", tz: str | None = None) -> Output:
+async def analyze_text_async(text: str, user_id: str = "user", tz: str | None = None,
+                             http: httpx.AsyncClient | None = None) -> Output:
     from datetime import datetime
     from .models import WorkDay
 
@@ -60,26 +243,59 @@ async def analyze_text_async(text: str, user_id: str = "user", tz: str | None =
         persona=None,
         inbox_samples=[text],
     )
-    return await analyze_async(snapshot.model_dump())
+    # у текстового анализа нет реального дня пользователя (дата — сегодня, user_id обычно общий),
+    # поэтому он не попадает в скользящее состояние тренда
+    return await analyze_async(snapshot.model_dump(), http=http, track_trend=False)
 
 
 def analyze_text(text: str, user_id: str = "user", tz: str | None = None) -> Dict[str, Any]:
-    import asyncio
-    return asyncio.run(analyze_text_async(text, user_id=user_id, tz=tz)).model_dump()
+    return _run(analyze_text_async(text, user_id=user_id, tz=tz)).model_dump()
+
+# Сколько снапшотов батча анализируется одновременно.
+BATCH_CONCURRENCY = env_int("AGENT_BATCH_CONCURRENCY", 8)
 
-def analyze_batch(snapshots: list[Dict[str, Any]]) -> list[Dict[str, Any]]:
+
+async def analyze_batch_async(snapshots: Sequence[Dict[str, Any]], concurrency: int | None = None,
+                              on_progress: Callable[[int, int], None] | None = None,
+                              http: httpx.AsyncClient | None = None) -> List[Dict[str, Any]]:
+    """
+    Конкурентный анализ батча: не более concurrency снапшотов одновременно.
+    Порядок результатов совпадает с порядком входа; ошибка отдельного снапшота
+    не роняет батч — на его месте будет {"error": "..."}.
+    on_progress(done, total) вызывается после каждого завершённого снапшота.
+    """
+    total = len(snapshots)
+    results: List[Dict[str, Any]] = [{} for _ in range(total)]
+    limit = max(1, concurrency or BATCH_CONCURRENCY)
+    next_idx = 0
+    done = 0
+
+    async def worker() -> None:
+        nonlocal next_idx, done
+        while next_idx < total:
+            i = next_idx
+            next_idx += 1
+            try:
+                results[i] = (await analyze_async(snapshots[i], http=http)).model_dump()
+            except Exception as e:
+                results[i] = {"error": f"{type(e).__name__}: {e}"}
+            done += 1
+            if on_progress is not None:
+                on_progress(done, total)
+
+    await asyncio.gather(*(worker() for _ in range(min(limit, total))))
+    return results
+
+
+def analyze_batch(snapshots: list[Dict[str, Any]], concurrency: int | None = None,
+                  on_progress: Callable[[int, int], None] | None = None) -> list[Dict[str, Any]]:
     """
     Анализ массива снапшотов. Возвращает список результатов в том же порядке.
     """
-    import asyncio
-    async def _run_all():
-        outs = []
-        for s in snapshots:
-            outs.append(await analyze_async(s))
-        return outs
-    return [o.model_dump() for o in asyncio.run(_run_all())]
-
-def analyze_from_file(path: str):
+    return _run(analyze_batch_async(snapshots, concurrency=concurrency, on_progress=on_progress))
+
+
+def analyze_from_file(path: str, concurrency: int | None = None):
     """
     Загружает JSON из файла и:
     - если это объект (dict) — анализирует как один снапшот
@@ -90,9 +306,9 @@ def analyze_from_file(path: str):
     with open(path, "r", encoding="utf-8") as f:
         data = json.load(f)
     if isinstance(data, list):
-        return analyze_batch(data)
+        return analyze_batch(data, concurrency=concurrency)
     if isinstance(data, dict) and "snapshots" in data and isinstance(data["snapshots"], list):
-        return analyze_batch(data["snapshots"])
+        return analyze_batch(data["snapshots"], concurrency=concurrency)
     if isinstance(data, dict):
         return analyze(data)
     raise ValueError("Неподдерживаемый формат JSON: ожидался объект или массив")
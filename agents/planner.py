@@ -1,62 +1,96 @@
 from __future__ import annotations
-from typing import List, Dict, Any, Tuple
-from datetime import datetime, timedelta
-import numpy as np
+from typing import List, Dict, Any, Optional, Tuple
+import time
 from ics import Calendar, Event
 from .models import Snapshot, Features, RiskResult, PlanItem
-from .utils import to_dt, minutes, free_windows, slot_with_min_len, clamp
+from .utils import to_dt
+from .timeline import day_timeline
+from .intervals import IntervalSet
+from .energy import EnergyCurve
 
 
-def propose_plan(s: Snapshot, f: Features, risk: RiskResult, energy: List[Dict[str, Any]]) -> List[PlanItem]:
-    ws, we = to_dt(s.day.work_start), to_dt(s.day.work_end)
-    busy = [(to_dt(x.start), to_dt(x.end)) for x in s.schedule if x.type != "break"]
-    free = free_windows(ws, we, busy)
+def _place(occupied: IntervalSet, pref: int, length: int, lo: int, hi: int) -> Optional[int]:
+    """Ближайшее к pref начало свободного окна длиной length в [lo, hi) (при равенстве — более позднее)."""
+    after = occupied.first_gap(length, max(pref, lo), hi)
+    before = occupied.last_gap(length, lo, min(pref + length, hi))
+    if after is None or before is None:
+        return before if after is None else after
+    return after if after - pref <= pref - before else before
+
+
+def _with(occupied: IntervalSet, spans: List[Tuple[int, int]]) -> IntervalSet:
+    if not spans:
+        return occupied
+    starts, ends = zip(*spans)
+    return occupied.union(IntervalSet.from_intervals(starts, ends))
+
+
+def propose_plan(s: Snapshot, f: Features, risk: RiskResult,
+                 energy: EnergyCurve | List[Dict[str, Any]]) -> List[PlanItem]:
+    """
+    План дня без пересечений: пункты ставятся только в окна, свободные от событий расписания
+    и уже поставленных пунктов. Порядок: фокус-блоки, микропаузы в оставшихся окнах, затем пункты
+    с желаемым временем (дыхание, «не беспокоить», прогулка, вода, завершение дня) — в ближайшее
+    свободное окно; если места нет, пункт пропускается.
+    """
+    tl = day_timeline(s)
+    curve = energy if isinstance(energy, EnergyCurve) else EnergyCurve.from_points(tl, energy)
+    ws, we = tl.ws, tl.we
+    occupied = IntervalSet.from_intervals(tl.start, tl.end)
     micro_every = max(25, min(90, s.day.microbreak_minutes_every))
     micro_len = max(3, min(10, s.day.microbreak_len))
-    plan: List[PlanItem] = []
-
-    for s0, e0 in free:
-        cursor = s0 + timedelta(minutes=micro_every)
-        while cursor + timedelta(minutes=micro_len) <= e0:
-            plan.append(PlanItem(start=cursor.isoformat(),
-                                 end=(cursor+timedelta(minutes=micro_len)).isoformat(),
-                                 kind="microbreak", title="Микропауза",
-                                 reason=f"Каждые {micro_every} мин — {micro_len}-мин отдых"))
-            cursor += timedelta(minutes=micro_every)
 
-    def avg_energy(a: datetime, b: datetime) -> float:
-        vals = [p["energy"] for p in energy if to_dt(p["ts"]) >= a and to_dt(p["ts"]) <= b]
-        return float(np.mean(vals)) if vals else 0.0
+    # фокус-блоки и микропаузы ставятся в заранее известные окна и не пересекаются между собой —
+    # добавляются в занятое одним слиянием на группу
+    focus: List[PlanItem] = []
+    spans: List[Tuple[int, int]] = []
+    for s0, e0 in [(a, b) for a, b in occupied.complement(ws, we) if (b - a) // 60 >= 75][:3]:
+        if curve.mean(s0, e0) >= 0.65:
+            dur = min(90, (e0 - s0) // 60)
+            focus.append(PlanItem(start=tl.iso(s0), end=tl.iso(s0 + dur * 60),
+                                  kind="focus", title="Фокус-блок",
+                                  reason="Окно высокой энергии; уменьшаем фрагментацию"))
+            spans.append((s0, s0 + dur * 60))
+    occupied = _with(occupied, spans)
 
-    for s0, e0 in slot_with_min_len(free, 75)[:3]:
-        if avg_energy(s0, e0) >= 0.65:
-            dur = min(90, minutes(e0 - s0))
-            plan.append(PlanItem(start=s0.isoformat(), end=(s0+timedelta(minutes=dur)).isoformat(),
-                                 kind="focus", title="Фокус-блок",
-                                 reason="Окно высокой энергии; уменьшаем фрагментацию"))
+    micro: List[PlanItem] = []
+    spans = []
+    for s0, e0 in occupied.complement(ws, we):
+        cursor = s0 + micro_every * 60
+        while cursor + micro_len * 60 <= e0:
+            micro.append(PlanItem(start=tl.iso(cursor),
+                                  end=tl.iso(cursor + micro_len * 60),
+                                  kind="microbreak", title="Микропауза",
+                                  reason=f"Каждые {micro_every} мин — {micro_len}-мин отдых"))
+            spans.append((cursor, cursor + micro_len * 60))
+            cursor += micro_every * 60
+    occupied = _with(occupied, spans)
 
+    # (желаемое начало, длительность в минутах, kind, title, reason)
+    wanted: List[Tuple[int, int, str, str, str]] = []
     if risk.risk_score >= 70:
-        start_now = max(ws, datetime.utcnow())
-        plan += [
-            PlanItem(start=start_now.isoformat(), end=(start_now+timedelta(minutes=5)).isoformat(),
-                     kind="breathing", title="Дыхательная практика 4-7-8",
-                     reason="Высокий риск — снять напряжение"),
-            PlanItem(start=(ws+timedelta(minutes=90)).isoformat(), end=(ws+timedelta(minutes=110)).isoformat(),
-                     kind="no_notifications", title="Режим ‘Не беспокоить’ 20 мин",
-                     reason="Снижение переключений контекста")
+        wanted += [
+            (max(ws, int(time.time())), 5, "breathing", "Дыхательная практика 4-7-8",
+             "Высокий риск — снять напряжение"),
+            (ws + 90 * 60, 20, "no_notifications", "Режим ‘Не беспокоить’ 20 мин",
+             "Снижение переключений контекста"),
         ]
     elif risk.risk_score >= 40:
-        plan.append(PlanItem(start=(ws+timedelta(minutes=120)).isoformat(), end=(ws+timedelta(minutes=135)).isoformat(),
-                             kind="walk", title="Прогулка 15 мин",
-                             reason="Средний риск — добавим активность"))
+        wanted.append((ws + 120 * 60, 15, "walk", "Прогулка 15 мин", "Средний риск — добавим активность"))
+    wanted.append((ws + 30 * 60, 5, "hydrate", "Пауза на воду", "Профилактика усталости"))
+    wanted.append((we - 20 * 60, 15, "winddown", "Завершение дня", "Итоги, план на завтра"))
 
-    plan.append(PlanItem(start=(ws+timedelta(minutes=30)).isoformat(), end=(ws+timedelta(minutes=35)).isoformat(),
-                         kind="hydrate", title="Пауза на воду", reason="Профилактика усталости"))
-    plan.append(PlanItem(start=(we-timedelta(minutes=20)).isoformat(), end=(we-timedelta(minutes=5)).isoformat(),
-                         kind="winddown", title="Завершение дня", reason="Итоги, план на завтра"))
+    placed: List[PlanItem] = []
+    for pref, dur, kind, title, reason in wanted:
+        t = _place(occupied, pref, dur * 60, ws, we)
+        if t is None:
+            continue
+        occupied.add(t, t + dur * 60)
+        placed.append(PlanItem(start=tl.iso(t), end=tl.iso(t + dur * 60), kind=kind, title=title, reason=reason))
 
+    plan = micro + focus + placed
     if f.meet_ratio >= 0.6 or f.back_to_back_count >= 3:
-        plan.append(PlanItem(start=ws.isoformat(), end=we.isoformat(),
+        plan.append(PlanItem(start=tl.iso(ws), end=tl.iso(we),
                              kind="reschedule_hint", title="Сгруппировать/сократить встречи",
                              reason="Встречи >60% дня или много b2b"))
     return plan
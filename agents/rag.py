@@ -1,11 +1,24 @@
 from __future__ import annotations
-from typing import List, Tuple, Dict, Any
+from typing import List, Tuple, Dict, Any, Iterator, Optional, Sequence
 import os
+import time
+import hashlib
+import threading
 from dataclasses import dataclass
 from collections import Counter
+from contextlib import contextmanager
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
 
 from .models import Snapshot, Features, RiskResult, RAGAdvice
-from .hf_client import HFClient
+from .hf_client import HFClient, post_chat, post_chat_sync
+from .http_pool import get_sync_http_client
+from .rag_index import InvertedIndex, ChunkTable, write_index, read_header, read_index
+from .utils import env_float, rss_mb
 
 
 def _tokenize(text: str) -> List[str]:
@@ -29,71 +42,365 @@ def _cosine_sim(a: Counter, b: Counter) -> float:
 @dataclass
 class _DocChunk:
     text: str
-    tokens: Counter
+    tokens: Optional[Counter]
     source: str
 
 
-class RAGAssistant:
-    def __init__(self, base_dir: str | None = None) -> None:
-        self.base_dir = base_dir or os.path.dirname(__file__)
-        self.chunks: List[_DocChunk] = []
-        self._load_corpus()
-
-    def _load_corpus(self) -> None:
-        kb_dir = os.path.join(self.base_dir, "knowledge")
-        paths: List[Tuple[str, str]] = []
-        if os.path.isdir(kb_dir):
-            for name in os.listdir(kb_dir):
-                if name.endswith(".md") or name.endswith(".txt"):
-                    paths.append((os.path.join(kb_dir, name), name))
-        if not paths:
-            default_text = (
-                "Идеи, как разбавить рабочий день:\n"
-                "- Короткая прогулка 10–15 минут между блоками концентрации.\n"
-                "- 5 минут растяжки или гимнастики для шеи и спины.\n"
-                "- Осознанный перерыв без экрана: чай, вода, несколько глубоких вдохов.\n"
-                "- Мини-сессия планирования: записать три приоритета на оставшееся время.\n"
-                "- Небольшое творческое занятие: скетч, чтение нескольких страниц книги.\n"
-                "Баланс будней:\n"
-                "- Запланировать хотя бы одно приятное личное занятие в середине дня.\n"
-                "- Выделить «окно без уведомлений» для глубокой работы.\n"
-                "- Вечером подвести итоги дня и выбрать один микро-шаг на завтра.\n"
-            )
-            tokens = Counter(_tokenize(default_text))
-            self.chunks = [_DocChunk(text=default_text, tokens=tokens, source="builtin")]
+_BUILTIN_TEXT = (
+    "Идеи, как разбавить рабочий день:\n"
+    "- Короткая прогулка 10–15 минут между блоками концентрации.\n"
+    "- 5 минут растяжки или гимнастики для шеи и спины.\n"
+    "- Осознанный перерыв без экрана: чай, вода, несколько глубоких вдохов.\n"
+    "- Мини-сессия планирования: записать три приоритета на оставшееся время.\n"
+    "- Небольшое творческое занятие: скетч, чтение нескольких страниц книги.\n"
+    "Баланс будней:\n"
+    "- Запланировать хотя бы одно приятное личное занятие в середине дня.\n"
+    "- Выделить «окно без уведомлений» для глубокой работы.\n"
+    "- Вечером подвести итоги дня и выбрать один микро-шаг на завтра.\n"
+)
+
+# Как часто (в секундах) проверять mtime файлов базы знаний.
+RELOAD_INTERVAL = env_float("RAG_RELOAD_INTERVAL", 5.0)
+# Имя бинарного индекса внутри каталога knowledge (переопределяется RAG_INDEX_PATH).
+INDEX_FILE = ".rag_index.bin"
+
+
+def _split_chunks(content: str, source: str) -> List[_DocChunk]:
+    chunks: List[_DocChunk] = []
+    for block in content.split("\n\n"):
+        block_clean = block.strip()
+        if not block_clean:
+            continue
+        tokens = Counter(_tokenize(block_clean))
+        if not tokens:
+            continue
+        chunks.append(_DocChunk(text=block_clean, tokens=tokens, source=source))
+    return chunks
+
+
+class _MappedChunks(Sequence[_DocChunk]):
+    """Чанки поверх отображённой в память таблицы; тексты декодируются по обращению."""
+    def __init__(self, table: ChunkTable) -> None:
+        self.table = table
+
+    def __len__(self) -> int:
+        return len(self.table)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[k] for k in range(*i.indices(len(self)))]
+        return _DocChunk(text=self.table.text(i), tokens=None, source=self.table.source(i))
+
+
+@dataclass(frozen=True)
+class _CorpusIndex:
+    """Неизменяемый снимок проиндексированного корпуса; подменяется целиком."""
+    chunks: Sequence[_DocChunk]
+    engine: InvertedIndex
+
+    @classmethod
+    def build(cls, chunks: Tuple[_DocChunk, ...]) -> "_CorpusIndex":
+        return cls(chunks=chunks, engine=InvertedIndex.build([ch.tokens for ch in chunks]))
+
+
+@dataclass
+class _FileEntry:
+    stat: Tuple[int, int]
+    digest: str
+    chunks: Optional[List[_DocChunk]]  # None — чанки лежат только в файле индекса
+    part: Optional[InvertedIndex] = None  # индекс чанков файла; из частей собирается индекс корпуса
+
+
+def _file_entry(stat: Tuple[int, int], digest: str, content: str, name: str) -> _FileEntry:
+    chunks = _split_chunks(content, name)
+    part = InvertedIndex.build([c.tokens for c in chunks])
+    # счётчики слов нужны только для индекса: без них куча меньше, и полный проход GC не тормозит запросы
+    for c in chunks:
+        c.tokens = None
+    return _FileEntry(stat=stat, digest=digest, chunks=chunks, part=part)
+
+
+@contextmanager
+def _file_lock(index_path: str) -> Iterator[None]:
+    """Межпроцессная блокировка пересборки файла индекса (без fcntl — только атомарная запись)."""
+    if fcntl is None:
+        yield
+        return
+    with open(index_path + ".lock", "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _read_file(path: str) -> Optional[str]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+class _Corpus:
+    """
+    Корпус базы знаний на время жизни процесса.
+    При старте, если рядом лежит актуальный бинарный индекс (см. agents.rag_build),
+    он открывается через mmap; иначе корпус индексируется в памяти.
+    Запросы только читают текущий снимок (index()); проверка файлов и пересборка идут в фоновом
+    потоке (start_reloader, раз в RELOAD_INTERVAL секунд): перечитываются только изменённые файлы
+    (если содержимое по хэшу не изменилось — чанки переиспользуются), индекс корпуса склеивается
+    из индексов файлов и атомарно подменяется — запросы, уже получившие снимок, дочитывают старый.
+    """
+    def __init__(self, base_dir: str) -> None:
+        self.kb_dir = os.path.join(base_dir, "knowledge")
+        self.index_path = os.getenv("RAG_INDEX_PATH") or os.path.join(self.kb_dir, INDEX_FILE)
+        self._files: Dict[str, _FileEntry] = {}
+        self._lock = threading.Lock()
+        self._index = _CorpusIndex.build(())
+        # Если файл индекса есть, корпус всегда обслуживается из него: изменения пересобирают файл
+        self._file_mode = os.path.isfile(self.index_path)
+        self._reloader: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.stats: Dict[str, Any] = {}
+        if not self._load_mapped():
+            self.refresh(force=True)
+
+    def _names(self) -> List[str]:
+        if not os.path.isdir(self.kb_dir):
+            return []
+        return [n for n in os.listdir(self.kb_dir) if n.endswith(".md") or n.endswith(".txt")]
+
+    def _load_mapped(self) -> bool:
+        if not os.path.isfile(self.index_path):
+            return False
+        t0 = time.perf_counter()
+        try:
+            header, _ = read_header(self.index_path)
+            saved = header["meta"].get("files", {})
+            files: Dict[str, _FileEntry] = {}
+            for name in self._names():
+                st = os.stat(os.path.join(self.kb_dir, name))
+                info = saved.get(name)
+                if info is None or (info["mtime_ns"], info["size"]) != (st.st_mtime_ns, st.st_size):
+                    return False
+                files[name] = _FileEntry(stat=(st.st_mtime_ns, st.st_size), digest=info["sha1"], chunks=None)
+            if set(files) != set(saved):
+                return False
+            engine, table, meta = read_index(self.index_path)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"RAG index {self.index_path} not loaded: {e}")
+            return False
+        self._files = files
+        self._index = _CorpusIndex(chunks=_MappedChunks(table), engine=engine)
+        self.stats = {"mode": "mmap", "path": self.index_path, "chunks": len(table),
+                      "build_s": meta.get("build_s"), "load_s": round(time.perf_counter() - t0, 4)}
+        return True
+
+    def index(self) -> _CorpusIndex:
+        """Текущий снимок индекса; на пути запроса файлы не проверяются."""
+        return self._index
+
+    def start_reloader(self) -> None:
+        """Фоновая горячая перезагрузка (вызывается при старте приложения); RELOAD_INTERVAL <= 0 — выключена."""
+        if self._reloader is not None or RELOAD_INTERVAL <= 0:
             return
+        self._stop.clear()
+        self._reloader = threading.Thread(target=self._reload_loop, name="rag-reload", daemon=True)
+        self._reloader.start()
 
-        chunks: List[_DocChunk] = []
-        for path, name in paths:
+    def stop_reloader(self) -> None:
+        if self._reloader is None:
+            return
+        self._stop.set()
+        self._reloader.join(timeout=5)
+        self._reloader = None
+
+    def _reload_loop(self) -> None:
+        while not self._stop.wait(RELOAD_INTERVAL):
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"RAG reload failed: {type(e).__name__}: {e}")
+
+    def _scan(self, names: List[str]) -> Tuple[Dict[str, _FileEntry], bool]:
+        """Сверяет файлы с прошлой проверкой; изменённые перечитываются и индексируются."""
+        files: Dict[str, _FileEntry] = {}
+        changed = set(names) != set(self._files)
+        for name in names:
+            path = os.path.join(self.kb_dir, name)
             try:
-                with open(path, "r", encoding="utf-8") as f:
-                    content = f.read()
+                st = os.stat(path)
             except OSError:
+                changed = True
+                continue
+            stat = (st.st_mtime_ns, st.st_size)
+            prev = self._files.get(name)
+            if prev is not None and prev.stat == stat:
+                files[name] = prev
                 continue
-            for block in content.split("\n\n"):
-                block_clean = block.strip()
-                if not block_clean:
-                    continue
-                tokens = Counter(_tokenize(block_clean))
-                if not tokens:
-                    continue
-                chunks.append(_DocChunk(text=block_clean, tokens=tokens, source=name))
-        if chunks:
-            self.chunks = chunks
+            content = _read_file(path)
+            if content is None:
+                changed = True
+                continue
+            digest = hashlib.sha1(content.encode("utf-8")).hexdigest()
+            if prev is not None and prev.digest == digest:
+                files[name] = _FileEntry(stat=stat, digest=digest, chunks=prev.chunks, part=prev.part)
+                continue
+            files[name] = _file_entry(stat, digest, content, name)
+            changed = True
+        return files, changed
+
+    def _assemble(self, names: List[str], files: Dict[str, _FileEntry]) -> Tuple[InvertedIndex, ChunkTable]:
+        """
+        Индекс и таблица чанков для файла индекса: чанки неизменённых файлов берутся из текущего
+        отображённого индекса (без чтения и токенизации), изменённые — из их частей.
+        """
+        present = [n for n in names if n in files]
+        parts: List[InvertedIndex] = []
+        texts: List[str] = []
+        sources: List[str] = []
+        mapped = [n for n in present if files[n].part is None]
+        current = self._index
+        if mapped and isinstance(current.chunks, _MappedChunks):
+            table = current.chunks.table
+            ids = {src: i for i, src in enumerate(table.sources)}
+            keep = np.flatnonzero(np.isin(table.source_ids, [ids[n] for n in mapped if n in ids]))
+            parts.append(current.engine.take(keep))
+            texts.extend(table.text(i) for i in keep.tolist())
+            sources.extend(table.source(i) for i in keep.tolist())
+        for n in present:
+            entry = files[n]
+            if entry.part is not None:
+                parts.append(entry.part)
+                texts.extend(c.text for c in entry.chunks)
+                sources.extend(c.source for c in entry.chunks)
+        if not present:
+            parts = [InvertedIndex.build([Counter(_tokenize(_BUILTIN_TEXT))])]
+            texts, sources = [_BUILTIN_TEXT], ["builtin"]
+        return InvertedIndex.concat(parts), ChunkTable.build(texts, sources)
+
+    @staticmethod
+    def _meta(files: Dict[str, _FileEntry], t0: float) -> Dict[str, Any]:
+        return {
+            "files": {n: {"mtime_ns": e.stat[0], "size": e.stat[1], "sha1": e.digest} for n, e in files.items()},
+            "build_s": round(time.perf_counter() - t0, 4),
+        }
+
+    def refresh(self, force: bool = False) -> bool:
+        """Пересобирает индекс при изменениях. Возвращает True, если индекс подменён."""
+        if not self._lock.acquire(blocking=force):
+            return False
+        try:
+            t0 = time.perf_counter()
+            names = self._names()
+            files, changed = self._scan(names)
+            if not (changed or force):
+                self._files = files
+                return False
+            if self._file_mode:
+                return self._rebuild_file(names, files, t0)
+            present = [name for name in names if name in files]
+            if present:
+                chunks = tuple(ch for name in present for ch in files[name].chunks)
+                # индексируются только изменённые файлы, остальные части переиспользуются
+                index = _CorpusIndex(chunks=chunks, engine=InvertedIndex.concat([files[n].part for n in present]))
+            else:
+                index = _CorpusIndex.build(
+                    (_DocChunk(text=_BUILTIN_TEXT, tokens=Counter(_tokenize(_BUILTIN_TEXT)), source="builtin"),))
+            self._files = files
+            self._index = index
+            self.stats = {"mode": "memory", "path": None, "chunks": len(index.chunks),
+                          "build_s": round(time.perf_counter() - t0, 4), "load_s": None}
+            return True
+        finally:
+            self._lock.release()
+
+    def _rebuild_file(self, names: List[str], files: Dict[str, _FileEntry], t0: float) -> bool:
+        """
+        Корпус с файлом индекса: файл пересобирается один раз на изменение (под межпроцессной
+        блокировкой), и все воркеры заново открывают его через mmap. Если файл уже пересобран
+        другим воркером — он просто открывается.
+        """
+        engine: Optional[InvertedIndex] = None
+        try:
+            with _file_lock(self.index_path):
+                if self._load_mapped():
+                    return True
+                engine, table = self._assemble(names, files)
+                meta = self._meta(files, t0)
+                write_index(self.index_path, engine, table, meta)
+                if self._load_mapped():
+                    return True
+        except OSError as e:
+            print(f"RAG index {self.index_path} not rebuilt: {e}")
+        # Файл не записан или уже устарел (файлы снова изменились) — пока отвечаем из собранного
+        # в памяти индекса; следующая проверка снова пересоберёт файл
+        if engine is None:
+            engine, table = self._assemble(names, files)
+        self._files = {n: _FileEntry(stat=e.stat, digest=e.digest, chunks=None) for n, e in files.items()}
+        self._index = _CorpusIndex(chunks=_MappedChunks(table), engine=engine)
+        self.stats = {"mode": "memory", "path": None, "chunks": len(table),
+                      "build_s": round(time.perf_counter() - t0, 4), "load_s": None}
+        return True
+
+    def write(self, path: str | None = None) -> Dict[str, Any]:
+        """Сохраняет текущий индекс в бинарный файл для загрузки через mmap."""
+        t0 = time.perf_counter()
+        with self._lock:
+            names = self._names()
+            files, _ = self._scan(names)
+            engine, table = self._assemble(names, files)
+            meta = self._meta(files, t0)
+        path = path or self.index_path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        write_index(path, engine, table, meta)
+        return {"path": path, "chunks": len(table), "terms": len(engine.vocab),
+                "bytes": os.path.getsize(path), "build_s": meta["build_s"]}
+
+
+_CORPORA: Dict[str, _Corpus] = {}
+_CORPORA_LOCK = threading.Lock()
+
+
+def get_corpus(base_dir: str | None = None) -> _Corpus:
+    """Общий на процесс корпус для каталога base_dir (по умолчанию — пакет agents)."""
+    key = os.path.abspath(base_dir or os.path.dirname(__file__))
+    corpus = _CORPORA.get(key)
+    if corpus is None:
+        with _CORPORA_LOCK:
+            corpus = _CORPORA.get(key)
+            if corpus is None:
+                corpus = _CORPORA[key] = _Corpus(key)
+    return corpus
+
+
+def index_stats() -> Dict[str, Any]:
+    """Время сборки/загрузки индекса RAG и RSS текущего воркера."""
+    stats = dict(get_corpus().stats)
+    stats["pid"] = os.getpid()
+    stats["rss_mb"] = rss_mb()
+    return stats
+
+
+class RAGAssistant:
+    def __init__(self, base_dir: str | None = None, hf: HFClient | None = None) -> None:
+        self.base_dir = base_dir or os.path.dirname(__file__)
+        self.hf = hf or HFClient()
+        self.corpus = get_corpus(self.base_dir)
+
+    @property
+    def chunks(self) -> List[_DocChunk]:
+        return list(self.corpus.index().chunks)
 
     def retrieve(self, query: str, top_k: int = 3) -> List[_DocChunk]:
-        if not self.chunks:
+        index = self.corpus.index()
+        if not index.chunks:
             return []
         q_tokens = Counter(_tokenize(query))
-        scored: List[Tuple[float, _DocChunk]] = []
-        for ch in self.chunks:
-            score = _cosine_sim(q_tokens, ch.tokens)
-            if score > 0:
-                scored.append((score, ch))
-        scored.sort(key=lambda x: x[0], reverse=True)
-        return [c for _, c in scored[:top_k]]
+        return [index.chunks[i] for i in index.engine.top_k(q_tokens, top_k)]
 
-    def build_advice(self, snapshot: Snapshot, features: Features, risk: RiskResult) -> RAGAdvice:
+    def _day_query(self, snapshot: Snapshot, features: Features, risk: RiskResult) -> str:
         day_desc: List[str] = [
             f"Рабочее время: {features.work_minutes // 60}ч {features.work_minutes % 60}мин",
             f"Встречи: {features.meeting_minutes}мин ({features.meet_ratio * 100:.0f}% дня)",
@@ -117,14 +424,24 @@ class RAGAssistant:
             if vals:
                 day_desc.append("Самочувствие: " + ", ".join(vals))
 
-        query = ". ".join(day_desc)
+        return ". ".join(day_desc)
+
+    def local_advice(self, snapshot: Snapshot, features: Features, risk: RiskResult) -> RAGAdvice:
+        """Советы только из базы знаний, без обращения к модели."""
+        chunks = self.retrieve(self._day_query(snapshot, features, risk), top_k=6)
+        return RAGAdvice(suggestions=[c.text for c in chunks], sources=[c.source for c in chunks] if chunks else None)
+
+    def _prepare(self, snapshot: Snapshot, features: Features, risk: RiskResult) -> Tuple[RAGAdvice, Dict[str, Any] | None]:
+        """Ретрив из базы знаний и payload для модели (None, если модель не нужна)."""
+        query = self._day_query(snapshot, features, risk)
         chunks = self.retrieve(query, top_k=6)
         base_suggestions = [c.text for c in chunks] if chunks else []
         sources = [c.source for c in chunks] if chunks else None
+        base = RAGAdvice(suggestions=base_suggestions, sources=sources)
 
-        hf = HFClient()
+        hf = self.hf
         if not hf.token or not base_suggestions:
-            return RAGAdvice(suggestions=base_suggestions, sources=sources)
+            return base, None
 
         context = "\n\n".join(base_suggestions)
         prompt = (
@@ -135,12 +452,6 @@ class RAGAssistant:
             "Верни только список советов, по одному на строку, без лишнего текста."
         )
 
-        import httpx, os
-        headers = {
-            "Authorization": f"Bearer {hf.token}",
-            "Content-Type": "application/json",
-            "HTTP-Referer": "https://github.com/your-repo",
-        }
         payload = {
             "model": hf.model,
             "messages": [
@@ -149,24 +460,28 @@ class RAGAssistant:
             "temperature": 0.4,
             "max_tokens": 300,
         }
+        return base, payload
 
-        try:
-            with httpx.Client(timeout=60) as c:
-                r = c.post(
-                    f"{hf.base_url}/chat/completions",
-                    headers=headers,
-                    json=payload
-                )
-                r.raise_for_status()
-                data = r.json()
-                if isinstance(data, dict) and "choices" in data and data["choices"]:
-                    content = data["choices"][0]["message"].get("content", "")
-                    lines = [ln.strip("-• ").strip() for ln in content.splitlines() if ln.strip()]
-                    if lines:
-                        return RAGAdvice(suggestions=lines, sources=sources)
-        except Exception:
-            return RAGAdvice(suggestions=base_suggestions, sources=sources)
-
-        return RAGAdvice(suggestions=base_suggestions, sources=sources)
+    @staticmethod
+    def _finish(base: RAGAdvice, content: str) -> RAGAdvice:
+        lines = [ln.strip("-• ").strip() for ln in content.splitlines() if ln.strip()]
+        if lines:
+            return RAGAdvice(suggestions=lines, sources=base.sources)
+        return base
 
+    def build_advice(self, snapshot: Snapshot, features: Features, risk: RiskResult) -> RAGAdvice:
+        """Синхронный вариант для CLI; в event loop используйте build_advice_async."""
+        base, payload = self._prepare(snapshot, features, risk)
+        if payload is None:
+            return base
+        hf = self.hf
+        content = post_chat_sync(get_sync_http_client(), hf.base_url, hf.token, payload, timeout=60, label="rag")
+        return self._finish(base, content)
 
+    async def build_advice_async(self, snapshot: Snapshot, features: Features, risk: RiskResult) -> RAGAdvice:
+        base, payload = self._prepare(snapshot, features, risk)
+        if payload is None:
+            return base
+        hf = self.hf
+        content = await post_chat(hf.http, hf.base_url, hf.token, payload, timeout=60, label="rag")
+        return self._finish(base, content)
@@ -0,0 +1,26 @@
+"""
+Сборка бинарного индекса базы знаний для загрузки через mmap.
+
+Использование:
+  python -m agents.rag_build                 # agents/knowledge -> agents/knowledge/.rag_index.bin
+  python -m agents.rag_build --base-dir DIR  # DIR/knowledge
+  python -m agents.rag_build --out PATH
+"""
+from __future__ import annotations
+import argparse
+import json
+
+from .rag import get_corpus
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Сборка RAG-индекса")
+    ap.add_argument("--base-dir", default=None, help="каталог, содержащий knowledge/")
+    ap.add_argument("--out", default=None, help="путь к файлу индекса")
+    args = ap.parse_args()
+    info = get_corpus(args.base_dir).write(args.out)
+    print(json.dumps(info, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+from __future__ import annotations
+from typing import Any, Dict, List, Sequence, Tuple
+from collections import Counter
+import json
+import os
+import struct
+import numpy as np
+
+
+MAGIC = b"RAGIDX01"
+_ALIGN = 64
+
+
+class InvertedIndex:
+    """
+    Инвертированный индекс корпуса для косинусного ретрива.
+    Постинги хранятся как CSR по терминам (term_ptr/term_docs/term_vals), нормы чанков
+    посчитаны заранее; запрос складывает постинги своих терминов через np.bincount
+    и выбирает top-k через argpartition.
+    """
+    def __init__(self, vocab: Dict[str, int], term_ptr: np.ndarray, term_docs: np.ndarray,
+                 term_vals: np.ndarray, doc_norms: np.ndarray) -> None:
+        self.vocab = vocab
+        self.term_ptr = term_ptr
+        self.term_docs = term_docs
+        self.term_vals = term_vals
+        self.doc_norms = doc_norms
+
+    @property
+    def n_docs(self) -> int:
+        return int(self.doc_norms.shape[0])
+
+    @classmethod
+    def build(cls, docs: Sequence[Counter]) -> "InvertedIndex":
+        vocab: Dict[str, int] = {}
+        postings: List[List[int]] = []
+        values: List[List[int]] = []
+        norms = np.empty(len(docs), dtype=np.float64)
+        for d, tokens in enumerate(docs):
+            for tok, cnt in tokens.items():
+                t = vocab.get(tok)
+                if t is None:
+                    t = vocab[tok] = len(postings)
+                    postings.append([])
+                    values.append([])
+                postings[t].append(d)
+                values[t].append(cnt)
+            # та же формула, что и в _cosine_sim, чтобы скоры совпадали
+            norms[d] = sum(v * v for v in tokens.values()) ** 0.5
+        lengths = np.fromiter((len(p) for p in postings), dtype=np.int64, count=len(postings))
+        term_ptr = np.zeros(len(postings) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=term_ptr[1:])
+        nnz = int(term_ptr[-1])
+        term_docs = np.fromiter((d for p in postings for d in p), dtype=np.int32, count=nnz)
+        term_vals = np.fromiter((v for vs in values for v in vs), dtype=np.int32, count=nnz)
+        return cls(vocab, term_ptr, term_docs, term_vals, norms)
+
+    def tokens(self) -> List[str]:
+        """Термины в порядке номеров (словарь всегда заполняется в этом порядке)."""
+        return list(self.vocab)
+
+    def _postings(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Постинги в виде троек (термин, чанк, вес), отсортированных по термину."""
+        terms = np.repeat(np.arange(len(self.vocab), dtype=np.int64), np.diff(self.term_ptr))
+        return terms, np.asarray(self.term_docs, dtype=np.int64), np.asarray(self.term_vals)
+
+    @classmethod
+    def _from_postings(cls, vocab: Dict[str, int], terms: np.ndarray, docs: np.ndarray, vals: np.ndarray,
+                       norms: np.ndarray) -> "InvertedIndex":
+        order = np.argsort(terms, kind="stable")
+        term_ptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(terms, minlength=len(vocab)), out=term_ptr[1:])
+        return cls(vocab, term_ptr, docs[order].astype(np.int32), vals[order].astype(np.int32),
+                   np.asarray(norms, dtype=np.float64))
+
+    @classmethod
+    def concat(cls, parts: Sequence["InvertedIndex"]) -> "InvertedIndex":
+        """
+        Индекс корпуса из индексов его частей (чанки частей идут подряд): словари объединяются,
+        постинги перенумеровываются и склеиваются без повторной токенизации.
+        """
+        if not parts:
+            return cls.build([])
+        vocab: Dict[str, int] = {}
+        terms, docs, vals = [], [], []
+        offset = 0
+        for p in parts:
+            # по частям: пересборка идёт в фоновом потоке и не должна надолго занимать GIL
+            toks = p.tokens()
+            new = [tok for tok in toks if tok not in vocab]
+            vocab.update(zip(new, range(len(vocab), len(vocab) + len(new))))
+            remap = np.fromiter(map(vocab.__getitem__, toks), dtype=np.int64, count=len(toks))
+            t, d, v = p._postings()
+            terms.append(remap[t])
+            docs.append(d + offset)
+            vals.append(v)
+            offset += p.n_docs
+        return cls._from_postings(vocab, np.concatenate(terms), np.concatenate(docs), np.concatenate(vals),
+                                  np.concatenate([np.asarray(p.doc_norms) for p in parts]))
+
+    def take(self, keep: np.ndarray) -> "InvertedIndex":
+        """Подындекс из чанков keep (номера по возрастанию): чанки перенумеровываются, пустые термины отбрасываются."""
+        newid = np.full(self.n_docs, -1, dtype=np.int64)
+        newid[keep] = np.arange(keep.size)
+        terms, docs, vals = self._postings()
+        docs = newid[docs]
+        m = docs >= 0
+        terms, docs, vals = terms[m], docs[m], vals[m]
+        used = np.unique(terms)
+        remap = np.zeros(len(self.vocab), dtype=np.int64)
+        remap[used] = np.arange(used.size)
+        toks = self.tokens()
+        vocab = dict(zip(map(toks.__getitem__, used.tolist()), range(used.size)))
+        return self._from_postings(vocab, remap[terms], docs, vals, np.asarray(self.doc_norms)[keep])
+
+    def scores(self, query: Counter) -> np.ndarray:
+        """Косинусная близость запроса ко всем чанкам (0 для чанков без общих терминов)."""
+        n = self.n_docs
+        if not query or n == 0:
+            return np.zeros(n, dtype=np.float64)
+        q_norm = sum(v * v for v in query.values()) ** 0.5
+        docs, weights = [], []
+        for tok, cnt in query.items():
+            t = self.vocab.get(tok)
+            if t is None:
+                continue
+            lo, hi = self.term_ptr[t], self.term_ptr[t + 1]
+            docs.append(self.term_docs[lo:hi])
+            weights.append(self.term_vals[lo:hi] * cnt)
+        if not docs:
+            return np.zeros(n, dtype=np.float64)
+        num = np.bincount(np.concatenate(docs), weights=np.concatenate(weights), minlength=n)
+        denom = self.doc_norms * q_norm
+        out = np.zeros(n, dtype=np.float64)
+        np.divide(num, denom, out=out, where=(num > 0) & (denom > 0))
+        return out
+
+    def top_k(self, query: Counter, k: int) -> np.ndarray:
+        """
+        Индексы k лучших чанков по убыванию скора; при равенстве — в порядке корпуса
+        (как у стабильной сортировки). Чанки с нулевым скором не возвращаются.
+        """
+        if k <= 0:
+            return np.empty(0, dtype=np.int64)
+        scores = self.scores(query)
+        cand = np.flatnonzero(scores > 0)
+        if cand.size > k:
+            cs = scores[cand]
+            thr = cs[np.argpartition(-cs, k - 1)[:k]].min()
+            above = cand[cs > thr]
+            ties = cand[cs == thr][: k - above.size]
+            cand = np.concatenate([above, ties])
+        order = np.lexsort((cand, -scores[cand]))
+        return cand[order]
+
+
+class ChunkTable:
+    """Тексты и источники чанков: непрерывный utf-8 блоб + смещения (для mmap без копий)."""
+    def __init__(self, text_ptr: np.ndarray, text_blob: np.ndarray, source_ids: np.ndarray,
+                 sources: List[str]) -> None:
+        self.text_ptr = text_ptr
+        self.text_blob = text_blob
+        self.source_ids = source_ids
+        self.sources = sources
+
+    def __len__(self) -> int:
+        return int(self.source_ids.shape[0])
+
+    def text(self, i: int) -> str:
+        lo, hi = int(self.text_ptr[i]), int(self.text_ptr[i + 1])
+        return self.text_blob[lo:hi].tobytes().decode("utf-8")
+
+    def source(self, i: int) -> str:
+        return self.sources[int(self.source_ids[i])]
+
+    @classmethod
+    def build(cls, texts: Sequence[str], sources: Sequence[str]) -> "ChunkTable":
+        names: Dict[str, int] = {}
+        source_ids = np.fromiter((names.setdefault(s, len(names)) for s in sources), dtype=np.int32,
+                                 count=len(sources))
+        encoded = [t.encode("utf-8") for t in texts]
+        text_ptr = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=text_ptr[1:])
+        text_blob = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        return cls(text_ptr, text_blob, source_ids, list(names))
+
+
+def write_index(path: str, index: InvertedIndex, table: ChunkTable, meta: Dict[str, Any]) -> None:
+    """
+    Сохраняет индекс в бинарный файл:
+      MAGIC | u64 длина заголовка | JSON-заголовок | массивы, выровненные по 64 байта.
+    В заголовке — словарь терминов, имена источников, meta и смещения/типы массивов.
+    Запись атомарная (через временный файл).
+    """
+    arrays = {
+        "term_ptr": index.term_ptr, "term_docs": index.term_docs, "term_vals": index.term_vals,
+        "doc_norms": index.doc_norms, "text_ptr": table.text_ptr, "text_blob": table.text_blob,
+        "source_ids": table.source_ids,
+    }
+    vocab = [""] * len(index.vocab)
+    for tok, t in index.vocab.items():
+        vocab[t] = tok
+    header: Dict[str, Any] = {"version": 1, "meta": meta, "vocab": vocab, "sources": table.sources, "arrays": {}}
+
+    # Смещения зависят от длины заголовка, поэтому считаем их относительно начала данных
+    rel = 0
+    for name, arr in arrays.items():
+        rel = -(-rel // _ALIGN) * _ALIGN
+        header["arrays"][name] = {"offset": rel, "dtype": arr.dtype.str, "shape": list(arr.shape)}
+        rel += arr.nbytes
+    head = json.dumps(header, ensure_ascii=False).encode("utf-8")
+    data_start = -(-(len(MAGIC) + 8 + len(head)) // _ALIGN) * _ALIGN
+
+    tmp = f"{path}.tmp{os.getpid()}"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<Q", len(head)))
+        f.write(head)
+        for name, arr in arrays.items():
+            f.seek(data_start + header["arrays"][name]["offset"])
+            f.write(np.ascontiguousarray(arr).tobytes())
+    os.replace(tmp, path)
+
+
+def read_header(path: str) -> Tuple[Dict[str, Any], int]:
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path}: не файл RAG-индекса")
+        (n,) = struct.unpack("<Q", f.read(8))
+        header = json.loads(f.read(n).decode("utf-8"))
+    data_start = -(-(len(MAGIC) + 8 + n) // _ALIGN) * _ALIGN
+    return header, data_start
+
+
+def read_index(path: str) -> Tuple[InvertedIndex, ChunkTable, Dict[str, Any]]:
+    """
+    Открывает индекс через np.memmap: массивы не копируются в память процесса,
+    страницы файла делятся между воркерами через page cache.
+    """
+    header, data_start = read_header(path)
+    arrs: Dict[str, np.ndarray] = {}
+    for name, spec in header["arrays"].items():
+        shape = tuple(spec["shape"])
+        if int(np.prod(shape)) == 0:
+            arrs[name] = np.zeros(shape, dtype=np.dtype(spec["dtype"]))
+            continue
+        arrs[name] = np.memmap(path, dtype=np.dtype(spec["dtype"]), mode="r",
+                               offset=data_start + spec["offset"], shape=shape)
+    vocab = {tok: t for t, tok in enumerate(header["vocab"])}
+    index = InvertedIndex(vocab, arrs["term_ptr"], arrs["term_docs"], arrs["term_vals"], arrs["doc_norms"])
+    table = ChunkTable(arrs["text_ptr"], arrs["text_blob"], arrs["source_ids"], header["sources"])
+    return index, table, header["meta"]
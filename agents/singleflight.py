@@ -0,0 +1,41 @@
+from __future__ import annotations
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple, TypeVar
+import asyncio
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    Объединение одинаковых одновременных вычислений: пока вычисление по ключу идёт,
+    повторные вызовы с тем же ключом не запускают своё, а ждут общее и получают тот же
+    результат (или то же исключение). Завершённые вычисления не кэшируются.
+    Отмена одного ожидающего (например, клиент отключился) не отменяет общее вычисление.
+    """
+    def __init__(self) -> None:
+        self._calls: Dict[Tuple[int, Hashable], asyncio.Future] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def _done(self, key: Tuple[int, Hashable], task: asyncio.Future) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # исключение забирается здесь, даже если все ожидающие уже отменены
+        if not task.cancelled():
+            task.exception()
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        # задачи привязаны к своему циклу событий: синхронные обёртки запускают отдельные циклы
+        full_key = (id(asyncio.get_running_loop()), key)
+        task = self._calls.get(full_key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[full_key] = task
+            task.add_done_callback(lambda t: self._done(full_key, t))
+            self.leaders += 1
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"leaders": self.leaders, "coalesced": self.coalesced, "in_flight": len(self._calls)}
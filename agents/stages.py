@@ -0,0 +1,82 @@
+from __future__ import annotations
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from dataclasses import dataclass
+from contextvars import ContextVar
+import asyncio
+from .utils import env_float
+
+
+# Таймаут одной стадии и общий дедлайн на все стадии анализа (секунды).
+STAGE_TIMEOUT = env_float("AGENT_STAGE_TIMEOUT", 60.0)
+TOTAL_DEADLINE = env_float("AGENT_TOTAL_DEADLINE", 90.0)
+
+
+# Отметки «результат без ответа модели» внутри текущей стадии (см. mark_degraded)
+_degraded: ContextVar[Optional[List[str]]] = ContextVar("stage_degraded", default=None)
+
+
+def mark_degraded(reason: str) -> None:
+    """
+    Стадия вернула результат, но без ответа модели (например, провайдер ответил ошибкой
+    и подставлен запасной текст). Такая стадия считается неуспешной: её результат не сохраняется
+    для переиспользования.
+    """
+    marks = _degraded.get()
+    if marks is not None:
+        marks.append(reason)
+
+
+@dataclass
+class Stage:
+    """
+    Независимая стадия пайплайна: корутина с результатом и детерминированный fallback,
+    который подставляется при таймауте или ошибке.
+    """
+    name: str
+    run: Callable[[], Awaitable[Any]]
+    fallback: Callable[[], Any]
+    timeout: Optional[float] = None
+
+
+async def _run_stage(stage: Stage, deadline: float) -> Tuple[Any, bool]:
+    loop = asyncio.get_running_loop()
+    timeout = STAGE_TIMEOUT if stage.timeout is None else stage.timeout
+    budget = min(deadline - loop.time(), timeout)
+    if budget <= 0:
+        return stage.fallback(), False
+    # gather запускает каждую стадию в своей задаче, так что отметки не смешиваются
+    marks: List[str] = []
+    _degraded.set(marks)
+    try:
+        res = await asyncio.wait_for(stage.run(), timeout=budget)
+        return res, not marks
+    except asyncio.TimeoutError:
+        print(f"Stage '{stage.name}' timed out after {budget:.1f}s, using fallback")
+    except Exception as e:
+        print(f"Stage '{stage.name}' failed: {e}, using fallback")
+    return stage.fallback(), False
+
+
+async def run_stages(stages: List[Stage], total_timeout: Optional[float] = None,
+                     failed: Optional[Set[str]] = None,
+                     on_done: Optional[Callable[[str, Any], None]] = None) -> Dict[str, Any]:
+    """
+    Запускает независимые стадии конкурентно (asyncio.gather) с таймаутом на стадию
+    и общим дедлайном. Возвращает словарь {имя стадии: результат или fallback};
+    имена стадий, ответивших fallback или отмеченных mark_degraded, добавляются в failed (если передан).
+    on_done(имя, результат) вызывается сразу по завершении каждой стадии, не дожидаясь остальных.
+    """
+    loop = asyncio.get_running_loop()
+    total = TOTAL_DEADLINE if total_timeout is None else total_timeout
+    deadline = loop.time() + total
+
+    async def run_one(st: Stage) -> Tuple[Any, bool]:
+        res = await _run_stage(st, deadline)
+        if on_done is not None:
+            on_done(st.name, res[0])
+        return res
+
+    results = await asyncio.gather(*(run_one(st) for st in stages))
+    if failed is not None:
+        failed.update(st.name for st, (_, ok) in zip(stages, results) if not ok)
+    return {st.name: res for st, (res, _) in zip(stages, results)}
@@ -0,0 +1,232 @@
+from __future__ import annotations
+from typing import Any, Dict, List, Optional, Tuple
+from collections import OrderedDict
+from dataclasses import dataclass
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from .models import Snapshot
+from .utils import env_int
+
+
+def _canonical(value: Any) -> bytes:
+    return json.dumps(value, ensure_ascii=False, sort_keys=True, separators=(",", ":")).encode("utf-8")
+
+
+def snapshot_hashes(snap: Snapshot) -> Tuple[str, Dict[str, str]]:
+    """
+    Хэш содержимого снапшота и хэши его разделов (schedule, surveys, inbox_samples, ...,
+    а также biometrics.sleep).
+    Считается по провалидированной модели, поэтому порядок ключей и значения по умолчанию не влияют.
+    """
+    data = snap.model_dump()
+    # для обнаружения изменений раздела достаточно 64 бит
+    sections = {name: hashlib.sha1(_canonical(value)).hexdigest()[:16] for name, value in data.items()}
+    # виртуальный раздел: от сна зависит кривая энергии, от остальной биометрии — нет
+    sleep = (data.get("biometrics") or {}).get("sleep")
+    sections["biometrics.sleep"] = hashlib.sha1(_canonical(sleep)).hexdigest()[:16]
+    digest = hashlib.sha256(_canonical(sections)).hexdigest()
+    return digest, sections
+
+
+@dataclass
+class StoredAnalysis:
+    """Сохранённый анализ дня: хэши снапшота, признаки, риск, полный Output и успешные LLM-стадии."""
+    user_id: str
+    date: str
+    snapshot_hash: str
+    sections: Dict[str, str]
+    stages_ok: List[str]
+    features: Dict[str, Any]
+    risk: Dict[str, Any]
+    output: Dict[str, Any]
+
+
+def _pack(rec: StoredAnalysis) -> Tuple[Any, ...]:
+    return (rec.user_id, rec.date, rec.snapshot_hash, json.dumps(rec.sections, separators=(",", ":")),
+            json.dumps(rec.stages_ok), json.dumps(rec.features, separators=(",", ":")),
+            json.dumps(rec.risk, ensure_ascii=False, separators=(",", ":")),
+            zlib.compress(_canonical(rec.output), 6), time.time())
+
+
+def _unpack(row: Tuple[Any, ...]) -> StoredAnalysis:
+    return StoredAnalysis(user_id=row[0], date=row[1], snapshot_hash=row[2], sections=json.loads(row[3]),
+                          stages_ok=json.loads(row[4]), features=json.loads(row[5]), risk=json.loads(row[6]),
+                          output=json.loads(zlib.decompress(row[7])))
+
+
+class MemoryStore:
+    """Анализы в памяти процесса (LRU по числу дней)."""
+    name = "memory"
+    blocking = False
+
+    def __init__(self, max_entries: int) -> None:
+        self.max_entries = max_entries
+        self._data: "OrderedDict[Tuple[str, str], Tuple[Any, ...]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id: str, date: str) -> Optional[StoredAnalysis]:
+        with self._lock:
+            row = self._data.get((user_id, date))
+            if row is None:
+                return None
+            self._data.move_to_end((user_id, date))
+        return _unpack(row)
+
+    def put(self, rec: StoredAnalysis) -> None:
+        row = _pack(rec)
+        with self._lock:
+            self._data[(rec.user_id, rec.date)] = row
+            self._data.move_to_end((rec.user_id, rec.date))
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def size(self) -> int:
+        return len(self._data)
+
+
+class SQLiteStore:
+    """
+    Анализы в SQLite (WAL) с ключом (user_id, date); Output хранится сжатым JSON.
+    Одна строка на день пользователя: повторный анализ перезаписывает её.
+    Вызовы блокирующие (ожидание блокировки до 5 с, сжатие): из event loop — через store_call.
+    """
+    name = "sqlite"
+    blocking = True
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5.0, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS analyses ("
+            " user_id TEXT NOT NULL, date TEXT NOT NULL, snapshot_hash TEXT NOT NULL, sections TEXT NOT NULL,"
+            " stages_ok TEXT NOT NULL, features TEXT NOT NULL, risk TEXT NOT NULL, output BLOB NOT NULL,"
+            " updated_at REAL NOT NULL, PRIMARY KEY (user_id, date))"
+        )
+
+    def get(self, user_id: str, date: str) -> Optional[StoredAnalysis]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT user_id, date, snapshot_hash, sections, stages_ok, features, risk, output"
+                " FROM analyses WHERE user_id=? AND date=?", (user_id, date)).fetchone()
+        return _unpack(row) if row else None
+
+    def put(self, rec: StoredAnalysis) -> None:
+        self.put_many([rec])
+
+    def put_many(self, recs: List[StoredAnalysis]) -> None:
+        rows = [_pack(r) for r in recs]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO analyses(user_id, date, snapshot_hash, sections, stages_ok,"
+                    " features, risk, output, updated_at) VALUES (?,?,?,?,?,?,?,?,?)", rows)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def size(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM analyses").fetchone()[0]
+
+
+async def store_call(store: Any, fn, *args):
+    """Вызов метода хранилища из event loop: блокирующие бэкенды (SQLite) — в потоке."""
+    return await asyncio.to_thread(fn, *args) if store.blocking else fn(*args)
+
+
+class _Writer:
+    """
+    Запись в блокирующее хранилище из event loop: записи, пришедшие, пока идёт предыдущая,
+    копятся и уходят одним put_many в потоке (батчи и потоковый анализ пишут одной транзакцией).
+    """
+    def __init__(self, store: Any, loop: asyncio.AbstractEventLoop) -> None:
+        self.store = store
+        self.loop = loop
+        self._pending: List[Tuple[StoredAnalysis, asyncio.Future]] = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def put(self, rec: StoredAnalysis) -> None:
+        fut = self.loop.create_future()
+        self._pending.append((rec, fut))
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._drain())
+        # отмена ожидающего не отменяет запись остальных
+        await asyncio.shield(fut)
+
+    async def _drain(self) -> None:
+        while self._pending:
+            batch, self._pending = self._pending, []
+            try:
+                await asyncio.to_thread(self.store.put_many, [rec for rec, _ in batch])
+            except Exception as e:
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+            else:
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_result(None)
+
+
+_writers: Dict[int, _Writer] = {}
+
+
+async def store_put(store: Any, rec: StoredAnalysis) -> None:
+    """Сохранение анализа из event loop; для SQLite — через общий на цикл _Writer."""
+    if not store.blocking:
+        store.put(rec)
+        return
+    loop = asyncio.get_running_loop()
+    w = _writers.get(id(store))
+    if w is None or w.loop is not loop:
+        w = _writers[id(store)] = _Writer(store, loop)
+    await w.put(rec)
+
+
+_store: Any = None
+_store_ready = False
+_counts: Dict[str, int] = {"hit": 0, "partial": 0, "miss": 0}
+
+
+def record_store_hit(kind: str) -> None:
+    """hit — отдан сохранённый Output; partial — пересчитаны только части с изменившимися разделами; miss — всё заново."""
+    _counts[kind] += 1
+
+
+def store_stats() -> Dict[str, Any]:
+    store = get_analysis_store()
+    if store is None:
+        return {"backend": "off"}
+    return {"backend": store.name, **_counts}
+
+
+def get_analysis_store() -> Any:
+    """
+    Хранилище анализов, по переменным окружения:
+      AGENT_STORE       — off (по умолчанию) | sqlite | memory
+      AGENT_STORE_PATH  — файл SQLite (по умолчанию analyses.sqlite3)
+      AGENT_STORE_MAX   — максимум дней в памяти для memory (по умолчанию 10000)
+    """
+    global _store, _store_ready
+    if _store_ready:
+        return _store
+    kind = os.getenv("AGENT_STORE", "off").lower()
+    if kind == "sqlite":
+        _store = SQLiteStore(os.getenv("AGENT_STORE_PATH", "analyses.sqlite3"))
+    elif kind == "memory":
+        _store = MemoryStore(env_int("AGENT_STORE_MAX", 10000))
+    else:
+        _store = None
+    _store_ready = True
+    return _store
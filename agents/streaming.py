@@ -0,0 +1,113 @@
+from __future__ import annotations
+from typing import Any, AsyncIterable, AsyncIterator, Dict, IO, Iterable, Tuple
+from collections import deque
+import asyncio
+import json
+import httpx
+
+from .orchestrator import analyze_async, BATCH_CONCURRENCY, _run
+
+
+async def aiter_lines(f: IO[str]) -> AsyncIterator[str]:
+    """Непустые строки файла/stdin; чтение в потоке, чтобы не блокировать event loop."""
+    while True:
+        line = await asyncio.to_thread(f.readline)
+        if not line:
+            return
+        if line.strip():
+            yield line
+
+
+async def _aiter(items: AsyncIterable[Any] | Iterable[Any]) -> AsyncIterator[Any]:
+    if hasattr(items, "__aiter__"):
+        async for x in items:  # type: ignore[union-attr]
+            yield x
+    else:
+        for x in items:  # type: ignore[union-attr]
+            yield x
+
+
+async def _analyze_item(item: Any, http: httpx.AsyncClient | None) -> Dict[str, Any]:
+    try:
+        data = json.loads(item) if isinstance(item, (str, bytes)) else item
+        return (await analyze_async(data, http=http)).model_dump()
+    except Exception as e:
+        return {"error": f"{type(e).__name__}: {e}"}
+
+
+async def analyze_stream(items: AsyncIterable[Any] | Iterable[Any], concurrency: int | None = None,
+                         ordered: bool = True, http: httpx.AsyncClient | None = None
+                         ) -> AsyncIterator[Tuple[int, Dict[str, Any]]]:
+    """
+    Потоковый анализ: элементы (dict или JSON-строка снапшота) читаются по мере надобности,
+    одновременно анализируется не более concurrency, результаты отдаются как (индекс, результат).
+    ordered=True — в порядке входа (окно не больше 2×concurrency ожидающих результатов),
+    ordered=False — в порядке завершения. Память не зависит от размера входа.
+    Ошибка разбора/анализа элемента возвращается как {"error": "..."}.
+    """
+    limit = max(1, concurrency or BATCH_CONCURRENCY)
+    source = _aiter(items).__aiter__()
+    sem = asyncio.Semaphore(limit)
+    # ordered: ожидающие результаты в порядке входа; иначе — просто набор задач в работе
+    window: "deque[Tuple[int, asyncio.Task]]" = deque()
+    capacity = 2 * limit if ordered else limit
+    reader: asyncio.Future | None = None
+    exhausted = False
+    i = 0
+
+    async def run(item: Any) -> Dict[str, Any]:
+        async with sem:
+            return await _analyze_item(item, http)
+
+    try:
+        while True:
+            # Следующий элемент читаем параллельно с ожиданием результатов:
+            # готовые результаты отдаются сразу, даже если вход ещё не пришёл.
+            if reader is None and not exhausted and len(window) < capacity:
+                reader = asyncio.ensure_future(source.__anext__())
+            waits = {reader} if reader is not None else set()
+            if ordered and window:
+                waits.add(window[0][1])
+            elif not ordered:
+                waits.update(task for _, task in window)
+            if not waits:
+                return
+            await asyncio.wait(waits, return_when=asyncio.FIRST_COMPLETED)
+
+            if reader is not None and reader.done():
+                try:
+                    item = reader.result()
+                except StopAsyncIteration:
+                    exhausted = True
+                else:
+                    window.append((i, asyncio.create_task(run(item))))
+                    i += 1
+                reader = None
+
+            if ordered:
+                while window and window[0][1].done():
+                    idx, task = window.popleft()
+                    yield idx, task.result()
+            else:
+                for entry in [e for e in window if e[1].done()]:
+                    window.remove(entry)
+                    yield entry[0], entry[1].result()
+    finally:
+        if reader is not None:
+            reader.cancel()
+        for _, task in window:
+            task.cancel()
+
+
+async def analyze_ndjson_async(fin: IO[str], fout: IO[str], concurrency: int | None = None) -> int:
+    """Читает снапшоты построчно (NDJSON) и пишет каждый Output строкой, как только он готов."""
+    n = 0
+    async for _, res in analyze_stream(aiter_lines(fin), concurrency=concurrency, ordered=True):
+        fout.write(json.dumps(res, ensure_ascii=False) + "\n")
+        fout.flush()
+        n += 1
+    return n
+
+
+def analyze_ndjson(fin: IO[str], fout: IO[str], concurrency: int | None = None) -> int:
+    return _run(analyze_ndjson_async(fin, fout, concurrency=concurrency))
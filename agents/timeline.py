@@ -0,0 +1,64 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING, Dict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+import calendar
+import numpy as np
+from .utils import to_dt
+
+if TYPE_CHECKING:
+    from .models import Snapshot
+
+
+# Коды типов событий расписания (порядок как в ScheduleItem.type)
+TYPE_CODES: Dict[str, int] = {"meeting": 0, "focus": 1, "break": 2, "personal": 3, "deadline": 4, "other": 5}
+MEETING, FOCUS, BREAK = TYPE_CODES["meeting"], TYPE_CODES["focus"], TYPE_CODES["break"]
+
+
+def epoch(dt: datetime) -> int:
+    """Секунды от эпохи; время без таймзоны считается UTC (доли секунды отбрасываются)."""
+    return calendar.timegm(dt.utctimetuple())
+
+
+@dataclass(frozen=True)
+class DayTimeline:
+    """
+    Разобранный один раз день снапшота в колоночном виде.
+    Время — int64 секунды от эпохи: разности в секундах дают те же минуты, что utils.minutes
+    для timedelta (floor-деление на 60), а минутная сетка получается как t // 60.
+      ws, we       — начало/конец рабочего дня;
+      start, end   — события расписания (в порядке snapshot.schedule);
+      kind         — int8-коды типов (TYPE_CODES).
+    work_start/work_end сохраняют исходную таймзону: в неё переводятся времена на выходе.
+    """
+    work_start: datetime
+    work_end: datetime
+    ws: int
+    we: int
+    start: np.ndarray
+    end: np.ndarray
+    kind: np.ndarray
+
+    @classmethod
+    def build(cls, s: "Snapshot") -> "DayTimeline":
+        work_start, work_end = to_dt(s.day.work_start), to_dt(s.day.work_end)
+        n = len(s.schedule)
+        start = np.fromiter((epoch(to_dt(it.start)) for it in s.schedule), dtype=np.int64, count=n)
+        end = np.fromiter((epoch(to_dt(it.end)) for it in s.schedule), dtype=np.int64, count=n)
+        kind = np.fromiter((TYPE_CODES[it.type] for it in s.schedule), dtype=np.int8, count=n)
+        return cls(work_start, work_end, epoch(work_start), epoch(work_end), start, end, kind)
+
+    def dt(self, t: int) -> datetime:
+        """Секунды от эпохи -> datetime в таймзоне начала рабочего дня."""
+        return self.work_start + timedelta(seconds=int(t) - self.ws)
+
+    def iso(self, t: int) -> str:
+        return self.dt(t).isoformat()
+
+
+def day_timeline(s: "Snapshot") -> DayTimeline:
+    """Таймлайн снапшота; строится при первом обращении и кэшируется на самом снапшоте."""
+    tl = s._timeline
+    if tl is None:
+        tl = s._timeline = DayTimeline.build(s)
+    return tl
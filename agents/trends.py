@@ -0,0 +1,227 @@
+from __future__ import annotations
+from typing import Any, Dict, Optional
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from datetime import date
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from .models import Features, RiskResult, TrendResult
+from .utils import clamp, env_int
+
+
+# Сглаживание по дням: быстрая/медленная EWMA доли встреч, EWMA недосыпа и риска,
+# период полураспада накопленного овертайма.
+ALPHA_FAST = 0.5
+ALPHA_SLOW = 0.25
+ALPHA = 0.25
+OVERTIME_HALF_LIFE_DAYS = 7.0
+
+
+@dataclass
+class TrendState:
+    """
+    Скользящие агрегаты пользователя по дням; обновляются за O(1) на новый день.
+    prev — состояние до последнего применённого дня: повторный анализ той же даты
+    пересчитывается от него, а не накладывается второй раз.
+    """
+    date: str
+    days: int = 0
+    sleep_debt: Optional[float] = None
+    overtime_min: float = 0.0
+    meet_fast: float = 0.0
+    meet_slow: float = 0.0
+    risk: float = 0.0
+    prev: Optional[Dict[str, Any]] = None
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self), separators=(",", ":"))
+
+    @classmethod
+    def from_json(cls, raw: str) -> "TrendState":
+        return cls(**json.loads(raw))
+
+
+def _ewma(old: Optional[float], new: float, alpha: float, gap: int) -> float:
+    # Нерегулярные наблюдения: пропущенные дни дополнительно «старят» прошлое значение
+    if old is None:
+        return new
+    keep = (1.0 - alpha) ** gap
+    return keep * old + (1.0 - keep) * new
+
+
+def apply_day(state: Optional[TrendState], day: str, f: Features, risk: RiskResult) -> TrendState:
+    """Новое состояние после дня day. Дата, совпадающая с последней, заменяет её вклад."""
+    if state is not None and state.date == day:
+        state = TrendState(**state.prev) if state.prev else None
+    if state is None:
+        base, gap = TrendState(date=day), 1
+    else:
+        base = state
+        gap = max(1, (date.fromisoformat(day) - date.fromisoformat(state.date)).days)
+
+    debt = None if f.sleep_h is None else max(0.0, 7.5 - f.sleep_h)
+    overtime = max(0, f.work_minutes - 9 * 60)
+    first = state is None
+    prev = None if first else {k: v for k, v in asdict(state).items() if k != "prev"}
+    return TrendState(
+        date=day,
+        days=base.days + 1,
+        sleep_debt=base.sleep_debt if debt is None else _ewma(base.sleep_debt, debt, ALPHA, gap),
+        overtime_min=base.overtime_min * 0.5 ** (gap / OVERTIME_HALF_LIFE_DAYS) + overtime,
+        meet_fast=f.meet_ratio if first else _ewma(base.meet_fast, f.meet_ratio, ALPHA_FAST, gap),
+        meet_slow=f.meet_ratio if first else _ewma(base.meet_slow, f.meet_ratio, ALPHA_SLOW, gap),
+        risk=risk.risk_score if first else _ewma(base.risk, risk.risk_score, ALPHA, gap),
+        prev=prev,
+    )
+
+
+def trend_result(state: TrendState, risk: RiskResult) -> TrendResult:
+    """Риск с учётом динамики: сглаженный риск плюс надбавки за хронические факторы."""
+    notes = []
+    debt = state.sleep_debt
+    over_h = state.overtime_min / 60
+    meet_trend = state.meet_fast - state.meet_slow
+
+    score = state.risk
+    if debt is not None:
+        score += 10 * clamp((debt - 1.0) / 2.0, 0, 1)
+        if debt >= 1.5: notes.append(f"Хронический недосып: в среднем {debt:.1f}ч.")
+    score += 10 * clamp((over_h - 2.0) / 8.0, 0, 1)
+    if over_h >= 4.0: notes.append(f"Накопленный овертайм за неделю ~{over_h:.1f}ч.")
+    score += 5 * clamp(meet_trend / 0.15, 0, 1)
+    if meet_trend >= 0.1: notes.append("Доля встреч растёт")
+    if state.days >= 3 and risk.risk_score >= state.risk + 10: notes.append("Риск сегодня выше обычного")
+
+    return TrendResult(days=state.days, risk_score=round(clamp(score, 0, 100), 1), risk_ewma=round(state.risk, 1),
+                       sleep_debt_ewma_h=None if debt is None else round(debt, 2),
+                       overtime_week_h=round(over_h, 2), meeting_load_trend=round(meet_trend, 3), notes=notes)
+
+
+class MemoryTrendBackend:
+    """Состояния в памяти процесса (LRU по числу пользователей)."""
+    name = "memory"
+    blocking = False
+
+    def __init__(self, max_entries: int) -> None:
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def update(self, user_id: str, fn) -> TrendState:
+        with self._lock:
+            raw = self._data.get(user_id)
+            state = fn(TrendState.from_json(raw) if raw else None)
+            self._data[user_id] = state.to_json()
+            self._data.move_to_end(user_id)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+            return state
+
+    def size(self) -> int:
+        return len(self._data)
+
+
+class SQLiteTrendBackend:
+    """
+    Состояния в SQLite (WAL): одна компактная строка на пользователя, общая для воркеров.
+    update блокирующий (транзакция IMMEDIATE, ожидание блокировки до 5 с): из event loop — update_trend_async.
+    """
+    name = "sqlite"
+    blocking = True
+
+    def __init__(self, path: str) -> None:
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5.0, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS trend_state ("
+            " user_id TEXT PRIMARY KEY, state TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+
+    def update(self, user_id: str, fn) -> TrendState:
+        with self._lock:
+            # IMMEDIATE: чтение и запись состояния — одна транзакция и для других процессов
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT state FROM trend_state WHERE user_id=?", (user_id,)).fetchone()
+                state = fn(TrendState.from_json(row[0]) if row else None)
+                self._conn.execute("INSERT OR REPLACE INTO trend_state(user_id, state, updated_at) VALUES (?,?,?)",
+                                   (user_id, state.to_json(), time.time()))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            return state
+
+    def size(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM trend_state").fetchone()[0]
+
+
+_store: Any = None
+_store_ready = False
+
+
+def get_trend_store() -> Any:
+    """
+    Хранилище скользящих агрегатов, по переменным окружения:
+      AGENT_TRENDS       — memory (по умолчанию) | sqlite | off
+      AGENT_TRENDS_PATH  — файл SQLite (по умолчанию trends.sqlite3)
+      AGENT_TRENDS_MAX   — максимум пользователей для memory (по умолчанию 100000)
+    """
+    global _store, _store_ready
+    if _store_ready:
+        return _store
+    kind = os.getenv("AGENT_TRENDS", "memory").lower()
+    if kind == "sqlite":
+        _store = SQLiteTrendBackend(os.getenv("AGENT_TRENDS_PATH", "trends.sqlite3"))
+    elif kind in ("off", "0", "none", "false"):
+        _store = None
+    else:
+        _store = MemoryTrendBackend(env_int("AGENT_TRENDS_MAX", 100000))
+    _store_ready = True
+    return _store
+
+
+def _day_step(day: str, f: Features, risk: RiskResult):
+    """Функция обновления состояния днём day (None — дата не разбирается)."""
+    try:
+        day = date.fromisoformat(day[:10]).isoformat()
+    except ValueError:
+        return None
+
+    def step(state: Optional[TrendState]) -> TrendState:
+        if state is not None and day < state.date:
+            return state
+        return apply_day(state, day, f, risk)
+    return step
+
+
+def update_trend(user_id: str, day: str, f: Features, risk: RiskResult) -> Optional[TrendResult]:
+    """
+    Применяет день к состоянию пользователя и возвращает риск с учётом тренда.
+    Дни старше последнего учтённого состояние не меняют (тренд считается по текущему).
+    """
+    store = get_trend_store()
+    step = _day_step(day, f, risk)
+    if store is None or step is None:
+        return None
+    return trend_result(store.update(user_id, step), risk)
+
+
+async def update_trend_async(user_id: str, day: str, f: Features, risk: RiskResult) -> Optional[TrendResult]:
+    """update_trend из event loop: чтение-изменение-запись SQLite (вместе с транзакцией) — в потоке."""
+    store = get_trend_store()
+    step = _day_step(day, f, risk)
+    if store is None or step is None:
+        return None
+    if store.blocking:
+        state = await asyncio.to_thread(store.update, user_id, step)
+    else:
+        state = store.update(user_id, step)
+    return trend_result(state, risk)
@@ -1,10 +1,15 @@
 from __future__ import annotations
 from typing import List, Tuple
 from datetime import datetime, timedelta
+from functools import lru_cache
+import os
 from dateutil import parser as dtp
 
 
+@lru_cache(maxsize=8192)
 def to_dt(x: str) -> datetime:
+    # datetime неизменяем, поэтому одна и та же строка разбирается один раз
+    # (валидатор ScheduleItem, таймлайн дня, ICS)
     return dtp.isoparse(x)
 
 
@@ -32,3 +37,27 @@ def slot_with_min_len(windows: List[Tuple[datetime, datetime]], min_minutes: int
     return [(s, e) for s, e in windows if minutes(e - s) >= min_minutes]
 
 
+
+
+def env_float(name: str, default: float) -> float:
+    """Числовой параметр из окружения; пустое или нечисловое значение — default."""
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def env_int(name: str, default: int) -> int:
+    return int(env_float(name, default))
+
+
+def rss_mb() -> float:
+    """Текущий RSS процесса в МБ (на Linux — из /proc, иначе пиковый из getrusage)."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return round(pages * os.sysconf("SC_PAGE_SIZE") / 2**20, 1)
+    except (OSError, ValueError, IndexError):
+        import resource, sys
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(peak / (2**20 if sys.platform == "darwin" else 2**10), 1)
@@ -0,0 +1,66 @@
+"""
+Пропускная способность /analyze-batch против последовательных вызовов /analyze.
+Нужен запущенный сервер (uvicorn server:app):
+
+  python -m bench.bench_batch --url http://127.0.0.1:8000 --snapshot snapshot.json --n 50
+"""
+from __future__ import annotations
+import argparse
+import json
+import time
+
+import httpx
+
+
+def _variants(snap: dict, n: int) -> list[dict]:
+    # Разные user_id, чтобы кэш LLM не делал все запросы, кроме первого, бесплатными
+    return [dict(snap, user_id=f"{snap.get('user_id', 'u')}-{i}") for i in range(n)]
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--url", default="http://127.0.0.1:8000")
+    ap.add_argument("--snapshot", required=True, help="JSON одного снапшота")
+    ap.add_argument("--n", type=int, default=50)
+    ap.add_argument("--concurrency", type=int, default=None)
+    ap.add_argument("--ndjson", action="store_true", help="отправлять батч как NDJSON")
+    args = ap.parse_args()
+
+    with open(args.snapshot, "r", encoding="utf-8") as f:
+        snap = json.load(f)
+    snaps = _variants(snap, args.n)
+
+    with httpx.Client(base_url=args.url, timeout=600) as client:
+        t0 = time.perf_counter()
+        for s in snaps:
+            client.post("/analyze", json=s).raise_for_status()
+        seq_s = time.perf_counter() - t0
+
+        params = {"concurrency": args.concurrency} if args.concurrency else {}
+        if args.ndjson:
+            body = "".join(json.dumps(s, ensure_ascii=False) + "\n" for s in snaps).encode("utf-8")
+            req = dict(content=body, headers={"Content-Type": "application/x-ndjson"})
+        else:
+            req = dict(json=snaps)
+        first = None
+        errors = 0
+        t0 = time.perf_counter()
+        with client.stream("POST", "/analyze-batch", params=params, **req) as r:
+            r.raise_for_status()
+            for line in r.iter_lines():
+                if not line:
+                    continue
+                if first is None:
+                    first = time.perf_counter() - t0
+                errors += "error" in json.loads(line)
+        batch_s = time.perf_counter() - t0
+
+    print(f"snapshots:            {args.n}")
+    print(f"sequential /analyze:  {seq_s:.2f} s  ({args.n / seq_s:.2f} snap/s)")
+    print(f"/analyze-batch:       {batch_s:.2f} s  ({args.n / batch_s:.2f} snap/s), "
+          f"first result {first or 0:.2f} s, errors {errors}")
+    print(f"speedup:              x{seq_s / batch_s:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Интервальный движок на многонедельных календарях: IntervalSet против прямого подхода
+(utils.free_windows с сортировкой на каждый вызов и линейный поиск окна/пересечения).
+
+  python -m bench.bench_intervals --weeks 1 4 12 --events-per-day 40 --queries 2000
+"""
+from __future__ import annotations
+import argparse
+import time
+
+import numpy as np
+
+from agents.intervals import IntervalSet
+from agents.utils import free_windows
+
+DAY = 86_400
+
+
+def _calendar(rng: np.random.Generator, weeks: int, per_day: int):
+    days = np.repeat(np.arange(weeks * 7), per_day)
+    start = days * DAY + 8 * 3600 + rng.integers(0, 11 * 60, size=days.size) * 60
+    end = start + rng.choice([15, 25, 30, 45, 60, 90], size=days.size) * 60
+    return start.astype(np.int64), end.astype(np.int64)
+
+
+def _timed(fn, repeat: int) -> float:
+    t = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - t) / repeat * 1000
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--weeks", type=int, nargs="+", default=[1, 4, 12])
+    ap.add_argument("--events-per-day", type=int, default=40)
+    ap.add_argument("--queries", type=int, default=2000)
+    ap.add_argument("--gap-min", type=int, default=45)
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    for weeks in args.weeks:
+        start, end = _calendar(rng, weeks, args.events_per_day)
+        lo, hi = 0, weeks * 7 * DAY
+        busy = list(zip(start.tolist(), end.tolist()))
+        length = args.gap_min * 60
+        q = rng.integers(lo, hi, size=args.queries).tolist()
+
+        build_py = _timed(lambda: free_windows(lo, hi, busy), 5)
+        build_np = _timed(lambda: IntervalSet.from_intervals(start, end).complement(lo, hi), 5)
+
+        iset = IntervalSet.from_intervals(start, end)
+        free = free_windows(lo, hi, busy)
+
+        def gap_py():
+            for a in q:
+                next((max(s, a) for s, e in free if e - max(s, a) >= length), None)
+
+        def gap_np():
+            for a in q:
+                iset.first_gap(length, a, hi)
+
+        def overlap_py():
+            for a in q:
+                any(s < a + length and a < e for s, e in busy)
+
+        def overlap_np():
+            for a in q:
+                iset.overlaps(a, a + length)
+
+        for a in q[:200]:
+            expected = next((max(s, a) for s, e in free if e - max(s, a) >= length), None)
+            assert iset.first_gap(length, a, hi) == expected
+            assert iset.overlaps(a, a + length) == any(s < a + length and a < e for s, e in busy)
+
+        n = args.queries
+        print(f"weeks={weeks:>3} events={len(busy):>6} merged={len(iset):>5}")
+        print(f"  free windows     : list {build_py:8.3f} ms   IntervalSet {build_np:8.3f} ms")
+        print(f"  first gap >= {args.gap_min:>3}m: list {_timed(gap_py, 1) / n * 1000:8.2f} us   "
+              f"IntervalSet {_timed(gap_np, 1) / n * 1000:8.2f} us  (per query)")
+        print(f"  overlap query    : list {_timed(overlap_py, 1) / n * 1000:8.2f} us   "
+              f"IntervalSet {_timed(overlap_np, 1) / n * 1000:8.2f} us  (per query)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""
+Нагрузочный прогон server.py против заглушки LLM (agents.llm_stub): N параллельных клиентов
+шлют синтетические снапшоты в /analyze (или /analyze/stream), отчёт — пропускная способность,
+задержки p50/p95/p99, ошибки, RSS сервера и число вызовов модели; JSON — для сравнения
+между коммитами (python -m bench.compare).
+
+С --spawn заглушка и сервер запускаются на свободных портах (кэш LLM и хранилище анализов
+выключены, если не заданы в окружении), иначе нагрузка идёт на --url:
+
+  python -m bench.bench_load --spawn --concurrency 32 --requests 500 --stub-latency lognormal:0.3,0.5 --json load.json
+  python -m bench.bench_load --url http://127.0.0.1:8000 --duration 60
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+
+import httpx
+import numpy as np
+
+from bench.synth import synthetic_snapshot
+from bench.common import meta
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _proc_rss_mb(pid: int) -> float | None:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def _wait_ready(url: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"не дождались {url}")
+
+
+@contextmanager
+def spawned(args: argparse.Namespace):
+    """Заглушка LLM и сервер как подпроцессы; отдаёт (url сервера, url заглушки, pid сервера)."""
+    stub_port, srv_port = _free_port(), _free_port()
+    stub_cmd = [sys.executable, "-m", "agents.llm_stub", "--port", str(stub_port), "--latency", args.stub_latency,
+                "--error-rate", str(args.stub_error_rate), "--seed", "1"]
+    env = {**os.environ, "OPENROUTER_BASE_URL": f"http://127.0.0.1:{stub_port}/v1", "OPENROUTER_API_KEY": "bench"}
+    env.setdefault("LLM_CACHE", "off")
+    env.setdefault("AGENT_STORE", "off")
+    srv_cmd = [sys.executable, "-m", "uvicorn", "server:app", "--port", str(srv_port), "--log-level", "warning",
+               "--workers", str(args.workers)]
+    procs = [subprocess.Popen(stub_cmd, env=env)]
+    try:
+        _wait_ready(f"http://127.0.0.1:{stub_port}/stats")
+        procs.append(subprocess.Popen(srv_cmd, env=env))
+        _wait_ready(f"http://127.0.0.1:{srv_port}/metrics")
+        yield f"http://127.0.0.1:{srv_port}", f"http://127.0.0.1:{stub_port}", procs[1].pid
+    finally:
+        for p in reversed(procs):
+            p.terminate()
+        for p in procs:
+            try:
+                p.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                p.kill()
+
+
+async def _one(client: httpx.AsyncClient, path: str, body: dict) -> bool:
+    if path.endswith("/stream"):
+        ok = False
+        async with client.stream("POST", path, json=body) as r:
+            async for line in r.aiter_lines():
+                if line.startswith("event: "):
+                    ok = line == "event: done"
+        return ok and r.status_code == 200
+    r = await client.post(path, json=body)
+    return r.status_code == 200
+
+
+async def run_load(url: str, args: argparse.Namespace, pid: int | None) -> dict:
+    sizes = dict(events=args.events, surveys=args.surveys, tasks=args.tasks, inbox=args.inbox)
+    pool = [synthetic_snapshot(i, **sizes) for i in range(args.unique)]
+    lat: list[float] = []
+    errors = 0
+    rss: list[float] = []
+    counter = iter(range(10 ** 12))
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=url, timeout=args.timeout, limits=limits) as client:
+        for i in range(args.warmup):
+            await _one(client, args.endpoint, pool[i % len(pool)])
+
+        stop_at = time.perf_counter() + args.duration if args.duration else None
+
+        async def worker() -> None:
+            nonlocal errors
+            while True:
+                i = next(counter)
+                if (stop_at is None and i >= args.requests) or (stop_at is not None and time.perf_counter() >= stop_at):
+                    return
+                # разные user_id/дата на каждый запрос (пока не исчерпан пул) — объединение
+                # одинаковых анализов и кэши не скрывают работу
+                t = time.perf_counter()
+                try:
+                    ok = await _one(client, args.endpoint, pool[i % len(pool)])
+                except httpx.HTTPError:
+                    ok = False
+                if ok:
+                    lat.append(time.perf_counter() - t)
+                else:
+                    errors += 1
+
+        async def sample_rss() -> None:
+            while pid is not None:
+                if (v := _proc_rss_mb(pid)) is not None:
+                    rss.append(v)
+                await asyncio.sleep(0.25)
+
+        sampler = asyncio.ensure_future(sample_rss())
+        t0 = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        wall = time.perf_counter() - t0
+        sampler.cancel()
+        metrics = (await client.get("/metrics")).json()
+
+    ms = np.array(lat) * 1000 if lat else np.zeros(1)
+    out = {"name": f"load[{args.endpoint},c={args.concurrency},events={args.events},inbox={args.inbox}]",
+           "requests": len(lat) + errors, "errors": errors, "wall_s": round(wall, 2),
+           "throughput_rps": round(len(lat) / wall, 2) if wall else 0.0,
+           **{f"p{q}_ms": round(float(np.percentile(ms, q)), 1) for q in (50, 95, 99)},
+           "max_ms": round(float(ms.max()), 1),
+           # RSS воркера из /metrics; при --spawn — ещё пик и конец по /proc процесса сервера
+           "rss_mb": metrics.get("rag_index", {}).get("rss_mb")}
+    if rss:
+        out["rss_peak_mb"] = max(rss)
+        out["rss_end_mb"] = rss[-1]
+    gw = metrics.get("llm_gateway", {})
+    out["llm_requests"] = gw.get("requests")
+    out["llm_retries"] = gw.get("retries")
+    return out
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--url", default="http://127.0.0.1:8000")
+    ap.add_argument("--spawn", action="store_true", help="запустить заглушку LLM и сервер самостоятельно")
+    ap.add_argument("--workers", type=int, default=1, help="воркеров uvicorn при --spawn")
+    ap.add_argument("--stub-latency", default="lognormal:0.3,0.5", help="распределение задержки заглушки")
+    ap.add_argument("--stub-error-rate", type=float, default=0.0)
+    ap.add_argument("--endpoint", default="/analyze", choices=["/analyze", "/analyze/stream"])
+    ap.add_argument("--concurrency", type=int, default=16)
+    ap.add_argument("--requests", type=int, default=200)
+    ap.add_argument("--duration", type=float, default=None, help="секунд нагрузки (вместо --requests)")
+    ap.add_argument("--warmup", type=int, default=5)
+    ap.add_argument("--unique", type=int, default=10_000, help="различных снапшотов в пуле")
+    ap.add_argument("--events", type=int, default=8)
+    ap.add_argument("--surveys", type=int, default=2)
+    ap.add_argument("--tasks", type=int, default=3)
+    ap.add_argument("--inbox", type=int, default=5)
+    ap.add_argument("--timeout", type=float, default=120.0)
+    ap.add_argument("--json", help="записать результаты в файл")
+    args = ap.parse_args()
+
+    if args.spawn:
+        with spawned(args) as (url, stub_url, pid):
+            res = asyncio.run(run_load(url, args, pid))
+            res["stub"] = httpx.get(f"{stub_url}/stats").json()
+    else:
+        res = asyncio.run(run_load(args.url, args, None))
+
+    print(res["name"])
+    print(f"  requests {res['requests']} (errors {res['errors']}) за {res['wall_s']} s: {res['throughput_rps']} req/s")
+    print(f"  latency p50 {res['p50_ms']} ms  p95 {res['p95_ms']} ms  p99 {res['p99_ms']} ms  max {res['max_ms']} ms")
+    print(f"  RSS {res['rss_mb']} MB" + (f" (пик {res['rss_peak_mb']} MB)" if "rss_peak_mb" in res else ""))
+    print(f"  LLM requests {res['llm_requests']}, retries {res['llm_retries']}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"bench": "load", "meta": meta(vars(args)), "results": [res]}, f, ensure_ascii=False, indent=2)
+        print(f"JSON: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
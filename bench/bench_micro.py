@@ -0,0 +1,94 @@
+"""
+Микробенчмарки детерминированной части анализа на синтетических снапшотах разного размера:
+разбор Snapshot, compute_features, compute_risk, energy_curve, propose_plan, to_ics
+и RAGAssistant.retrieve. Размеры перебираются по сетке (events x surveys x tasks x inbox).
+Результат — таблица и JSON для сравнения между коммитами (python -m bench.compare).
+
+  python -m bench.bench_micro --events 10 100 1000 --tasks 5 50 --repeat 200 --json micro.json
+"""
+from __future__ import annotations
+import argparse
+import itertools
+import json
+import time
+import warnings
+
+import numpy as np
+
+from agents.models import Snapshot
+from agents.features import compute_features
+from agents.risk import compute_risk
+from agents.energy import energy_curve
+from agents.planner import propose_plan, to_ics
+from agents.rag import RAGAssistant
+from bench.synth import synthetic_snapshot
+from bench.common import meta
+
+
+def _timings(fn, args_list: list, warmup: int = 10) -> dict:
+    for a in args_list[:warmup]:
+        fn(*a)
+    lat = np.empty(len(args_list))
+    for i, a in enumerate(args_list):
+        t = time.perf_counter()
+        fn(*a)
+        lat[i] = time.perf_counter() - t
+    lat *= 1e6
+    return {"n": len(lat), "mean_us": round(float(lat.mean()), 1),
+            "p50_us": round(float(np.percentile(lat, 50)), 1), "p95_us": round(float(np.percentile(lat, 95)), 1)}
+
+
+def bench_case(events: int, surveys: int, tasks: int, inbox: int, repeat: int, rag: RAGAssistant) -> list[dict]:
+    raw = [synthetic_snapshot(i, events, surveys, tasks, inbox) for i in range(repeat)]
+    out = {"snapshot": _timings(lambda d: Snapshot(**d), [(d,) for d in raw])}
+    # разобранный день кэшируется на снапшоте: compute_features замеряется на свежих объектах,
+    # остальные функции — как в анализе, после построения признаков
+    snaps = [Snapshot(**d) for d in raw]
+    for d in raw[:10]:
+        compute_features(Snapshot(**d))
+    out["compute_features"] = _timings(compute_features, [(s,) for s in snaps], warmup=0)
+    feats = [compute_features(s) for s in snaps]
+    out["compute_risk"] = _timings(compute_risk, [(f, s.rec_history) for s, f in zip(snaps, feats)])
+    risks = [compute_risk(f, s.rec_history) for s, f in zip(snaps, feats)]
+    out["energy_curve"] = _timings(energy_curve, [(s, f) for s, f in zip(snaps, feats)])
+    curves = [energy_curve(s, f) for s, f in zip(snaps, feats)]
+    out["propose_plan"] = _timings(propose_plan, list(zip(snaps, feats, risks, curves)))
+    plans = [propose_plan(*a) for a in zip(snaps, feats, risks, curves)]
+    out["to_ics"] = _timings(to_ics, [(p,) for p in plans])
+    queries = [rag._day_query(s, f, r) for s, f, r in zip(snaps, feats, risks)]
+    out["rag_retrieve"] = _timings(rag.retrieve, [(q, 3) for q in queries])
+
+    case = f"events={events},surveys={surveys},tasks={tasks},inbox={inbox}"
+    return [{"name": f"{fn}[{case}]", "fn": fn, "case": case, **t} for fn, t in out.items()]
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--events", type=int, nargs="+", default=[10, 100, 1000])
+    ap.add_argument("--surveys", type=int, nargs="+", default=[3])
+    ap.add_argument("--tasks", type=int, nargs="+", default=[5])
+    ap.add_argument("--inbox", type=int, nargs="+", default=[10])
+    ap.add_argument("--repeat", type=int, default=200, help="снапшотов (вызовов) на каждую функцию и размер")
+    ap.add_argument("--json", help="записать результаты в файл")
+    args = ap.parse_args()
+    # ics предупреждает о будущем поведении str(Calendar) на каждом вызове to_ics
+    warnings.filterwarnings("ignore", category=FutureWarning)
+
+    rag = RAGAssistant()
+    rag.retrieve("прогрев индекса")
+    results = []
+    for ev, sv, tk, ib in itertools.product(args.events, args.surveys, args.tasks, args.inbox):
+        rows = bench_case(ev, sv, tk, ib, args.repeat, rag)
+        print(rows[0]["case"])
+        for r in rows:
+            print(f"  {r['fn']:<18} p50 {r['p50_us']:>10.1f} us   p95 {r['p95_us']:>10.1f} us   mean {r['mean_us']:>10.1f} us")
+        results.extend(rows)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"bench": "micro", "meta": meta(vars(args)), "results": results}, f, ensure_ascii=False, indent=2)
+        print(f"JSON: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
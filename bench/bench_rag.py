@@ -0,0 +1,74 @@
+"""
+Бенчмарк ретрива RAGAssistant: инвертированный индекс против линейного прохода по чанкам.
+Совпадение top-k с исходным линейным проходом (включая равные скоры) проверяет tests/test_rag_index.py.
+
+  python -m bench.bench_rag --chunks 100000 --queries 200
+"""
+from __future__ import annotations
+import argparse
+import time
+from collections import Counter
+
+import numpy as np
+
+from agents.rag import _cosine_sim
+from agents.rag_index import InvertedIndex
+
+
+def _synthetic_corpus(n_chunks: int, vocab_size: int, seed: int) -> list[Counter]:
+    rng = np.random.default_rng(seed)
+    # Zipf-подобное распределение слов, как в естественном тексте
+    p = 1.0 / np.arange(1, vocab_size + 1)
+    p /= p.sum()
+    lengths = rng.integers(20, 80, size=n_chunks)
+    words = rng.choice(vocab_size, size=int(lengths.sum()), p=p)
+    bounds = np.cumsum(lengths)[:-1]
+    return [Counter(f"w{w}" for w in part.tolist()) for part in np.split(words, bounds)]
+
+
+def _linear_top_k(docs: list[Counter], q: Counter, k: int) -> list[int]:
+    scored = [(s, i) for i, d in enumerate(docs) if (s := _cosine_sim(q, d)) > 0]
+    scored.sort(key=lambda x: x[0], reverse=True)
+    return [i for _, i in scored[:k]]
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--chunks", type=int, default=100_000)
+    ap.add_argument("--vocab", type=int, default=50_000)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--top-k", type=int, default=6)
+    ap.add_argument("--linear", type=int, default=5, help="на скольких запросах замерить линейный проход")
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+
+    docs = _synthetic_corpus(args.chunks, args.vocab, args.seed)
+    t0 = time.perf_counter()
+    index = InvertedIndex.build(docs)
+    build_s = time.perf_counter() - t0
+
+    rng = np.random.default_rng(args.seed + 1)
+    queries = [Counter(f"w{w}" for w in rng.integers(200, args.vocab, size=rng.integers(5, 15)).tolist())
+               for _ in range(args.queries)]
+
+    lat = []
+    for q in queries:
+        t = time.perf_counter()
+        index.top_k(q, args.top_k)
+        lat.append(time.perf_counter() - t)
+
+    lin = []
+    for q in queries[: args.linear]:
+        t = time.perf_counter()
+        _linear_top_k(docs, q, args.top_k)
+        lin.append(time.perf_counter() - t)
+
+    ms = np.array(lat) * 1000
+    print(f"chunks={args.chunks} build={build_s:.2f}s")
+    print(f"index:  p50={np.percentile(ms, 50):.3f}ms p99={np.percentile(ms, 99):.3f}ms")
+    if lin:
+        print(f"linear: mean={np.mean(lin) * 1000:.1f}ms на {len(lin)} запросах")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Задержки чтения/записи хранилища анализов (SQLite, WAL) на большом числе сохранённых дней.
+Таблица заполняется пакетно синтетическими днями (реальный Output одного снапшота
+с разными user_id/date), затем замеряются одиночные get/put по случайным ключам.
+
+  python -m bench.bench_store --snapshot snapshot.json --rows 1000000 --path /tmp/bench_store.sqlite3
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import random
+import time
+from datetime import date, timedelta
+
+import numpy as np
+
+from agents.models import Output, Snapshot
+from agents.features import compute_features
+from agents.risk import compute_risk
+from agents.energy import compute_energy
+from agents.planner import propose_plan, to_ics
+from agents.analytics import (meeting_hygiene, wellbeing, comm_triage_rules, efficiency_fallback,
+                              fatigue_fallback)
+from agents.coach import rule_based_coach
+from agents.rag import RAGAssistant
+from agents.store import SQLiteStore, StoredAnalysis, _pack, snapshot_hashes
+
+USERS_DAYS = 365
+
+
+def _record(snap: Snapshot) -> StoredAnalysis:
+    """Анализ без обращений к модели: детерминированная часть и fallback LLM-стадий."""
+    f = compute_features(snap)
+    risk = compute_risk(f, snap.rec_history)
+    curve = compute_energy(snap, f)
+    plan = propose_plan(snap, f, risk, curve)
+    out = Output(risk=risk, energy_curve=curve.points(), plan=plan, meeting_hygiene=meeting_hygiene(snap, f),
+                 comm_triage=comm_triage_rules(snap, f), wellbeing=wellbeing(snap, f, risk),
+                 efficiency_recommendations=efficiency_fallback(), ics_calendar=to_ics(plan),
+                 coach_message=rule_based_coach(risk, f), rag_advice=RAGAssistant().local_advice(snap, f, risk),
+                 fatigue_load=fatigue_fallback())
+    digest, sections = snapshot_hashes(snap)
+    return StoredAnalysis(user_id=snap.user_id, date=snap.date, snapshot_hash=digest, sections=sections,
+                          stages_ok=[], features=f.model_dump(), risk=risk.model_dump(), output=out.model_dump())
+
+
+def _key(i: int) -> tuple[str, str]:
+    # 365 дней на пользователя
+    return f"user-{i // USERS_DAYS}", (date(2024, 1, 1) + timedelta(days=i % USERS_DAYS)).isoformat()
+
+
+def _pct(lat: list[float]) -> str:
+    a = np.array(lat) * 1e6
+    return f"p50 {np.percentile(a, 50):7.1f} us  p99 {np.percentile(a, 99):7.1f} us"
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--snapshot", required=True)
+    ap.add_argument("--rows", type=int, default=1_000_000)
+    ap.add_argument("--path", default="bench_store.sqlite3")
+    ap.add_argument("--batch", type=int, default=10_000)
+    ap.add_argument("--ops", type=int, default=5000)
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+
+    with open(args.snapshot, "r", encoding="utf-8") as fh:
+        template = _record(Snapshot(**json.load(fh)))
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(args.path + suffix):
+            os.remove(args.path + suffix)
+    store = SQLiteStore(args.path)
+
+    # Заполнение: строка шаблона упаковывается один раз, меняется только ключ
+    row = _pack(template)
+    t0 = time.perf_counter()
+    for lo in range(0, args.rows, args.batch):
+        rows = [_key(i) + row[2:] for i in range(lo, min(args.rows, lo + args.batch))]
+        with store._lock:
+            store._conn.execute("BEGIN")
+            store._conn.executemany("INSERT OR REPLACE INTO analyses VALUES (?,?,?,?,?,?,?,?,?)", rows)
+            store._conn.execute("COMMIT")
+    load_s = time.perf_counter() - t0
+    size_mb = sum(os.path.getsize(args.path + s) for s in ("", "-wal") if os.path.exists(args.path + s)) / 2**20
+
+    rng = random.Random(args.seed)
+    keys = [_key(rng.randrange(args.rows)) for _ in range(args.ops)]
+    get_lat, put_lat = [], []
+    for user_id, day in keys:
+        t = time.perf_counter()
+        rec = store.get(user_id, day)
+        get_lat.append(time.perf_counter() - t)
+        assert rec is not None and rec.date == day
+    for user_id, day in keys:
+        rec = StoredAnalysis(**{**template.__dict__, "user_id": user_id, "date": day})
+        t = time.perf_counter()
+        store.put(rec)
+        put_lat.append(time.perf_counter() - t)
+    miss = []
+    for i in range(args.ops):
+        t = time.perf_counter()
+        store.get(f"nobody-{i}", "2024-01-01")
+        miss.append(time.perf_counter() - t)
+
+    print(f"rows:        {args.rows}  ({size_mb:.0f} MB on disk, bulk load {load_s:.1f} s, "
+          f"{args.rows / load_s:.0f} rows/s)")
+    print(f"get (hit):   {_pct(get_lat)}")
+    print(f"get (miss):  {_pct(miss)}")
+    print(f"put:         {_pct(put_lat)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Разбор времени на снапшот: сколько раз вызывается isoparse и сколько CPU уходит
+на детерминированную часть анализа (валидация, признаки, кривая энергии, план, гигиена встреч).
+
+  python -m bench.bench_timeline --snapshots 500 --events 20
+"""
+from __future__ import annotations
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from dateutil import parser as dtp
+
+from agents.models import Snapshot
+from agents.features import compute_features
+from agents.risk import compute_risk
+from agents.energy import compute_energy
+from agents.planner import propose_plan
+from agents.analytics import meeting_hygiene
+
+TYPES = ["meeting", "focus", "break", "personal", "other"]
+
+
+def _synthetic_snapshots(n: int, events: int, seed: int) -> list[dict]:
+    rng = random.Random(seed)
+    out = []
+    for i in range(n):
+        # разные даты, чтобы строки времени не повторялись между снапшотами
+        ws = datetime(2020, 1, 1, 9) + timedelta(days=i)
+        items = []
+        for k in range(events):
+            st = ws + timedelta(minutes=rng.randint(0, 540))
+            items.append({"title": f"e{k}", "start": st.isoformat() + "+03:00",
+                          "end": (st + timedelta(minutes=rng.randint(10, 90))).isoformat() + "+03:00",
+                          "type": rng.choice(TYPES)})
+        out.append({"user_id": f"u{i}", "date": ws.date().isoformat(),
+                    "day": {"work_start": ws.isoformat() + "+03:00",
+                            "work_end": (ws + timedelta(hours=9)).isoformat() + "+03:00"},
+                    "schedule": items, "biometrics": {"sleep": {"duration_hours": 6.5}},
+                    "persona": {"chronotype": "neutral"}})
+    return out
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--snapshots", type=int, default=500)
+    ap.add_argument("--events", type=int, default=20)
+    ap.add_argument("--step-min", type=int, default=30, help="шаг кривой энергии")
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+
+    data = _synthetic_snapshots(args.snapshots, args.events, args.seed)
+    calls = 0
+    isoparse = dtp.isoparse
+
+    def counting(x):
+        nonlocal calls
+        calls += 1
+        return isoparse(x)
+
+    dtp.isoparse = counting
+    try:
+        t0 = time.process_time()
+        for d in data:
+            s = Snapshot(**d)
+            f = compute_features(s)
+            risk = compute_risk(f, s.rec_history)
+            curve = compute_energy(s, f, args.step_min)
+            curve.points()
+            propose_plan(s, f, risk, curve)
+            meeting_hygiene(s, f)
+        cpu = time.process_time() - t0
+    finally:
+        dtp.isoparse = isoparse
+
+    n = args.snapshots
+    print(f"snapshots x events:   {n} x {args.events}")
+    print(f"isoparse per snapshot: {calls / n:.1f} ({calls / (n * (2 * args.events + 2)):.2f} per timestamp)")
+    print(f"CPU per snapshot:      {cpu / n * 1000:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,24 @@
+"""Общие части JSON-отчётов бенчмарков: метаданные прогона (коммит, окружение, параметры)."""
+from __future__ import annotations
+import os
+import platform
+import subprocess
+import sys
+import time
+
+
+def git_revision() -> str | None:
+    """Текущий коммит и пометка «-dirty» при незакоммиченных изменениях; None вне git."""
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                             check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True,
+                               text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return rev + ("-dirty" if dirty else "")
+
+
+def meta(args: dict) -> dict:
+    return {"git": git_revision(), "time": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": sys.version.split()[0],
+            "platform": platform.platform(), "cpus": os.cpu_count(), "args": args}
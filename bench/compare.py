@@ -0,0 +1,53 @@
+"""
+Сравнение двух JSON-отчётов бенчмарков (bench_micro, bench_load) — например, до и после коммита.
+Строки сопоставляются по name; задержки и RSS — чем меньше, тем лучше, throughput — чем больше.
+Код выхода 1, если какая-то метрика ухудшилась больше порога.
+
+  python -m bench.compare base.json new.json --threshold 0.10
+"""
+from __future__ import annotations
+import argparse
+import json
+import sys
+
+HIGHER_IS_BETTER = {"throughput_rps"}
+METRIC_SUFFIXES = ("_us", "_ms", "_mb", "_rps")
+
+
+def _load(path: str) -> tuple[dict, dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return {r["name"]: r for r in data["results"]}, data.get("meta", {})
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("base")
+    ap.add_argument("new")
+    ap.add_argument("--threshold", type=float, default=0.10, help="допустимое ухудшение (доля)")
+    args = ap.parse_args()
+
+    (base, base_meta), (new, new_meta) = _load(args.base), _load(args.new)
+    print(f"base: {base_meta.get('git')}  new: {new_meta.get('git')}")
+    regressions = 0
+    for name in sorted(base.keys() & new.keys()):
+        print(name)
+        for key, old in base[name].items():
+            val = new[name].get(key)
+            if not key.endswith(METRIC_SUFFIXES) or not isinstance(old, (int, float)) or not isinstance(val, (int, float)):
+                continue
+            change = (val - old) / old if old else 0.0
+            worse = -change if key in HIGHER_IS_BETTER else change
+            flag = ""
+            if worse > args.threshold:
+                flag = "  <-- хуже"
+                regressions += 1
+            print(f"  {key:<16} {old:>12} -> {val:>12}  {change:+.1%}{flag}")
+    for name in sorted(base.keys() ^ new.keys()):
+        print(f"{name}: только в {'base' if name in base else 'new'}")
+    print(f"ухудшений больше {args.threshold:.0%}: {regressions}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
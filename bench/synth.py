@@ -0,0 +1,70 @@
+"""
+Генератор синтетических снапшотов для бенчмарков: число событий расписания, опросов,
+блоков задач и писем во входящих задаётся явно, остальное (биометрия, коммуникации,
+хронотип) — случайно, но воспроизводимо по seed.
+
+  from bench.synth import synthetic_snapshot
+  snap = synthetic_snapshot(0, events=200, surveys=5, tasks=20, inbox=50)
+"""
+from __future__ import annotations
+import random
+from datetime import datetime, timedelta
+
+TYPES = ["meeting", "meeting", "focus", "break", "personal", "deadline", "other"]
+TASK_KINDS = ["focus", "routine", "creative", "comms"]
+_INBOX = [
+    "Привет, нужно срочно подготовить отчёт к пятнице.",
+    "Напоминаю про встречу завтра в 10:00.",
+    "Можешь посмотреть PR до конца дня? Блокирует релиз.",
+    "Коллеги, переносим демо на следующую неделю.",
+    "Счёт за подписку во вложении.",
+    "Есть минутка созвониться по бюджету Q3?",
+    "Дайджест новостей команды за неделю.",
+    "Клиент просит обновлённую оценку сроков, дедлайн сегодня.",
+]
+
+
+def _iso(t: datetime) -> str:
+    return t.isoformat(timespec="minutes")
+
+
+def synthetic_snapshot(i: int, events: int = 8, surveys: int = 2, tasks: int = 3, inbox: int = 5,
+                       seed: int = 1) -> dict:
+    """Снапшот i-го дня (разные user_id и даты у разных i); словарь, пригодный для Snapshot(**d) и /analyze."""
+    rng = random.Random(seed * 1_000_003 + i)
+    day = datetime(2024, 1, 1, 9) + timedelta(days=i % 3650)
+    ws, we = day, day + timedelta(hours=rng.choice([8, 9, 10]), minutes=rng.choice([0, 30]))
+    span = int((we - ws).total_seconds() // 60)
+
+    schedule = []
+    for k in range(events):
+        st = ws + timedelta(minutes=rng.randrange(0, span, 5))
+        schedule.append({"title": f"Событие {k}", "start": _iso(st),
+                         "end": _iso(st + timedelta(minutes=rng.choice([15, 25, 30, 45, 60, 90]))),
+                         "type": rng.choice(TYPES), "importance": rng.choice(["low", "medium", "high"])})
+    survey_list = [{"ts": _iso(ws + timedelta(minutes=rng.randrange(0, span))),
+                    "stress_1_10": rng.randint(1, 10), "mood_1_10": rng.randint(1, 10),
+                    "fatigue_1_10": rng.randint(1, 10), "burnout_1_10": rng.randint(1, 10)}
+                   for _ in range(surveys)]
+    task_list = []
+    for _ in range(tasks):
+        st = ws + timedelta(minutes=rng.randrange(0, span, 5))
+        task_list.append({"start": _iso(st), "end": _iso(st + timedelta(minutes=rng.choice([30, 60, 90]))),
+                          "kind": rng.choice(TASK_KINDS), "context_switches": rng.randint(0, 15),
+                          "distractions_minutes": rng.randint(0, 40)})
+    return {
+        "user_id": f"bench-u{i}", "date": ws.date().isoformat(), "tz": "Europe/Moscow",
+        "day": {"work_start": _iso(ws), "work_end": _iso(we)},
+        "schedule": schedule,
+        "biometrics": {"steps": {"total": rng.randint(1000, 15000)},
+                       "sleep": {"duration_hours": round(rng.uniform(4.5, 9.0), 1),
+                                 "quality": rng.choice(["poor", "fair", "good"])},
+                       "heart": {"avg_bpm": rng.randint(55, 100), "hrv_ms": rng.randint(20, 90)}},
+        "surveys": survey_list,
+        "tasks": task_list,
+        "comms": {"calls_count": rng.randint(0, 10), "calls_minutes": rng.randint(0, 240),
+                  "chat_msgs_count": rng.randint(0, 300), "email_threads": rng.randint(0, 50)},
+        "rec_history": {"accepted": rng.randint(0, 5), "ignored": rng.randint(0, 5), "snoozed": rng.randint(0, 3)},
+        "persona": {"chronotype": rng.choice(["lark", "owl", "neutral"])},
+        "inbox_samples": [rng.choice(_INBOX) for _ in range(inbox)],
+    }
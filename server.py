@@ -1,12 +1,32 @@
 from __future__ import annotations
 
-from typing import Any, Dict
+from typing import Any, AsyncIterator, Dict
+from contextlib import asynccontextmanager
 
 import asyncio
-from fastapi import FastAPI
-from pydantic import BaseModel
+import json
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, model_validator
 
 from agents import Snapshot, Output, analyze_async, analyze_text_async
+from agents.orchestrator import BATCH_CONCURRENCY, coalesce_stats
+from agents.streaming import analyze_stream
+from agents.http_pool import open_http_client, close_http_client, pool_stats
+from agents.rag import get_corpus, index_stats
+from agents.llm_cache import cache_stats
+from agents.llm_gateway import gateway_stats
+from agents.llm_router import router_stats
+from agents.llm_replay import replay_stats
+from agents.store import store_stats
+from agents.utils import env_int
+from agents.jobs import JOB_WORKERS, JobRunner, QueueFull, check_webhook_url, make_job_queue
+
+
+# Ограничения /analyze-batch: максимум снапшотов в одном запросе
+# (одновременно анализируется не больше AGENT_BATCH_CONCURRENCY).
+BATCH_MAX_ITEMS = env_int("AGENT_BATCH_MAX_ITEMS", 1000)
 
 
 class TextRequest(BaseModel):
@@ -15,18 +35,158 @@ class TextRequest(BaseModel):
     tz: str | None = None
 
 
-app = FastAPI(title="Personal Load Agent", version="1.0.0")
+class JobRequest(BaseModel):
+    """Фоновый анализ: либо snapshot, либо text (с user_id/tz, как в /analyze-text)."""
+    snapshot: Snapshot | None = None
+    text: str | None = None
+    user_id: str = "user"
+    tz: str | None = None
+    webhook_url: str | None = None
+
+    @model_validator(mode="after")
+    def _one_input(self) -> "JobRequest":
+        if (self.snapshot is None) == (self.text is None):
+            raise ValueError("Нужно ровно одно из полей: snapshot или text")
+        if self.webhook_url:
+            check_webhook_url(self.webhook_url)
+        return self
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Один пул соединений к LLM на весь процесс
+    app.state.http = await open_http_client()
+    # Корпус RAG индексируется один раз при старте, дальше — горячая перезагрузка в фоновом потоке
+    corpus = get_corpus()
+    corpus.start_reloader()
+    # Воркеры фоновых анализов (/jobs)
+    app.state.jobs = JobRunner(make_job_queue(), JOB_WORKERS, http=app.state.http)
+    app.state.jobs.start()
+    try:
+        yield
+    finally:
+        await app.state.jobs.stop()
+        corpus.stop_reloader()
+        await close_http_client()
+
+
+app = FastAPI(title="Personal Load Agent", version="1.0.0", lifespan=lifespan)
 
 
 @app.post("/analyze", response_model=Output)
-async def analyze_endpoint(snapshot: Snapshot) -> Output:
+async def analyze_endpoint(snapshot: Snapshot, request: Request) -> Output:
     data: Dict[str, Any] = snapshot.model_dump()
-    return await analyze_async(data)
+    return await analyze_async(data, http=request.app.state.http)
+
+
+@app.post("/analyze/stream")
+async def analyze_stream_endpoint(snapshot: Snapshot, request: Request) -> StreamingResponse:
+    """
+    Анализ с отдачей частей Output по мере готовности (SSE): событие на каждое поле
+    (event: risk, plan, ..., coach_message), фрагменты ответа коуча — event: coach_message.delta
+    ({"delta": "..."}), в конце — event: done; при ошибке — event: error.
+    """
+    events: "asyncio.Queue[tuple[str, Any]]" = asyncio.Queue()
+
+    async def run() -> None:
+        try:
+            await analyze_async(snapshot.model_dump(), http=request.app.state.http,
+                                on_event=lambda name, value: events.put_nowait((name, value)))
+            events.put_nowait(("done", {}))
+        except Exception as e:
+            events.put_nowait(("error", {"error": f"{type(e).__name__}: {e}"}))
+
+    async def body() -> AsyncIterator[str]:
+        task = asyncio.ensure_future(run())
+        try:
+            while True:
+                name, value = await events.get()
+                data = {"delta": value} if name == "coach_message.delta" else jsonable_encoder(value)
+                yield f"event: {name}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+                if name in ("done", "error"):
+                    return
+        finally:
+            # клиент отключился — анализ больше не нужен
+            task.cancel()
+
+    return StreamingResponse(body(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 
 @app.post("/analyze-text", response_model=Output)
-async def analyze_text_endpoint(req: TextRequest) -> Output:
-    return await analyze_text_async(text=req.text, user_id=req.user_id, tz=req.tz)
+async def analyze_text_endpoint(req: TextRequest, request: Request) -> Output:
+    return await analyze_text_async(text=req.text, user_id=req.user_id, tz=req.tz, http=request.app.state.http)
+
+
+def _batch_items(raw: bytes, ctype: str) -> list[Any]:
+    """Элементы батча: строки NDJSON (разбираются уже при анализе) или JSON-массив/{"snapshots": [...]}."""
+    if "ndjson" in ctype or "jsonl" in ctype:
+        return [line for line in raw.split(b"\n") if line.strip()]
+    try:
+        data = json.loads(raw)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Невалидный JSON: {e}")
+    if isinstance(data, dict) and isinstance(data.get("snapshots"), list):
+        data = data["snapshots"]
+    if not isinstance(data, list):
+        raise HTTPException(status_code=400, detail="Ожидался массив снапшотов или NDJSON")
+    return data
+
+
+@app.post("/analyze-batch")
+async def analyze_batch_endpoint(request: Request, concurrency: int | None = None) -> StreamingResponse:
+    """
+    Батч снапшотов: JSON-массив (или {"snapshots": [...]}) либо NDJSON (Content-Type: application/x-ndjson).
+    Снапшоты анализируются конкурентно, результаты отдаются потоком в порядке готовности:
+    NDJSON-строки {"index": i, "result": {...}} или {"index": i, "error": "..."};
+    при Accept: text/event-stream — те же объекты как SSE-события.
+    """
+    # Тело читаем до начала ответа: StreamingResponse сам слушает receive() ради disconnect
+    items = _batch_items(await request.body(), request.headers.get("content-type", ""))
+    if len(items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Не больше {BATCH_MAX_ITEMS} снапшотов в запросе")
+    limit = min(max(1, concurrency or BATCH_CONCURRENCY), BATCH_CONCURRENCY)
+    sse = "text/event-stream" in request.headers.get("accept", "")
+
+    def frame(obj: Dict[str, Any]) -> str:
+        line = json.dumps(obj, ensure_ascii=False)
+        return f"data: {line}\n\n" if sse else line + "\n"
+
+    async def body() -> AsyncIterator[str]:
+        async for idx, res in analyze_stream(items, concurrency=limit, ordered=False, http=request.app.state.http):
+            yield frame({"index": idx, "error": res["error"]} if "error" in res else {"index": idx, "result": res})
+
+    return StreamingResponse(body(), media_type="text/event-stream" if sse else "application/x-ndjson")
+
+
+@app.post("/jobs", status_code=202)
+async def submit_job_endpoint(req: JobRequest, request: Request) -> Dict[str, Any]:
+    """Ставит анализ в очередь и сразу возвращает id; результат — GET /jobs/{id} или webhook_url."""
+    if req.snapshot is not None:
+        kind, payload = "snapshot", req.snapshot.model_dump()
+    else:
+        kind, payload = "text", {"text": req.text, "user_id": req.user_id, "tz": req.tz}
+    try:
+        job = await request.app.state.jobs.submit(kind, payload, webhook_url=req.webhook_url)
+    except QueueFull:
+        raise HTTPException(status_code=503, detail="Очередь задач заполнена", headers={"Retry-After": "30"})
+    return {"id": job.id, "status": job.status, "status_url": f"/jobs/{job.id}"}
+
+
+@app.get("/jobs/{job_id}")
+async def get_job_endpoint(job_id: str, request: Request) -> Dict[str, Any]:
+    job = await request.app.state.jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Задача не найдена")
+    return job.public()
+
+
+@app.get("/metrics")
+async def metrics_endpoint(request: Request) -> Dict[str, Any]:
+    jobs = await request.app.state.jobs.stats()
+    return {"http_pool": pool_stats(), "rag_index": index_stats(), "llm_cache": cache_stats(),
+            "llm_gateway": gateway_stats(), "llm_router": router_stats(), "analysis_store": store_stats(),
+            "coalescing": coalesce_stats(), "jobs": jobs, "llm_replay": replay_stats()}
 
 
 def run() -> None:
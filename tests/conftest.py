@@ -0,0 +1,91 @@
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def snapshot():
+    """Фабрика небольшого снапшота дня; разные i — разные user_id (анализы не объединяются)."""
+    def make(i: int = 0) -> dict:
+        return {
+            "user_id": f"test-u{i}", "date": "2024-03-05", "tz": "Europe/Moscow",
+            "day": {"work_start": "2024-03-05T09:00", "work_end": "2024-03-05T18:00"},
+            "schedule": [
+                {"title": "Стендап", "start": "2024-03-05T10:00", "end": "2024-03-05T10:30", "type": "meeting"},
+                {"title": "Ревью", "start": "2024-03-05T13:00", "end": "2024-03-05T14:30", "type": "meeting"},
+            ],
+            "surveys": [{"ts": "2024-03-05T12:00", "stress_1_10": 7, "mood_1_10": 4, "fatigue_1_10": 6}],
+            "inbox_samples": ["Можешь посмотреть PR до конца дня? Блокирует релиз."],
+        }
+    return make
+
+
+class FakeLLM:
+    """
+    Состояние поддельного эндпоинта: delays — задержка ответа по подстроке промпта,
+    once — задержка применяется только к первому подходящему запросу; prompts — полученные промпты.
+    """
+    def __init__(self) -> None:
+        self.delays = {}
+        self.once = False
+        self.content = "- ответ модели"
+        self.prompts = []
+        self._lock = threading.Lock()
+
+    def delay_for(self, prompt: str) -> float:
+        with self._lock:
+            self.prompts.append(prompt)
+            for marker, delay in list(self.delays.items()):
+                if marker in prompt:
+                    if self.once:
+                        del self.delays[marker]
+                    return delay
+        return 0.0
+
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    """
+    Локальный OpenAI-совместимый эндпоинт (/v1/chat/completions) в отдельном потоке; OPENROUTER_BASE_URL
+    указывает на него, кэш LLM и хранилище анализов отключены.
+    """
+    from agents import hf_client, orchestrator
+
+    fake = FakeLLM()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["content-length"])))
+            time.sleep(fake.delay_for("\n".join(m["content"] for m in body["messages"])))
+            data = json.dumps({"choices": [{"message": {"content": fake.content}}]}).encode()
+            try:
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+            except (BrokenPipeError, ConnectionResetError):
+                # клиент ушёл по таймауту стадии
+                pass
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setenv("OPENROUTER_BASE_URL", f"http://127.0.0.1:{server.server_address[1]}/v1")
+    monkeypatch.setenv("OPENROUTER_API_KEY", "test")
+    monkeypatch.setattr(hf_client, "get_llm_cache", lambda: None)
+    monkeypatch.setattr(orchestrator, "get_analysis_store", lambda: None)
+    yield fake
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,114 @@
+"""
+compute_features (колоночный таймлайн и векторный расчёт признаков расписания) совпадает с исходной
+поэлементной реализацией на datetime на случайных днях: перекрытия, нулевая и отрицательная длина,
+одинаковые начала, события вне рабочего дня, секунды внутри минуты, разные смещения таймзоны.
+"""
+import random
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+from dateutil import parser as dtp
+
+from agents.features import compute_features
+from agents.models import Features, Snapshot
+
+
+def _to_dt(x: str) -> datetime:
+    return dtp.isoparse(x)
+
+
+def _minutes(td: timedelta) -> int:
+    return int(td.total_seconds() // 60)
+
+
+def baseline_compute_features(s: Snapshot) -> Features:
+    """Исходная реализация compute_features (до колоночного таймлайна), без изменений."""
+    ws, we = _to_dt(s.day.work_start), _to_dt(s.day.work_end)
+    work_minutes = _minutes(we - ws)
+
+    meetings = [(_to_dt(it.start), _to_dt(it.end)) for it in s.schedule if it.type == "meeting"]
+    meetings.sort()
+    back_to_back = sum(1 for i in range(1, len(meetings)) if _minutes(meetings[i][0] - meetings[i-1][1]) < 5)
+
+    meeting_minutes = sum(_minutes(e - st) for st, e in meetings)
+    meetings_count = len(meetings)
+    deepwork_minutes = sum(_minutes(_to_dt(it.end) - _to_dt(it.start)) for it in s.schedule if it.type == "focus")
+    break_minutes = sum(_minutes(_to_dt(it.end) - _to_dt(it.start)) for it in s.schedule if it.type == "break")
+
+    longest_stretch = 0
+    last_break_end = ws
+    for it in sorted([it for it in s.schedule if it.type == "break"], key=lambda x: _to_dt(x.start)):
+        st, en = _to_dt(it.start), _to_dt(it.end)
+        longest_stretch = max(longest_stretch, _minutes(st - last_break_end))
+        last_break_end = en
+    longest_stretch = max(longest_stretch, _minutes(we - last_break_end))
+
+    context_switches = sum(t.context_switches or 0 for t in s.tasks)
+    distractions_minutes = sum(t.distractions_minutes or 0 for t in s.tasks)
+
+    steps_total = s.biometrics.steps.get("total") if (s.biometrics and s.biometrics.steps) else None
+    sleep_h = s.biometrics.sleep.get("duration_hours") if (s.biometrics and s.biometrics.sleep) else None
+    sleep_q_map = {"poor": 0.25, "ok": 0.5, "good": 0.75, "great": 1.0}
+    sleep_quality_score = sleep_q_map.get(s.biometrics.sleep.get("quality"), None) if (s.biometrics and s.biometrics.sleep) else None
+    avg_hr = s.biometrics.heart.get("avg_bpm") if (s.biometrics and s.biometrics.heart) else None
+    hrv_ms = s.biometrics.heart.get("hrv_ms") if (s.biometrics and s.biometrics.heart) else None
+
+    if s.surveys:
+        def mean_or_none(vals):
+            vals = [v for v in vals if v is not None]
+            return float(np.nanmean(vals)) if vals else None
+        stress_self = mean_or_none([x.stress_1_10 for x in s.surveys])
+        fatigue_self = mean_or_none([x.fatigue_1_10 for x in s.surveys])
+        satisfaction_self = mean_or_none([x.satisfaction_1_10 for x in s.surveys])
+        burnout_self = mean_or_none([x.burnout_1_10 for x in s.surveys])
+    else:
+        stress_self = fatigue_self = satisfaction_self = burnout_self = None
+
+    calls_minutes = s.comms.calls_minutes if s.comms else 0
+    chats_count = s.comms.chat_msgs_count if s.comms else 0
+    meet_ratio = meeting_minutes / max(1, work_minutes)
+
+    return Features(
+        work_minutes=work_minutes, meeting_minutes=meeting_minutes, meetings_count=meetings_count,
+        deepwork_minutes=deepwork_minutes, break_minutes=break_minutes, back_to_back_count=back_to_back,
+        longest_stretch_no_break_min=longest_stretch, context_switches=context_switches,
+        distractions_minutes=distractions_minutes, steps=steps_total, sleep_h=sleep_h,
+        sleep_quality_score=sleep_quality_score, avg_hr=avg_hr, hrv_ms=hrv_ms,
+        stress_self=stress_self, fatigue_self=fatigue_self, satisfaction_self=satisfaction_self, burnout_self=burnout_self,
+        calls_minutes=calls_minutes, chats_count=chats_count, meet_ratio=meet_ratio
+    )
+
+
+TYPES = ["meeting", "focus", "break", "personal", "deadline", "other"]
+
+
+def _random_snapshot(rng: random.Random, n: int) -> dict:
+    # день целиком либо naive, либо с таймзонами (исходная реализация не сравнивает naive и aware)
+    naive = rng.random() < 0.3
+    tz = lambda: timezone(timedelta(hours=rng.choice([0, 3, -5]), minutes=rng.choice([0, 0, 30])))
+    iso = lambda dt: dt.replace(tzinfo=None).isoformat() if naive else dt.isoformat()
+    ws = datetime(2024, 3, 5, rng.randint(6, 11), rng.choice([0, 30]), tzinfo=tz())
+    we = ws + timedelta(minutes=rng.randint(0, 14 * 60), seconds=rng.choice([0, 0, 59]))
+    schedule = []
+    for k in range(n):
+        # грубая сетка даёт одинаковые начала, секунды — нецелые минуты
+        st = ws + timedelta(minutes=rng.randrange(-60, 15 * 60, 15), seconds=rng.choice([0, 0, 0, 1, 59]))
+        dur = timedelta(seconds=rng.choice([0, rng.randint(-600, 3 * 3600), rng.randint(0, 3 * 3600)]))
+        st = st if naive else st.astimezone(tz())
+        en = st + dur if naive else (st + dur).astimezone(tz())
+        schedule.append({"title": f"e{k}", "start": iso(st), "end": iso(en),
+                         "type": rng.choice(TYPES)})
+    return {"user_id": "u", "date": "2024-03-05",
+            "day": {"work_start": iso(ws), "work_end": iso(we)},
+            "schedule": schedule,
+            "tasks": [{"start": iso(ws), "end": iso(we), "kind": "focus", "context_switches": rng.randint(0, 9)}],
+            "surveys": [{"ts": iso(ws), "stress_1_10": rng.randint(1, 10)}]}
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_matches_datetime_implementation(seed):
+    rng = random.Random(seed)
+    for _ in range(25):
+        raw = _random_snapshot(rng, rng.choice([0, 1, 2, 5, 20, 60]))
+        assert compute_features(Snapshot(**raw)) == baseline_compute_features(Snapshot(**raw)), raw
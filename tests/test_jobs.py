@@ -0,0 +1,64 @@
+"""Вебхуки фоновых задач: внутренние адреса отклоняются, POST идёт на проверенный IP с исходным Host."""
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from agents import jobs
+from agents.jobs import Job, JobRunner, MemoryJobQueue, check_webhook_url
+
+
+@pytest.mark.parametrize("url", [
+    "http://localhost/h", "http://127.0.0.1/h", "http://10.0.0.5/h", "http://169.254.169.254/latest",
+    "http://100.64.0.1/h", "http://100.127.255.254/h", "http://[::ffff:100.64.0.1]/h", "http://240.0.0.1/h",
+    "http://[fd00::1]/h", "ftp://hooks.example/h",
+])
+def test_internal_webhook_rejected(url):
+    with pytest.raises(ValueError):
+        check_webhook_url(url)
+
+
+@pytest.mark.parametrize("url", ["https://hooks.example/h", "http://100.128.0.1/h", "http://8.8.8.8:8080/h"])
+def test_public_webhook_accepted(url):
+    check_webhook_url(url)
+
+
+def test_webhook_connects_to_checked_ip(monkeypatch):
+    seen = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers["content-length"]))
+            seen.append((self.path, self.headers["Host"]))
+            self.send_response(204)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+
+    async def checked(url):
+        return "127.0.0.1"
+
+    # имя не резолвится: запрос дойдёт, только если httpx соединяется с адресом из проверки, а не резолвит заново
+    monkeypatch.setattr(jobs, "resolve_webhook", checked)
+    url = f"http://hooks.invalid:{port}/cb?x=1"
+
+    async def main():
+        runner = JobRunner(MemoryJobQueue(keep=10), workers=1)
+        runner.start()
+        try:
+            return await runner._notify(Job(kind="text", payload={}, webhook_url=url))
+        finally:
+            await runner.stop()
+
+    try:
+        assert asyncio.run(main()) == "204"
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert seen == [("/cb?x=1", f"hooks.invalid:{port}")]
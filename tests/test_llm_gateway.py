@@ -0,0 +1,62 @@
+"""Отмена вызова, не дошедшего до провайдера (ждал слота шлюза), не считается неудачей модели."""
+import asyncio
+
+import pytest
+
+from agents import llm_gateway
+from agents.llm_gateway import LLMGateway
+
+
+class _Ok:
+    status_code = 200
+    headers: dict = {}
+
+
+def _sender(delay: float, calls: list):
+    async def send():
+        calls.append(delay)
+        await asyncio.sleep(delay)
+        return _Ok()
+    return send
+
+
+def test_cancel_while_queued_is_not_a_failure(monkeypatch):
+    monkeypatch.setattr(llm_gateway, "MAX_CONCURRENCY", 1)
+    gw = LLMGateway()
+    calls: list = []
+
+    async def one():
+        try:
+            await asyncio.wait_for(gw._call("m", _sender(0.2, calls)), 0.5)
+        except asyncio.TimeoutError:
+            pass
+
+    async def main():
+        await asyncio.gather(*(one() for _ in range(10)))
+
+    asyncio.run(main())
+    st = gw.stats()
+    # до провайдера дошли только запросы, получившие слот; остальные сняты в очереди
+    assert st["requests"] == len(calls) < 10
+    assert st["cancelled_unsent"] == 10 - len(calls)
+    assert st["failures"] <= 1
+    assert st["models"]["m"]["breaker"] == "closed"
+
+
+def test_cancelled_queued_probe_is_released(monkeypatch):
+    monkeypatch.setattr(llm_gateway, "MAX_CONCURRENCY", 1)
+    gw = LLMGateway()
+    breaker = gw.breaker("m")
+    breaker.state, breaker.opened_at = "open", 0.0  # cooldown истёк: следующий вызов — пробный
+
+    async def main():
+        # слот занят другим вызовом, пробный ждёт его и снимается по таймауту
+        busy = asyncio.ensure_future(gw._call("other", _sender(0.3, [])))
+        await asyncio.sleep(0.01)
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(gw._call("m", _sender(0.01, [])), 0.1)
+        await busy
+        assert breaker.state == "half_open" and breaker.allow()
+
+    asyncio.run(main())
+    assert gw.stats()["failures"] == 0
@@ -0,0 +1,50 @@
+"""Медленный вызов модели в RAG не блокирует event loop: другие анализы в том же цикле завершаются раньше."""
+import asyncio
+import time
+
+import httpx
+
+from agents import orchestrator
+from agents.features import compute_features
+from agents.hf_client import HFClient
+from agents.models import Snapshot
+from agents.rag import RAGAssistant
+from agents.risk import compute_risk
+
+RAG_MARKER = "контекст с идеями"
+SLOW = 1.5
+
+
+def test_slow_rag_does_not_block_other_requests(fake_llm, snapshot):
+    # медленный только первый запрос RAG; RAG-стадия второго анализа отвечает сразу
+    fake_llm.delays[RAG_MARKER] = SLOW
+    fake_llm.once = True
+    snap = Snapshot(**snapshot(10))
+    f = compute_features(snap)
+    risk = compute_risk(f, snap.rec_history)
+    finished = []
+
+    async def main():
+        async with httpx.AsyncClient() as http:
+            rag = RAGAssistant(hf=HFClient(http=http))
+
+            async def slow_rag():
+                advice = await rag.build_advice_async(snap, f, risk)
+                finished.append(("rag", time.perf_counter() - t0))
+                return advice
+
+            async def other():
+                # ждём, пока медленный запрос RAG уйдёт к модели
+                while not any(RAG_MARKER in p for p in fake_llm.prompts):
+                    await asyncio.sleep(0.01)
+                await orchestrator.analyze_async(snapshot(11), http=http, fused=False)
+                finished.append(("analyze", time.perf_counter() - t0))
+
+            t0 = time.perf_counter()
+            advice, _ = await asyncio.gather(slow_rag(), other())
+            return advice
+
+    advice = asyncio.run(main())
+    assert [name for name, _ in finished] == ["analyze", "rag"]
+    assert finished[0][1] < SLOW - 0.5 <= finished[1][1]
+    assert advice.suggestions == ["ответ модели"]
@@ -0,0 +1,136 @@
+"""
+Ретрив через InvertedIndex возвращает те же чанки в том же порядке, что исходный линейный проход
+по чанкам с _cosine_sim: на встроенном корпусе, на базе знаний из файлов (в памяти и через mmap)
+и на синтетических корпусах с большим числом равных скоров.
+"""
+import os
+import random
+from collections import Counter
+
+import pytest
+
+from agents.rag import RAGAssistant, _Corpus, _tokenize
+from agents.rag_index import InvertedIndex
+
+
+def _baseline_cosine_sim(a: Counter, b: Counter) -> float:
+    if not a or not b:
+        return 0.0
+    common = set(a.keys()) & set(b.keys())
+    num = sum(a[t] * b[t] for t in common)
+    if num == 0:
+        return 0.0
+    sa = sum(v * v for v in a.values()) ** 0.5
+    sb = sum(v * v for v in b.values()) ** 0.5
+    if sa == 0 or sb == 0:
+        return 0.0
+    return num / (sa * sb)
+
+
+def baseline_top_k(docs: list, q: Counter, k: int) -> list:
+    """Исходный RAGAssistant.retrieve: скор каждого чанка, стабильная сортировка по убыванию, срез."""
+    scored = []
+    for i, d in enumerate(docs):
+        score = _baseline_cosine_sim(q, d)
+        if score > 0:
+            scored.append((score, i))
+    scored.sort(key=lambda x: x[0], reverse=True)
+    return [i for _, i in scored[:k]]
+
+
+def baseline_load(base_dir: str) -> list:
+    """Исходная загрузка корпуса: файлы .md/.txt каталога knowledge в порядке listdir, блоки по пустой строке."""
+    kb_dir = os.path.join(base_dir, "knowledge")
+    chunks = []
+    for name in os.listdir(kb_dir):
+        if name.endswith(".md") or name.endswith(".txt"):
+            with open(os.path.join(kb_dir, name), "r", encoding="utf-8") as f:
+                content = f.read()
+            for block in content.split("\n\n"):
+                block_clean = block.strip()
+                if block_clean and _tokenize(block_clean):
+                    chunks.append(((name, block_clean), Counter(_tokenize(block_clean))))
+    return chunks
+
+
+QUERIES = [
+    "", "квантовая хромодинамика",
+    "Рабочее время: 9ч 0мин. Встречи: 120мин (22% дня). Фокус-время: 0мин. Перерывы: 0мин. "
+    "Риск выгорания (оценка): 61. Самочувствие: стресс 7/10, усталость 6/10",
+    "короткая прогулка между блоками концентрации", "перерыв перерыв перерыв без экрана",
+    "окно без уведомлений для глубокой работы", "сон шаги вода чай",
+]
+
+BLOCKS = [
+    "Короткая прогулка 10–15 минут между блоками концентрации.",
+    "Осознанный перерыв без экрана: чай, вода, несколько глубоких вдохов.",
+    "Выделить «окно без уведомлений» для глубокой работы.",
+    "Перерыв. Перерыв! Прогулка.",
+    "Сон не меньше семи часов, шаги в течение дня.",
+    "чай вода",
+    "Вода, чай.",  # те же токены, что у предыдущего блока — равный скор
+]
+
+
+def _write_knowledge(base_dir, seed: int) -> None:
+    rng = random.Random(seed)
+    kb = base_dir / "knowledge"
+    kb.mkdir()
+    for f in range(4):
+        blocks = [rng.choice(BLOCKS) for _ in range(rng.randint(1, 12))]
+        (kb / f"notes{f}.md").write_text("\n\n".join(blocks) + "\n\n\n", encoding="utf-8")
+    (kb / "skip.json").write_text("перерыв", encoding="utf-8")
+
+
+def _assert_same_retrieve(rag: RAGAssistant, chunks: list) -> None:
+    keys = [key for key, _ in chunks]
+    for q in QUERIES:
+        for k in (1, 3, 6, 100):
+            expected = [keys[i] for i in baseline_top_k([c for _, c in chunks], Counter(_tokenize(q)), k)]
+            assert [(ch.source, ch.text) for ch in rag.retrieve(q, top_k=k)] == expected, (q, k)
+
+
+def test_builtin_corpus(tmp_path):
+    from agents.rag import _BUILTIN_TEXT
+
+    rag = RAGAssistant(base_dir=str(tmp_path))
+    _assert_same_retrieve(rag, [(("builtin", _BUILTIN_TEXT), Counter(_tokenize(_BUILTIN_TEXT)))])
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_knowledge_files_in_memory_and_mmap(tmp_path, seed):
+    _write_knowledge(tmp_path, seed)
+    chunks = baseline_load(str(tmp_path))
+    rag = RAGAssistant(base_dir=str(tmp_path))
+    assert rag.corpus.stats["mode"] == "memory"
+    _assert_same_retrieve(rag, chunks)
+
+    rag.corpus.write()
+    mapped = _Corpus(str(tmp_path))
+    assert mapped.stats["mode"] == "mmap"
+    rag.corpus = mapped
+    _assert_same_retrieve(rag, chunks)
+
+
+def _synthetic(rng: random.Random, n_docs: int, vocab: int) -> list:
+    docs = [Counter(f"w{rng.randrange(vocab)}" for _ in range(rng.randint(1, 8))) for _ in range(n_docs)]
+    # дубликаты чанков и чанки-перестановки дают равные скоры на разных позициях
+    for _ in range(n_docs // 4):
+        docs.insert(rng.randrange(len(docs) + 1), Counter(rng.choice(docs)))
+    return docs
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_synthetic_corpora_with_ties(seed):
+    rng = random.Random(seed)
+    vocab = rng.choice([3, 10, 50])  # маленький словарь — много равных скоров
+    docs = _synthetic(rng, rng.choice([1, 5, 40, 300]), vocab)
+    index = InvertedIndex.build(docs)
+    halves = InvertedIndex.concat([InvertedIndex.build(docs[: len(docs) // 2]),
+                                   InvertedIndex.build(docs[len(docs) // 2:])])
+    for _ in range(30):
+        q = Counter(f"w{rng.randrange(vocab + 2)}" for _ in range(rng.randint(0, 5)))
+        for k in (0, 1, 2, 5, 10, len(docs) + 1):
+            expected = baseline_top_k(docs, q, k)
+            assert index.top_k(q, k).tolist() == expected, (q, k)
+            assert halves.top_k(q, k).tolist() == expected, (q, k)
@@ -0,0 +1,79 @@
+"""
+LLM-стадии анализа идут конкурентно: против локального поддельного эндпоинта (через общий пул
+соединений, шлюз и post_chat) время ответа — около самой медленной стадии, а не сумма.
+"""
+import time
+
+import pytest
+
+from agents import orchestrator, stages
+from agents.analytics import efficiency_fallback, fatigue_fallback
+from agents.coach import rule_based_coach
+from agents.features import compute_features
+from agents.models import Snapshot
+
+# подстрока промпта каждой стадии -> задержка ответа (секунды): сумма 2.0, самая медленная 0.6
+MARKERS = {"comm_triage": "Сделай краткую выжимку", "efficiency": "эксперт по продуктивности",
+           "fatigue_load": "специалист по здоровью", "rag_advice": "контекст с идеями",
+           "coach": "Сформируй краткий бриф"}
+DELAYS = {"comm_triage": 0.2, "efficiency": 0.4, "fatigue_load": 0.3, "rag_advice": 0.5, "coach": 0.6}
+
+
+@pytest.fixture
+def slow_llm(fake_llm):
+    def set_delays(**delays):
+        fake_llm.delays.update({MARKERS[name]: d for name, d in {**DELAYS, **delays}.items()})
+        return fake_llm
+    return set_delays
+
+
+def _timed_analyze(snapshot: dict):
+    async def main():
+        t = time.perf_counter()
+        # http=None: вызовы идут через общий пул соединений процесса (http_pool)
+        out = await orchestrator.analyze_async(snapshot, fused=False)
+        return out, time.perf_counter() - t
+    # _run закрывает пул вместе с циклом
+    return orchestrator._run(main())
+
+
+def _answered(fake, name: str) -> bool:
+    return any(MARKERS[name] in p for p in fake.prompts)
+
+
+def test_latency_is_max_not_sum(slow_llm, snapshot):
+    fake = slow_llm()
+    out, elapsed = _timed_analyze(snapshot(1))
+    slowest, total = max(DELAYS.values()), sum(DELAYS.values())
+    assert all(_answered(fake, name) for name in MARKERS)
+    assert slowest <= elapsed < slowest + 0.4 < total
+    # ответы модели, а не fallback
+    assert out.efficiency_recommendations != efficiency_fallback()
+    assert out.rag_advice.suggestions == ["ответ модели"]
+    assert out.comm_triage.inbox_summary == "- ответ модели"
+    assert out.coach_message == "- ответ модели"
+
+
+def test_timed_out_stages_use_fallbacks(slow_llm, snapshot, monkeypatch):
+    monkeypatch.setattr(stages, "STAGE_TIMEOUT", 0.3)
+    slow_llm(coach=3.0, efficiency=3.0, fatigue_load=3.0, rag_advice=0.1)
+    out, elapsed = _timed_analyze(snapshot(2))
+    # ждём только таймаут, а не медленные ответы
+    assert elapsed < 1.0
+    assert out.efficiency_recommendations == efficiency_fallback()
+    assert out.fatigue_load == fatigue_fallback()
+    assert out.coach_message == rule_based_coach(out.risk, compute_features(Snapshot(**snapshot(2))))
+    # успевшие стадии — ответы модели
+    assert out.comm_triage.inbox_summary == "- ответ модели"
+    assert out.rag_advice.suggestions == ["ответ модели"]
+
+
+def test_total_deadline_caps_all_stages(slow_llm, snapshot, monkeypatch):
+    monkeypatch.setattr(orchestrator, "TOTAL_DEADLINE", 0.35)
+    slow_llm()
+    out, elapsed = _timed_analyze(snapshot(3))
+    assert elapsed < 0.35 + 0.4
+    assert out.comm_triage.inbox_summary == "- ответ модели"
+    assert out.efficiency_recommendations == efficiency_fallback()
+    assert out.rag_advice.suggestions != ["ответ модели"]
+    assert out.coach_message != "- ответ модели"